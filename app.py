@@ -1,11 +1,17 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import requests
 import time
 from datetime import datetime, timedelta
-from scipy.signal import argrelextrema
+import fetch_cache
+import resample
+import indicators
+import universe
+import snapshot
+import waves
+import swings
+import backtest
+import signal_rules
 
 # --- 網頁設定 ---
 st.set_page_config(page_title="Miniko AI 戰略指揮室", page_icon="⚡", layout="wide")
@@ -38,53 +44,53 @@ with st.sidebar:
     st.header("🔍 個股戰情室")
     stock_input = st.text_input("輸入代號 (如 2330)", value="2330")
     run_btn = st.button("🚀 啟動全維度分析", type="primary")
+    force_live = st.checkbox("⚡ 強制即時抓取 (不使用盤後快照)", value=False)
     st.info("💡 V25.7 更新：修復圖表顯示、優化除息填息演算法。")
 
 # --- 1. 資料獲取 ---
-@st.cache_data(ttl=3600)
 def get_stock_name(symbol):
-    try:
-        url = "https://histock.tw/stock/rank.aspx?p=all"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        r = requests.get(url, headers=headers, timeout=5)
-        dfs = pd.read_html(r.text)
-        df = dfs[0]
-        col_code = [c for c in df.columns if '代號' in str(c)][0]
-        col_name = [c for c in df.columns if '股票' in str(c) or '名稱' in str(c)][0]
-        name_map = {}
-        for index, row in df.iterrows():
-            code = ''.join([c for c in str(row[col_code]) if c.isdigit()])
-            name = str(row[col_name])
-            if len(code) == 4: name_map[code] = name
-        return name_map.get(symbol.replace('.TW', ''), symbol)
-    except: return symbol
+    # 全站共用的代號 → 名稱對照表 (只解析一次，常駐記憶體)
+    return universe.name_of(symbol)
 
 def get_data(symbol):
-    clean_symbol = symbol.replace('.TW', '').replace('.TWO', '')
-    suffixes = ['.TW', '.TWO'] 
-    for suffix in suffixes:
-        ticker_symbol = clean_symbol + suffix
-        ticker = yf.Ticker(ticker_symbol)
-        try:
-            df_d = ticker.history(period="2y")
-            if df_d.empty:
-                df_d = ticker.history(period="max")
-            if not df_d.empty:
-                try:
-                    df_60m = ticker.history(period="1mo", interval="60m")
-                    df_30m = ticker.history(period="1mo", interval="30m")
-                except:
-                    df_60m, df_30m = None, None
-                return df_d, df_60m, df_30m, ticker 
-        except:
-            continue
-    return None, None, None, None
+    clean_symbol = universe.clean_code(symbol)
+    try:
+        # 依交易所索引決定 .TW / .TWO，已知的股票只發一次請求
+        df_d, suffix = universe.resolve_fetch(
+            clean_symbol, lambda s: fetch_cache.get_bars(s, period="2y"))
+        if df_d is None:
+            df_d, suffix = universe.resolve_fetch(
+                clean_symbol, lambda s: fetch_cache.get_bars(s, period="max"))
+        if df_d is None: return None, None, None, None
+    except:
+        return None, None, None, None
+    ticker_symbol = clean_symbol + suffix
+    try:
+        # 只下載 30 分 K，60 分 K 由它重取樣；日 K 缺的最新交易日也用它補
+        df_30m = fetch_cache.get_bars(ticker_symbol, period="1mo", interval="30m")
+        df_60m = fetch_cache.get_bars(ticker_symbol, period="1mo", interval="60m")
+        df_d = resample.patch_daily(df_d, df_30m)
+    except:
+        df_60m, df_30m = None, None
+    return df_d, df_60m, df_30m, ticker_symbol
+
+def load_snapshot(symbol):
+    """盤後快照 (非盤中且快照為最新收盤日才用)：回傳 (近期日K+指標, 摘要列)，否則 None"""
+    snapshot.sync()   # 本機快照過時就先從 GitHub Release 換上雲端機器人建好的
+    if not snapshot.is_fresh(): return None
+    row = snapshot.lookup(universe.with_suffix(symbol))
+    if row is None: return None
+    df_d = snapshot.load_bars(row['code'])
+    # 舊版快照沒有波浪代碼，走即時抓取
+    if df_d is None or 'Wave' not in df_d: return None
+    return df_d, row
 
 # --- 新增：基本面與除息資訊獲取 (修正版) ---
-def get_fundamental_info(ticker, close_price, atr, is_bull_trend):
+def get_fundamental_info(ticker_symbol, close_price, atr, is_bull_trend, t_info=None):
     info = {}
     try:
-        t_info = ticker.info
+        if t_info is None:
+            t_info = fetch_cache.get_info(ticker_symbol)
         
         # 1. 除息資訊 - 嘗試獲取 "最近一次" 股利
         ex_date = t_info.get('exDividendDate', None)
@@ -175,49 +181,8 @@ def get_key_brokers(symbol):
 
 # --- SAR 計算函數 ---
 def calculate_sar(high, low, accel=0.02, max_accel=0.2):
-    sar = np.zeros(len(high))
-    trend = np.zeros(len(high))
-    ep = np.zeros(len(high))
-    af = np.zeros(len(high))
-    trend[0] = 1 
-    sar[0] = low[0]
-    ep[0] = high[0]
-    af[0] = accel
-    for i in range(1, len(high)):
-        sar[i] = sar[i-1] + af[i-1] * (ep[i-1] - sar[i-1])
-        if trend[i-1] == 1:
-            if low[i] < sar[i]:
-                trend[i] = -1
-                sar[i] = ep[i-1]
-                ep[i] = low[i]
-                af[i] = accel
-            else:
-                trend[i] = 1
-                if high[i] > ep[i-1]:
-                    ep[i] = high[i]
-                    af[i] = min(af[i-1] + accel, max_accel)
-                else:
-                    ep[i] = ep[i-1]
-                    af[i] = af[i-1]
-                sar[i] = min(sar[i], low[i-1])
-                if i > 1: sar[i] = min(sar[i], low[i-2])
-        else:
-            if high[i] > sar[i]:
-                trend[i] = 1
-                sar[i] = ep[i-1]
-                ep[i] = high[i]
-                af[i] = accel
-            else:
-                trend[i] = -1
-                if low[i] < ep[i-1]:
-                    ep[i] = low[i]
-                    af[i] = min(af[i-1] + accel, max_accel)
-                else:
-                    ep[i] = ep[i-1]
-                    af[i] = af[i-1]
-                sar[i] = max(sar[i], high[i-1])
-                if i > 1: sar[i] = max(sar[i], high[i-2])
-    return sar
+    # 共用引擎：有 numba 走 JIT，否則走 NumPy 批次版本 (與原逐根迴圈逐位元相同)
+    return indicators.calc_sar(high, low, accel, max_accel)
 
 # --- 2. 指標計算 ---
 def calc_indicators(df):
@@ -242,15 +207,7 @@ def calc_indicators(df):
         else:
             df[f'SMA{ma}'] = np.nan
 
-    df['9_High'] = df['High'].rolling(9).max()
-    df['9_Low'] = df['Low'].rolling(9).min()
-    df['RSV'] = (df['Close'] - df['9_Low']) / (df['9_High'] - df['9_Low']) * 100
-    k, d = [50], [50]
-    for rsv in df['RSV'].fillna(50):
-        k.append(k[-1]*2/3 + rsv*1/3)
-        d.append(d[-1]*2/3 + k[-1]*1/3)
-    df['K'] = k[1:]
-    df['D'] = d[1:]
+    df['RSV'], df['K'], df['D'] = indicators.calc_kd(df['High'], df['Low'], df['Close'])
     
     exp12 = df['Close'].ewm(span=12, adjust=False).mean()
     exp26 = df['Close'].ewm(span=26, adjust=False).mean()
@@ -258,10 +215,11 @@ def calc_indicators(df):
     df['MACD'] = df['DIF'].ewm(span=9, adjust=False).mean()
     df['MACD_Hist'] = df['DIF'] - df['MACD']
     
-    df['BB_Mid'] = df['Close'].rolling(20).mean()
-    df['BB_Std'] = df['Close'].rolling(20).std()
-    df['BB_Up'] = df['BB_Mid'] + 2 * df['BB_Std']
-    df['BB_Low'] = df['BB_Mid'] - 2 * df['BB_Std']
+    # 中間值 (布林中線 / 標準差、TR) 不存成欄位
+    bb_mid = df['Close'].rolling(20).mean()
+    bb_std = df['Close'].rolling(20).std()
+    df['BB_Up'] = bb_mid + 2 * bb_std
+    df['BB_Low'] = bb_mid - 2 * bb_std
     df['BB_Pct'] = (df['Close'] - df['BB_Low']) / (df['BB_Up'] - df['BB_Low'])
     
     if 'MA20' in df.columns:
@@ -269,57 +227,22 @@ def calc_indicators(df):
     else:
         df['BIAS_20'] = 0
         
-    df['TR'] = np.maximum(df['High'] - df['Low'], np.abs(df['High'] - df['Close'].shift(1)))
-    df['ATR'] = df['TR'].rolling(14).mean()
+    tr = np.maximum(df['High'] - df['Low'], np.abs(df['High'] - df['Close'].shift(1)))
+    df['ATR'] = tr.rolling(14).mean()
     
     return df
 
-# --- 3. 微波浪識別 ---
+# --- 3. 微波浪識別 (規則與代碼見 waves.py；盤後快照已存三週期代碼與日線歷史) ---
 def get_micro_wave(df, timeframe="日"):
-    if df is None or len(df) < 15: return "資料不足(新股)"
-    price = df['Close'].iloc[-1]
-    ma20 = df['MA20'].iloc[-1] if 'MA20' in df.columns and not pd.isna(df['MA20'].iloc[-1]) else price
-    ma60 = df['MA60'].iloc[-1] if 'MA60' in df.columns and not pd.isna(df['MA60'].iloc[-1]) else price
-    k = df['K'].iloc[-1]
-    prev_k = df['K'].iloc[-2]
-    hist = df['MACD_Hist'].iloc[-1]
-    prev_hist = df['MACD_Hist'].iloc[-2]
-    trend = "Bull" if price >= ma60 else "Bear"
-    wave_label = ""
-    if trend == "Bull":
-        if price > ma20:
-            if hist > 0 and hist > prev_hist:
-                if k > 80: wave_label = "3-5 (噴出末段)"
-                else: wave_label = "3-3 (主升急漲)"
-            elif hist > 0 and hist < prev_hist: wave_label = "3-a (高檔震盪)"
-            else: wave_label = "3-1 (初升/轉折)"
-        else:
-            if price > ma60:
-                if k < 20: wave_label = "4-c (修正末端)"
-                elif k < prev_k: wave_label = "4-a (初跌修正)"
-                else: wave_label = "4-b (反彈逃命)"
-    else:
-        if price < ma20:
-            if k < 20: wave_label = "C-5 (趕底急殺)"
-            else: wave_label = "C-3 (主跌段)"
-        else:
-            if k > 80: wave_label = "B-c (反彈高點)"
-            else: wave_label = "B-a (跌深反彈)"
-    return wave_label
-
-# --- 4. 費波那契 ---
-def get_fibonacci(df):
-    window = min(len(df), 120)
-    high = df['High'].iloc[-window:].max()
-    low = df['Low'].iloc[-window:].min()
-    diff = high - low
-    return {
-        "0.200": high - (diff * 0.2),
-        "0.382": high - (diff * 0.382),
-        "0.500": high - (diff * 0.5),
-        "0.618": high - (diff * 0.618),
-        "trend_high": high, "trend_low": low
-    }
+    return waves.micro_wave(df, timeframe)
+
+# --- 4. 費波那契 (錨定最近一段波段 + 支撐壓力區，見 swings.py) ---
+SWING_FIELDS = ('trend_high', 'trend_low', 'swing_dir', 'sup_low', 'sup_high', 'sup_hits',
+                'res_low', 'res_high', 'res_hits')
+
+def get_fibonacci(df, ticker_symbol=None):
+    if ticker_symbol: return fetch_cache.get_levels(ticker_symbol, df)
+    return swings.levels(df)
 
 # --- 5. 深度戰略生成 ---
 def generate_deep_strategy(stock_name, price, check, wave_d, wave_60, wave_30, fib, df):
@@ -386,20 +309,37 @@ def generate_deep_strategy(stock_name, price, check, wave_d, wave_60, wave_30, f
 if run_btn:
     with st.spinner("正在進行全維度運算 (Daily/60m/30m/Fundamental)..."):
         clean_symbol = stock_input.replace('.TW', '').replace('.TWO', '')
-        stock_name = get_stock_name(clean_symbol)
-        df_d, df_60, df_30, ticker_obj = get_data(clean_symbol)
+        # 非盤中先讀盤後快照 (指標 / 波浪 / 費波那契 / 基本面都已算好)，盤中或強制時才即時抓取
+        snap = None if force_live else load_snapshot(clean_symbol)
+        if snap is not None:
+            df_d, snap_row = snap
+            stock_name = snap_row['name']
+            ticker_symbol = snap_row['code']
+            fund_raw = snap_row['fundamentals']
+        else:
+            stock_name = get_stock_name(clean_symbol)
+            df_d, df_60, df_30, ticker_symbol = get_data(clean_symbol)
+            fund_raw = None
         
         if df_d is None or len(df_d) < 10:
             st.error(f"❌ 無法獲取 {clean_symbol} 資料。可能是新股上市未滿 10 天或代號錯誤。")
         else:
-            df_d = calc_indicators(df_d)
-            if df_60 is not None and not df_60.empty: df_60 = calc_indicators(df_60)
-            if df_30 is not None and not df_30.empty: df_30 = calc_indicators(df_30)
-            
-            wave_d = get_micro_wave(df_d, "日")
-            wave_60 = get_micro_wave(df_60, "60分") if df_60 is not None and not df_60.empty else "N/A"
-            wave_30 = get_micro_wave(df_30, "30分") if df_30 is not None and not df_30.empty else "N/A"
-            fib = get_fibonacci(df_d)
+            if snap is not None:
+                wave_d, wave_60, wave_30 = (waves.label(snap_row[c]) for c in ('wave_d', 'wave_60', 'wave_30'))
+                wave_hist = df_d['Wave']
+                fib = {lv: snap_row[f'fib_{lv}'] for lv in swings.FIB_LEVELS}
+                fib.update({k: snap_row.get(k, np.nan) for k in SWING_FIELDS})
+                st.caption(f"📦 盤後快照 ({snapshot.meta()['trade_date']} 收盤)；盤中請勾選「強制即時抓取」")
+            else:
+                df_d = calc_indicators(df_d)
+                if df_60 is not None and not df_60.empty: df_60 = calc_indicators(df_60)
+                if df_30 is not None and not df_30.empty: df_30 = calc_indicators(df_30)
+
+                wave_hist = waves.history(df_d)
+                wave_d = waves.label(wave_hist.iloc[-1])
+                wave_60 = get_micro_wave(df_60, "60分") if df_60 is not None and not df_60.empty else "N/A"
+                wave_30 = get_micro_wave(df_30, "30分") if df_30 is not None and not df_30.empty else "N/A"
+                fib = get_fibonacci(df_d, ticker_symbol)
             
             today = df_d.iloc[-1]
             prev = df_d.iloc[-2]
@@ -410,39 +350,18 @@ if run_btn:
             
             check['main_force'] = get_key_brokers(clean_symbol)
             
-            turnover = today['Close'] * today['Volume']
-            check['warrant_5m'] = (turnover > 30000000) and (today['Close'] > prev['Close'])
-            
-            # --- SOP 完整細項判定 ---
-            sar_val = today.get('SAR', np.inf) 
-            
-            # 1. KD 判斷
-            kd_gold_cross = (prev['K'] < prev['D']) and (today['K'] > today['D']) 
-            kd_is_bull = today['K'] > today['D'] 
-            check['kd_status'] = "今日金叉" if kd_gold_cross else ("多頭排列" if kd_is_bull else "空方")
-            
-            # 2. MACD 判斷
-            macd_flip = (prev['MACD_Hist'] <= 0 and today['MACD_Hist'] > 0) 
-            macd_is_bull = today['MACD_Hist'] > 0 
-            check['macd_status'] = "今日翻紅" if macd_flip else ("紅柱延伸" if macd_is_bull else "綠柱整理")
-            
-            # 3. SAR 判斷
-            sar_is_bull = today['Close'] > sar_val
-            check['sar_status'] = "多方支撐" if sar_is_bull else "空方壓力"
-
-            check['is_perfect_sop'] = kd_is_bull and macd_is_bull and sar_is_bull
-            check['is_sop_pass'] = (kd_is_bull or macd_is_bull) and sar_is_bull
-            
-            check['is_gulu'] = (today['K'] < 50) and (today['K'] > prev['K'])
-            
-            recent = df_d.iloc[-10:]
-            is_strong = (recent['Close'] >= recent['Open']) | (recent['Close'] > recent['Close'].shift(1))
-            consecutive = 0
-            for x in reversed(is_strong.values):
-                if x: consecutive += 1
-                else: break
-            check['consecutive'] = consecutive
-            check['is_buy_streak'] = 3 <= consecutive <= 10
+            # 6 大訊號與 SOP 細項 (規則見 signal_rules.py，與 cloud_bot / 盤後快照同一套)
+            sig = signal_rules.SIGNALS.last(df_d, signal_rules.THRESHOLDS)
+            sop = signal_rules.SOP.last(df_d)
+            check['warrant_5m'] = bool(sig['whale'])
+            check['kd_status'] = "今日金叉" if sop['kd_cross'] else ("多頭排列" if sop['kd_bull'] else "空方")
+            check['macd_status'] = "今日翻紅" if sop['macd_flip'] else ("紅柱延伸" if sop['macd_bull'] else "綠柱整理")
+            check['sar_status'] = "多方支撐" if sop['sar_bull'] else "空方壓力"
+            check['is_perfect_sop'] = bool(sop['perfect_sop'])
+            check['is_sop_pass'] = bool(sop['sop_pass'])
+            check['is_gulu'] = bool(sop['gulu_watch'])
+            check['consecutive'] = int(sig['consecutive'])
+            check['is_buy_streak'] = bool(sig['streak'])
 
             atr = df_d['ATR'].iloc[-1] if not pd.isna(df_d['ATR'].iloc[-1]) else today['Close']*0.02
             
@@ -451,17 +370,23 @@ if run_btn:
             is_bull_trend = today['Close'] > ma60_val
 
             # 獲取基本面與除息資訊 (傳入趨勢判斷填息難度)
-            fund_info = get_fundamental_info(ticker_obj, today['Close'], atr, is_bull_trend)
+            fund_info = get_fundamental_info(ticker_symbol, today['Close'], atr, is_bull_trend, fund_raw)
 
+            backtest.sync()   # 每週回測結果 (GitHub Release)，每 6 小時最多檢查一次
             targets = []
-            reality_factor = 2.5
-            for mult, win, atr_ratio in [(1.05, "85%", 0.5), (1.10, "65%", 0.4), (1.20, "40%", 0.3)]:
+            for mult, win, bt_key in [(1.05, "85%", "up5"), (1.10, "65%", "up10"), (1.20, "40%", "up20")]:
                 p = today['Close'] * mult
                 dist = p - today['Close']
-                daily_move = atr * atr_ratio
-                
-                raw_days = dist / daily_move if daily_move > 0 else 5
-                adjusted_days = max(5, int(raw_days * reality_factor)) 
+                daily_move = atr * backtest.TARGET_ATR_RATIO[bt_key]
+                adjusted_days = int(backtest.estimate_days(dist, daily_move))
+
+                # 有回測結果就用全市場歷史實績 (命中率 / 75% 樣本的到價天數) 取代經驗值
+                odds = backtest.target_odds(bt_key)
+                if odds is not None:
+                    win = f"{odds[0]}%"
+                    if odds[1]: adjusted_days = int(round(odds[1]))
+                else:
+                    backtest.fallback("app")
                 
                 targets.append({"p": p, "w": win, "days": adjusted_days})
 
@@ -531,6 +456,9 @@ if run_btn:
             wc1.info(f"📅 **日線 (主趨勢)**\n\n# {wave_d}")
             wc2.warning(f"⏰ **60分K (波段)**\n\n# {wave_60}")
             wc3.error(f"⚡ **30分K (轉折)**\n\n# {wave_30}")
+            trail = waves.segments(wave_hist.iloc[-60:])[-6:]
+            st.caption("📜 日線波浪軌跡 (近 60 根)：" + " → ".join(
+                f"{lab or '—'} ({start:%m/%d} 起 {n} 根)" for start, lab, n in trail))
             
             st.markdown("---")
             
@@ -594,6 +522,14 @@ if run_btn:
                 st.write(f"**0.382 (初級支撐)**: {fib['0.382']:.2f} — {fib_tag(fib['0.382'], '第一道防線')}")
                 st.write(f"**0.500 (多空分界)**: {fib['0.500']:.2f} — {fib_tag(fib['0.500'], '中線轉折')}")
                 st.write(f"**0.618 (黃金防線)**: {fib['0.618']:.2f} — {fib_tag(fib['0.618'], '生命線 (破則轉空)')}")
+                leg = {1: "起漲中", -1: "回檔中"}.get(fib.get('swing_dir'), "無明確轉折")
+                st.caption(f"錨定波段：{fib['trend_low']:.2f} → {fib['trend_high']:.2f} ({leg})")
+                def zone_text(lo, hi, hits):
+                    if pd.isna(lo): return "—"
+                    band = f"{lo:.2f}" if abs(hi - lo) < 0.005 else f"{lo:.2f} ~ {hi:.2f}"
+                    return f"{band} (測試 {int(hits)} 次)"
+                st.write(f"**🧱 最近支撐區**: {zone_text(fib.get('sup_low', np.nan), fib.get('sup_high'), fib.get('sup_hits'))}")
+                st.write(f"**🚧 最近壓力區**: {zone_text(fib.get('res_low', np.nan), fib.get('res_high'), fib.get('res_hits'))}")
             
             with col_b:
                 st.markdown("#### ⚡ 動能與布林解析")
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+盤後產物發佈 (GitHub Release)
+盤後快照 (.snapshot/，雲端機器人) 與回測統計 (.backtest/，每週回測 workflow) 都在 GitHub Actions 上產生，
+但頁面 (app.py / pages/) 跑在另一台主機上，兩邊不共用磁碟，所以用一個固定 tag 的 Release 當交換區：
+- publish：雲端機器人產生後上傳成 Release 附件 (同名覆蓋)，需要有 contents: write 權限的 GITHUB_TOKEN
+- download：頁面主機從 Release 的公開網址下載 (先寫暫存檔、檢查通過才改名換上)
+- fetch_json：小型說明檔 (快照的 meta.json)，用來判斷要不要下載大檔
+沒有權杖 / 網路失敗只記錄 failure 並回傳 False，不影響主流程 (頁面會改走即時抓取)。
+MINIKO_RELEASE_URL 設成空字串可關閉下載 (離線 / 重播測試)。
+"""
+import json
+import os
+
+import requests
+
+import metrics
+
+# ================= ⚙️ 參數設定區 =================
+REPO = os.environ.get("GITHUB_REPOSITORY") or os.environ.get("MINIKO_RELEASE_REPO", "chenruby1109/stock-ai")
+RELEASE_TAG = os.environ.get("MINIKO_RELEASE_TAG", "nightly-data")
+DOWNLOAD_URL = os.environ.get("MINIKO_RELEASE_URL",
+                              f"https://github.com/{REPO}/releases/download/{RELEASE_TAG}")
+API_URL = "https://api.github.com"
+UPLOAD_URL = "https://uploads.github.com"
+TIMEOUT = 60
+# ===============================================
+
+
+def _release(session):
+    """取得 (沒有就建立) 交換用的 Release"""
+    r = session.get(f"{API_URL}/repos/{REPO}/releases/tags/{RELEASE_TAG}", timeout=TIMEOUT)
+    if r.status_code == 404:
+        r = session.post(f"{API_URL}/repos/{REPO}/releases", timeout=TIMEOUT, json={
+            "tag_name": RELEASE_TAG, "name": "盤後資料 (自動更新)", "prerelease": True, "make_latest": "false",
+            "body": "雲端機器人每晚上傳的盤後快照與回測統計，頁面主機自動下載；請勿手動編輯。",
+        })
+    r.raise_for_status()
+    return r.json()
+
+
+def publish(paths, token=None):
+    """把檔案上傳成 Release 附件 (依序上傳、同名覆蓋)；回傳是否全部成功"""
+    token = token or os.environ.get("GITHUB_TOKEN", "")
+    if not token:
+        print("ℹ️ 沒有 GITHUB_TOKEN，略過發佈 (頁面主機拿不到這次的結果)")
+        return False
+    try:
+        with requests.Session() as session:
+            session.headers.update({"Authorization": f"Bearer {token}", "Accept": "application/vnd.github+json"})
+            release = _release(session)
+            assets = {a['name']: a['id'] for a in release.get('assets', [])}
+            for path in paths:
+                name = os.path.basename(path)
+                if name in assets:
+                    session.delete(f"{API_URL}/repos/{REPO}/releases/assets/{assets[name]}",
+                                   timeout=TIMEOUT).raise_for_status()
+                with open(path, 'rb') as f:
+                    session.post(f"{UPLOAD_URL}/repos/{REPO}/releases/{release['id']}/assets",
+                                 params={"name": name}, data=f, timeout=TIMEOUT,
+                                 headers={"Content-Type": "application/octet-stream"}).raise_for_status()
+        metrics.inc("miniko_published_total", value=len(paths))
+        return True
+    except Exception as e:
+        metrics.failure("publish", e)
+        return False
+
+
+def fetch_json(name):
+    """讀取 Release 上的小型 JSON 附件；沒有 / 失敗回傳 None"""
+    if not DOWNLOAD_URL: return None
+    try:
+        r = requests.get(f"{DOWNLOAD_URL}/{name}", timeout=TIMEOUT)
+        if r.status_code == 404: return None
+        r.raise_for_status()
+        return r.json()
+    except (requests.RequestException, json.JSONDecodeError) as e:
+        metrics.failure("download", e, symbol=name)
+        return None
+
+
+def download(names, dest_dir, check=None):
+    """
+    下載 Release 附件到 dest_dir：全部下載完、且 check({名稱: 暫存檔路徑}) 通過才依 names 順序改名換上
+    回傳是否有換上新檔
+    """
+    if not DOWNLOAD_URL: return False
+    os.makedirs(dest_dir, exist_ok=True)
+    tmps = {name: os.path.join(dest_dir, name + ".download") for name in names}
+    try:
+        for name, tmp in tmps.items():
+            with requests.get(f"{DOWNLOAD_URL}/{name}", timeout=TIMEOUT, stream=True) as r:
+                r.raise_for_status()
+                with open(tmp, 'wb') as f:
+                    for chunk in r.iter_content(1 << 20):
+                        f.write(chunk)
+        if check is not None and not check(tmps):
+            return False
+        for name, tmp in tmps.items():
+            os.replace(tmp, os.path.join(dest_dir, name))
+        return True
+    except Exception as e:
+        metrics.failure("download", e, symbol=",".join(names))
+        return False
+    finally:
+        for tmp in tmps.values():
+            if os.path.exists(tmp): os.remove(tmp)
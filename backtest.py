@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+歷史回測引擎 (向量化 walk-forward)
+對整個 (日期 × 股票) 寬表逐日重現兩套訊號，統計觸發之後的實際表現：
+- cloud_bot 6 大訊號 (signal_rules.evaluate_panel)
+- 戰情室 Miniko 計分 (screener.score_matrix，依分數區間分組)
+- 對照組：隨機抽樣的一般交易日
+每個觸發點只用當天收盤為止的資料判斷，以當日收盤價進場，往後看：
+- N 日報酬分佈 (平均 / 分位數 / 勝率)
+- ATR×3 與 +5% / +10% / +20% 目標價在 MAX_HOLD 日內的命中率與到價天數
+結果存成 JSON，cloud_bot 報告的勝率與個股戰情室的目標價機率直接讀這份數字。
+GitHub Actions 每週跑一次 (.github/workflows/backtest.yml，--publish 上傳到 GitHub Release)，
+cloud_bot 啟動時與 app.py 用 sync() 下載；沒有結果時退回經驗值並記錄 backtest_fallback 事件。
+
+用法：
+  python backtest.py                        # 全市場 10 年 (走本地 K 線倉庫)
+  python backtest.py --period 5y --limit 300
+  python backtest.py --publish              # 跑完上傳 stats.json (需 GITHUB_TOKEN)
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import bar_store
+import indicators
+import screener
+import signal_rules
+import metrics
+import scheduler
+import artifacts
+
+# ================= ⚙️ 參數設定區 =================
+BACKTEST_DIR = os.environ.get(
+    "MINIKO_BACKTEST_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".backtest")
+)
+STATS_PATH = os.path.join(BACKTEST_DIR, "stats.json")
+EVENTS_PATH = os.path.join(BACKTEST_DIR, "events.parquet")
+
+PERIOD = "10y"
+SHARD_SIZE = 300          # 每批下載 / 計算的檔數 (控制記憶體)
+HORIZONS = (1, 5, 10, 20)  # 往後看幾個交易日的報酬
+WIN_HORIZON = 10          # 報告「勝率」= 10 日後收盤高於進場價的比例
+MAX_HOLD = 60             # 目標價最多等幾個交易日
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+BASELINE_SAMPLE = 0.02    # 對照組：每個交易日抽 2%
+MIN_SAMPLES = 30          # 樣本數不足的訊號不拿來當報告數字
+SEED = 42
+SYNC_INTERVAL = timedelta(hours=6)   # 多久檢查一次 GitHub Release 上的新回測結果
+
+# 目標價：(種類, 參數) → ATR 倍數 或 漲幅
+TARGETS = {
+    "atr3": ("atr", 3.0),
+    "up5": ("pct", 0.05),
+    "up10": ("pct", 0.10),
+    "up20": ("pct", 0.20),
+}
+# 個股戰情室目標價的到價天數估計：距離 / (ATR × 係數) × 現實係數 (至少 5 天)
+REALITY_FACTOR = 2.5
+TARGET_ATR_RATIO = {"up5": 0.5, "up10": 0.4, "up20": 0.3}
+# Miniko 分數區間 (含頭含尾)
+SCORE_BANDS = {
+    "score_sop": (1000, None),
+    "score_60": (60, 999),
+    "score_30": (30, 59),
+    "score_1": (1, 29),
+}
+# ===============================================
+
+
+# --- 單一分片 ---
+def _fill_gaps(df):
+    """只補停牌造成的中間缺值 (上市前 / 下市後維持 NaN，不憑空延長)"""
+    return df.ffill().where(df.bfill().notna())
+
+
+def _shift_up(values, j):
+    """往後看 j 根：第 t 列放 t+j 的值，尾端補 NaN"""
+    out = np.full_like(values, np.nan)
+    out[:-j] = values[j:]
+    return out
+
+
+def _first_hit_days(high, targets):
+    """
+    每個目標價第一次被最高價碰到是第幾天 (1~MAX_HOLD)
+    0 = MAX_HOLD 天內沒碰到；NaN = 資料不足 MAX_HOLD 天 (還看不出結果) 或目標無效
+    """
+    days = {name: np.full(high.shape, np.nan) for name in targets}
+    running = np.full(high.shape, -np.inf)
+    with np.errstate(invalid='ignore'):
+        for j in range(1, MAX_HOLD + 1):
+            future = _shift_up(high, j)
+            running = np.fmax(running, future)
+            for name, target in targets.items():
+                hit = days[name]
+                hit[np.isnan(hit) & (running >= target)] = j
+        complete = ~np.isnan(_shift_up(high, MAX_HOLD))
+        for name, target in targets.items():
+            hit = days[name]
+            hit[np.isnan(hit) & complete & ~np.isnan(target)] = 0
+    return days
+
+
+def prepare_shard(panel):
+    """
+    分片共同的前處理 (回測與參數掃描共用)：補值、指標、可列入的格子、往後報酬與目標到價天數
+    panel 為 {欄位: DataFrame(日期 × 股票)} (indicators.to_panel 的格式)
+    """
+    raw_close = panel['Close']
+    tradable = (raw_close.notna() & (panel['Volume'].fillna(0) > 0)).values
+    filled = {f: _fill_gaps(df) for f, df in panel.items()}
+    close = filled['Close']
+    ind = indicators.calc_panel_indicators(filled, mas=(5, 20, 60))
+
+    # 暖機期間的指標不可靠，不列入
+    warm = (np.arange(len(close)) >= screener.MIN_BARS - 1)[:, None]
+
+    c = close.values
+    atr = ind['ATR'].values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = {h: _shift_up(c, h) / c - 1 for h in HORIZONS}
+        targets = {name: c + atr * arg if kind == "atr" else c * (1 + arg)
+                   for name, (kind, arg) in TARGETS.items()}
+    return {
+        'filled': filled, 'ind': ind, 'tradable': tradable, 'valid': tradable & warm,
+        'returns': returns, 'hits': _first_hit_days(filled['High'].values, targets), 'atr': atr,
+    }
+
+
+def shard_events(panel, rng=None):
+    """
+    單一分片的所有觸發事件 (長表)：date、code、signal、score、ret_<h>、hit_<target>
+    panel 為 {欄位: DataFrame(日期 × 股票)} (indicators.to_panel 的格式)
+    """
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    prep = prepare_shard(panel)
+    filled, ind = prep['filled'], prep['ind']
+    close, open_, volume = filled['Close'], filled['Open'], filled['Volume']
+
+    masks = signal_rules.evaluate_panel(close, open_, volume, ind)
+    score = screener.score_matrix(close, open_, volume, ind['K'], ind['D'], ind['MACD_Hist'],
+                                  ind['MA5'], ind['SAR_Bull'].values, prep['tradable'])['score']
+    for name, (lo, hi) in SCORE_BANDS.items():
+        masks[name] = (score >= lo) & (score <= hi if hi is not None else True)
+    masks["all"] = rng.random(score.shape) < BASELINE_SAMPLE
+
+    codes = pd.Categorical(close.columns)
+    frames = []
+    for key, mask in masks.items():
+        rows, cols = np.nonzero(mask & prep['valid'])
+        if len(rows) == 0: continue
+        data = {
+            'date': close.index[rows],
+            'code': codes[cols],
+            'signal': pd.Categorical([key] * len(rows), categories=list(masks)),
+            'score': score[rows, cols].astype('int16'),
+        }
+        data.update({f'ret_{h}': r[rows, cols].astype('float32') for h, r in prep['returns'].items()})
+        data.update({f'hit_{t}': d[rows, cols].astype('float32') for t, d in prep['hits'].items()})
+        frames.append(pd.DataFrame(data))
+    if not frames: return None
+    return concat_events(frames)
+
+
+def concat_events(frames):
+    """合併事件表 (代號 / 訊號維持 category，不退化成字串欄)"""
+    codes = union_categoricals([f['code'] for f in frames])
+    out = pd.concat([f.drop(columns='code') for f in frames], ignore_index=True)
+    out.insert(1, 'code', codes)
+    return out
+
+
+def estimate_days(dist, daily_move, reality_factor=REALITY_FACTOR):
+    """經驗法則的到價天數 (純量或陣列皆可)"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        raw = np.where(daily_move > 0, dist / daily_move, 5)
+    return np.maximum(5, np.trunc(raw * reality_factor))
+
+
+# --- 統計 ---
+def _round(x, digits=4):
+    return None if x is None or pd.isna(x) else round(float(x), digits)
+
+
+def summarize(events):
+    """事件長表 → 每個訊號的報酬分佈與目標命中統計 (dict，可直接存 JSON)"""
+    stats = {}
+    for key, group in events.groupby('signal', observed=True):
+        entry = {"n": int(len(group)), "returns": {}, "targets": {}}
+        for h in HORIZONS:
+            r = group[f'ret_{h}'].dropna()
+            if r.empty: continue
+            q = r.quantile(QUANTILES)
+            entry["returns"][str(h)] = {
+                "n": int(len(r)), "mean": _round(r.mean()), "win": _round((r > 0).mean()),
+                **{f"q{int(p * 100)}": _round(v) for p, v in q.items()},
+            }
+        for t in TARGETS:
+            d = group[f'hit_{t}'].dropna()
+            if d.empty: continue
+            hit = d[d > 0]
+            entry["targets"][t] = {
+                "n": int(len(d)), "hit": _round(len(hit) / len(d)),
+                "days_median": _round(hit.median(), 1) if len(hit) else None,
+                "days_q75": _round(hit.quantile(0.75), 1) if len(hit) else None,
+            }
+        stats[key] = entry
+    return stats
+
+
+# --- 執行 ---
+def panel_for(tickers, period):
+    bulk = bar_store.get_bars_bulk(tickers, period=period, interval="1d")
+    if bulk is None or bulk.empty: return None
+    return indicators.to_panel(bulk, tickers)
+
+
+def run(tickers, period=PERIOD, shard_size=SHARD_SIZE, save_events=False):
+    """全部股票分片回測 → 統計結果寫入 STATS_PATH，回傳 stats dict"""
+    rng = np.random.default_rng(SEED)
+    events, first, last = [], None, None
+    with metrics.stage("backtest", tickers=len(tickers)):
+        for i in range(0, len(tickers), shard_size):
+            shard = tickers[i:i + shard_size]
+            try:
+                panel = panel_for(shard, period)
+                if panel is None: continue
+                ev = shard_events(panel, rng)
+                idx = panel['Close'].index
+                first = idx[0] if first is None else min(first, idx[0])
+                last = idx[-1] if last is None else max(last, idx[-1])
+                if ev is not None: events.append(ev)
+            except Exception as e:
+                metrics.failure("backtest_shard", e, symbol=f"shard{i // shard_size}")
+            print(f"🧪 回測進度 {min(i + shard_size, len(tickers))}/{len(tickers)}")
+    if not events: return None
+
+    events = concat_events(events)
+    stats = {
+        "meta": {
+            "built_at": scheduler.now_tw().isoformat(timespec="seconds"),
+            "period": period, "symbols": len(tickers),
+            "start": str(first.date()), "end": str(last.date()),
+            "horizons": list(HORIZONS), "win_horizon": WIN_HORIZON, "max_hold": MAX_HOLD,
+            "events": int(len(events)),
+        },
+        "signals": summarize(events),
+    }
+    os.makedirs(BACKTEST_DIR, exist_ok=True)
+    tmp = STATS_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, STATS_PATH)
+    if save_events:
+        events.to_parquet(EVENTS_PATH, index=False)
+    return stats
+
+
+# --- 發佈 / 同步 (GitHub Actions → 雲端機器人、頁面主機) ---
+_sync_lock = threading.Lock()
+_last_sync = None
+
+
+def publish():
+    """把 stats.json 上傳到 GitHub Release"""
+    return artifacts.publish([STATS_PATH])
+
+
+def _built_at(stats):
+    return (stats or {}).get("meta", {}).get("built_at", "")
+
+
+def sync(now=None):
+    """從 GitHub Release 換上較新的 stats.json (每 SYNC_INTERVAL 最多檢查一次)；回傳是否有換上新檔"""
+    global _last_sync
+    now = now or scheduler.now_tw()
+    if not _sync_lock.acquire(blocking=False): return False
+    try:
+        if _last_sync is not None and now - _last_sync < SYNC_INTERVAL: return False
+        _last_sync = now
+        local = _built_at(load_stats())
+
+        def newer(tmps):
+            try:
+                with open(tmps[os.path.basename(STATS_PATH)], encoding="utf-8") as f:
+                    remote = json.load(f)
+            except (OSError, ValueError):
+                return False
+            return "signals" in remote and _built_at(remote) > local
+
+        ok = artifacts.download([os.path.basename(STATS_PATH)], BACKTEST_DIR, check=newer)
+        if ok: print(f"🧪 已同步回測結果 ({_built_at(load_stats())})")
+        return ok
+    finally:
+        _sync_lock.release()
+
+
+_fallbacks = set()
+
+
+def fallback(where):
+    """報告沒有回測數字、改用經驗值時記錄 (計數 + 事件；每個原因只印一次)"""
+    reason = "no_stats" if load_stats() is None else "few_samples"
+    metrics.inc("miniko_backtest_fallback_total", report=where, reason=reason)
+    metrics.event("backtest_fallback", report=where, reason=reason, path=STATS_PATH)
+    if (where, reason) not in _fallbacks:
+        _fallbacks.add((where, reason))
+        print(f"⚠️ {where}：{'沒有回測結果 (' + STATS_PATH + ')' if reason == 'no_stats' else '回測樣本不足'}，改用經驗值")
+
+
+# --- 報告取數 ---
+_cache = {"mtime": None, "stats": None}
+
+
+def load_stats():
+    """讀回測結果 (檔案更新才重讀)；沒有回傳 None"""
+    try:
+        mtime = os.path.getmtime(STATS_PATH)
+    except OSError:
+        return None
+    if _cache["mtime"] != mtime:
+        try:
+            with open(STATS_PATH, encoding="utf-8") as f:
+                _cache["stats"] = json.load(f)
+            _cache["mtime"] = mtime
+        except Exception:
+            return None
+    return _cache["stats"]
+
+
+def signal_summary(key, stats=None):
+    """
+    單一訊號的報告數字：{key, n, win, ret, hit, days}；樣本不足或沒有回測回傳 None
+    win / hit 為百分比整數，ret 為 WIN_HORIZON 日平均報酬 (%)
+    """
+    stats = stats if stats is not None else load_stats()
+    if not stats: return None
+    entry = stats["signals"].get(key)
+    if not entry or entry["n"] < MIN_SAMPLES: return None
+    r = entry["returns"].get(str(WIN_HORIZON))
+    t = entry["targets"].get("atr3")
+    if not r or not t: return None
+    return {
+        "key": key, "n": entry["n"],
+        "win": int(round(r["win"] * 100)), "ret": round(r["mean"] * 100, 2),
+        "hit": int(round(t["hit"] * 100)), "days": t["days_median"],
+    }
+
+
+def stats_for(keys, stats=None):
+    """
+    一組觸發訊號的報告數字：取樣本數最少 (條件最嚴格) 且足量的那個訊號；
+    沒有觸發任何訊號時用對照組 (一般交易日)
+    """
+    stats = stats if stats is not None else load_stats()
+    found = [s for s in (signal_summary(k, stats) for k in keys if k) if s]
+    if found: return min(found, key=lambda s: s["n"])
+    return signal_summary("all", stats)
+
+
+def target_odds(target, stats=None):
+    """對照組某個目標價的 (命中率 %, 到價天數 75 分位)；沒有回測回傳 None"""
+    stats = stats if stats is not None else load_stats()
+    if not stats: return None
+    t = stats["signals"].get("all", {}).get("targets", {}).get(target)
+    if not t or t["hit"] is None: return None
+    return int(round(t["hit"] * 100)), t["days_q75"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Miniko 訊號歷史回測")
+    parser.add_argument("--period", default=PERIOD)
+    parser.add_argument("--limit", type=int, help="只跑前 N 檔 (試跑用)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--save-events", action="store_true", help="另存每個觸發事件 (events.parquet)")
+    parser.add_argument("--publish", action="store_true", help="跑完上傳 stats.json 到 GitHub Release")
+    args = parser.parse_args(argv)
+
+    import universe
+    tickers = [s['code'] for s in universe.fetch_full_universe()]
+    if args.limit: tickers = tickers[:args.limit]
+    stats = run(tickers, args.period, args.shard_size, args.save_events)
+    if stats is None:
+        print("❌ 沒有可回測的資料")
+        return 1
+    print(f"\n💾 已寫入 {STATS_PATH}")
+    if args.publish and not publish():
+        print("❌ stats.json 發佈失敗")
+        return 1
+    print(f"{'訊號':<12}{'樣本':>9}{'10日勝率':>9}{'10日均報酬':>11}{'ATR×3命中':>10}{'到價天數':>9}")
+    for key, entry in stats["signals"].items():
+        r = entry["returns"].get(str(WIN_HORIZON), {})
+        t = entry["targets"].get("atr3", {})
+        print(f"{key:<12}{entry['n']:>9}{(r.get('win') or 0) * 100:>8.1f}%{(r.get('mean') or 0) * 100:>10.2f}%"
+              f"{(t.get('hit') or 0) * 100:>9.1f}%{t.get('days_median') or 0:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+本地 K 線倉庫 (Bar Store)
+每檔股票 × 每個週期存成一個 Parquet 檔，之後只增量抓「最後一根之後」的 K 棒再合併。
+冷啟動抓一次完整歷史，之後每次掃描每檔只需要幾筆資料。
+"""
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import market_data
+
+# ================= ⚙️ 參數設定區 =================
+STORE_DIR = os.environ.get(
+    "MINIKO_BAR_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bar_store")
+)
+TW_TZ = "Asia/Taipei"
+
+# period 字串換算天數 (None = max)
+PERIOD_DAYS = {
+    "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183,
+    "1y": 366, "2y": 731, "5y": 1827, "10y": 3653, "max": None
+}
+
+# Yahoo 分K 可回溯的上限天數，超過就只能整段重抓
+INTRADAY_LIMIT_DAYS = {"1m": 7, "5m": 59, "15m": 59, "30m": 59, "60m": 729, "1h": 729}
+
+# 價格比對容忍度：重疊 K 棒收盤價差超過此值視為除權息還原，整檔重抓
+ADJUST_TOLERANCE = 1e-6
+
+_META_KEY = b"miniko_covered_from"
+# ===============================================
+
+
+def _path(symbol, interval):
+    return os.path.join(STORE_DIR, interval, f"{symbol}.parquet")
+
+
+def _normalize(df):
+    """統一索引為台灣時區、去重、排序，並丟掉全空的列"""
+    if df is None or df.empty: return df
+    df = df.dropna(how='all')
+    if df.empty: return df
+    idx = pd.DatetimeIndex(df.index)
+    idx = idx.tz_localize(TW_TZ) if idx.tz is None else idx.tz_convert(TW_TZ)
+    df = df.set_axis(idx)
+    df = df[~df.index.duplicated(keep='last')]
+    return df.sort_index()
+
+
+def _now():
+    """資料來源的「現在」(重播時為虛擬時鐘)"""
+    return pd.Timestamp(market_data.get_provider().now()).tz_localize(TW_TZ)
+
+
+def _period_start(period, now=None):
+    """回傳 period 對應的起始時間 (None 代表 max)"""
+    now = now if now is not None else _now()
+    days = PERIOD_DAYS.get(period)
+    if days is None: return None
+    return (now - pd.Timedelta(days=days)).normalize()
+
+
+def load_bars(symbol, interval="1d"):
+    """讀取本地 K 線，回傳 (df, covered_from)；沒有檔案則回傳 (None, None)"""
+    path = _path(symbol, interval)
+    if not os.path.exists(path): return None, None
+    try:
+        table = pq.read_table(path)
+        meta = table.schema.metadata or {}
+        covered = meta.get(_META_KEY)
+        covered_from = pd.Timestamp(covered.decode()) if covered and covered != b"max" else None
+        return _normalize(table.to_pandas()), covered_from
+    except Exception:
+        # 檔案毀損就當作冷啟動
+        return None, None
+
+
+def save_bars(symbol, interval, df, covered_from=None):
+    """寫入本地 K 線 (先寫暫存檔再換名，避免寫到一半被讀)"""
+    if df is None or df.empty: return
+    path = _path(symbol, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df)
+    meta = dict(table.schema.metadata or {})
+    meta[_META_KEY] = covered_from.isoformat().encode() if covered_from is not None else b"max"
+    table = table.replace_schema_metadata(meta)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def merge_bars(old, new):
+    """合併新舊 K 線，相同時間以新資料為準"""
+    if old is None or old.empty: return _normalize(new)
+    if new is None or new.empty: return old
+    return _normalize(pd.concat([old, _normalize(new)]))
+
+
+def _needs_full_fetch(stored, covered_from, period, interval, now):
+    """判斷是否需要整段重抓：沒有資料、涵蓋區間不足、或分K 斷層超過 Yahoo 上限"""
+    if stored is None or len(stored) < 2: return True
+    start = _period_start(period, now)
+    if covered_from is not None and (start is None or start < covered_from): return True
+    limit = INTRADAY_LIMIT_DAYS.get(interval)
+    if limit and (now - stored.index[-2]).days >= limit: return True
+    return False
+
+
+def _anchor(stored):
+    """增量抓取的起點：倒數第二根 K 棒 (最後一根可能是盤中未收盤的 K 棒)"""
+    return stored.index[-2]
+
+
+def _is_adjusted(stored, fresh, anchor):
+    """重疊 K 棒收盤價不一致 → Yahoo 做了除權息還原，舊資料作廢"""
+    if anchor not in fresh.index: return False
+    old_close = stored.at[anchor, 'Close']
+    new_close = fresh.at[anchor, 'Close']
+    if pd.isna(old_close) or pd.isna(new_close) or old_close == 0: return False
+    return abs(new_close - old_close) / abs(old_close) > ADJUST_TOLERANCE
+
+
+def _slice_period(df, period, now):
+    start = _period_start(period, now)
+    if df is None or start is None: return df
+    return df[df.index >= start].copy()
+
+
+def _history(symbol, period=None, interval="1d", start=None):
+    return market_data.get_provider().history(symbol, period=period, interval=interval, start=start)
+
+
+def _download(tickers, period=None, interval="1d", start=None):
+    try:
+        return market_data.get_provider().download(tickers, period=period, interval=interval, start=start)
+    except Exception:
+        return None
+
+
+def get_bars(symbol, period="1y", interval="1d"):
+    """
+    取得 K 線 (本地倉庫 + 增量更新)
+    symbol 需含交易所後綴 (如 2330.TW)，抓不到回傳 None；
+    網路異常時退回本地資料，若本地也沒有資料則拋出例外
+    """
+    now = _now()
+    if not market_data.get_provider().cacheable:
+        # 重播等不可快取的來源：直接取資料，不讀寫倉庫
+        fresh = _normalize(_history(symbol, period=period, interval=interval))
+        return _slice_period(fresh, period, now) if fresh is not None and not fresh.empty else None
+    stored, covered_from = load_bars(symbol, interval)
+
+    try:
+        if _needs_full_fetch(stored, covered_from, period, interval, now):
+            fresh = _normalize(_history(symbol, period=period, interval=interval))
+            if fresh is None or fresh.empty:
+                return _slice_period(stored, period, now) if stored is not None else None
+            merged = merge_bars(stored, fresh)
+            save_bars(symbol, interval, merged, _period_start(period, now))
+            return _slice_period(merged, period, now)
+
+        anchor = _anchor(stored)
+        fresh = _normalize(_history(symbol, interval=interval, start=anchor))
+        if fresh is None or fresh.empty:
+            return _slice_period(stored, period, now)
+
+        if _is_adjusted(stored, fresh, anchor):
+            fresh = _normalize(_history(symbol, period=period, interval=interval))
+            if fresh is None or fresh.empty: return _slice_period(stored, period, now)
+            save_bars(symbol, interval, fresh, _period_start(period, now))
+            return _slice_period(fresh, period, now)
+
+        merged = merge_bars(stored, fresh)
+        save_bars(symbol, interval, merged, covered_from)
+        return _slice_period(merged, period, now)
+    except Exception:
+        # 網路異常時退回本地資料；沒有本地資料就把例外交給呼叫端 (重試)
+        if stored is None: raise
+        return _slice_period(stored, period, now)
+
+
+def _split_download(data, tickers):
+    """把 yf.download(group_by='ticker') 的寬表拆成 {ticker: df}"""
+    frames = {}
+    if data is None or data.empty: return frames
+    if isinstance(data.columns, pd.MultiIndex):
+        level0 = set(data.columns.get_level_values(0))
+        for t in tickers:
+            if t in level0:
+                df = _normalize(data[t])
+                if df is not None and not df.empty: frames[t] = df
+    elif len(tickers) == 1:
+        df = _normalize(data)
+        if df is not None and not df.empty: frames[tickers[0]] = df
+    return frames
+
+
+def get_bars_bulk(tickers, period="3mo", interval="1d"):
+    """
+    批次取得多檔 K 線，回傳與 yf.download(group_by='ticker') 相同格式的寬表
+    冷啟動的股票一次整段下載；已有資料的股票依增量起點分組批次下載
+    """
+    now = _now()
+    if not market_data.get_provider().cacheable:
+        fresh = _split_download(_download(tickers, period=period, interval=interval), tickers)
+        frames = {t: _slice_period(fresh[t], period, now) for t in tickers if t in fresh}
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+    stored = {t: load_bars(t, interval) for t in tickers}
+
+    cold, warm = [], {}
+    for t in tickers:
+        df, covered_from = stored[t]
+        if _needs_full_fetch(df, covered_from, period, interval, now):
+            cold.append(t)
+        else:
+            warm.setdefault(_anchor(df), []).append(t)
+
+    result = {}
+    if cold:
+        data = _download(cold, period=period, interval=interval)
+        fresh = _split_download(data, cold)
+        for t in cold:
+            df, covered_from = stored[t]
+            if t in fresh:
+                merged = merge_bars(df, fresh[t])
+                save_bars(t, interval, merged, _period_start(period, now))
+                result[t] = merged
+            elif df is not None:
+                result[t] = df
+
+    for anchor, group in warm.items():
+        data = _download(group, interval=interval, start=anchor)
+        fresh = _split_download(data, group)
+        for t in group:
+            df, covered_from = stored[t]
+            if t not in fresh:
+                result[t] = df
+                continue
+            if _is_adjusted(df, fresh[t], anchor):
+                # 除權息還原：單檔整段重抓
+                try:
+                    result[t] = get_bars(t, period, interval)
+                except Exception:
+                    result[t] = df
+                continue
+            merged = merge_bars(df, fresh[t])
+            save_bars(t, interval, merged, covered_from)
+            result[t] = merged
+
+    frames = {t: _slice_period(result[t], period, now) for t in tickers if t in result}
+    if not frames: return pd.DataFrame()
+    return pd.concat(frames, axis=1)
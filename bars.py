@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+精簡 K 線容器 (Compact Bars)
+全市場掃描不再保留 MultiIndex float64 寬表與一堆指標欄位：
+- Open / High / Low / Close：連續的 float32 (日期 × 股票) 陣列
+- Volume：int64 (缺值記 0，另以 valid 遮罩標示有資料的格子)
+- 所有欄位共用同一組日期索引與代號
+指標的中間值 (9 日高低、TR、布林標準差…) 算在 indicators.Scratch 的暫存陣列裡，不存成欄位。
+"""
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ('Open', 'High', 'Low', 'Close')
+
+
+def fill_gaps(a):
+    """沿時間軸先前補再後補 (停牌日沿用前一日；上市前的格子用第一筆)，回傳新陣列"""
+    a = np.asarray(a)
+    missing = np.isnan(a)
+    if not missing.any(): return a.copy()
+    rows = np.arange(len(a))[:, None]
+    idx = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    first = np.where((~missing).any(axis=0), (~missing).argmax(axis=0), 0)
+    idx = np.where(idx < 0, first, idx)
+    return np.take_along_axis(a, idx, axis=0)
+
+
+class Bars:
+    """(日期 × 股票) 的精簡 K 線；tail() 回傳共用記憶體的視圖"""
+    __slots__ = ('dates', 'tickers', 'open', 'high', 'low', 'close', 'volume', 'valid')
+
+    def __init__(self, dates, tickers, open_, high, low, close, volume, valid=None):
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = pd.Index(tickers)
+        self.open, self.high, self.low, self.close = open_, high, low, close
+        self.volume = volume
+        self.valid = ~np.isnan(close) if valid is None else valid
+
+    @classmethod
+    def from_bulk(cls, bulk, tickers=None):
+        """
+        yf.download(group_by='ticker') 的寬表 → Bars
+        一次只轉一個欄位 (float64 暫存只佔一欄)，單檔下載 (非 MultiIndex) 時需傳入 tickers
+        """
+        if bulk is None or bulk.empty: return None
+        if isinstance(bulk.columns, pd.MultiIndex):
+            def field(f): return bulk.xs(f, axis=1, level=1)
+            names = field('Close').columns
+        else:
+            def field(f): return bulk[[f]]
+            names = [tickers[0] if tickers else 'Close']
+        arrays = {f: np.ascontiguousarray(field(f).to_numpy(dtype=np.float32)) for f in PRICE_FIELDS}
+        vol = field('Volume').to_numpy(dtype=np.float64)
+        volume = np.ascontiguousarray(np.nan_to_num(vol, nan=0.0).astype(np.int64))
+        return cls(bulk.index, names, arrays['Open'], arrays['High'], arrays['Low'], arrays['Close'],
+                   volume, valid=~np.isnan(arrays['Close']))
+
+    @property
+    def shape(self):
+        return self.close.shape
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, a).nbytes for a in ('open', 'high', 'low', 'close', 'volume', 'valid'))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def tail(self, n):
+        """最後 n 根 (視圖，不複製)"""
+        return Bars(self.dates[-n:], self.tickers, self.open[-n:], self.high[-n:], self.low[-n:],
+                    self.close[-n:], self.volume[-n:], self.valid[-n:])
+
+    def filled_volume(self):
+        """成交量依 valid 遮罩前補 / 後補 (float64，與寬表 ffill().bfill() 相同)"""
+        return fill_gaps(np.where(self.valid, self.volume, np.nan))
+
+    def frame(self, ticker):
+        """單一股票的 OHLCV DataFrame (float64；只對入選的候選股才組)"""
+        j = self.tickers.get_loc(ticker)
+        return pd.DataFrame({
+            'Open': self.open[:, j], 'High': self.high[:, j], 'Low': self.low[:, j],
+            'Close': self.close[:, j], 'Volume': np.where(self.valid[:, j], self.volume[:, j], np.nan),
+        }, index=self.dates).astype(float)
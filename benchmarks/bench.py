@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Miniko 效能壓測 (指標 / 訊號 / 掃描)
+用固定種子的合成 K 線 (含跳空、零量日) 跑各階段，新舊實作並列：
+- legacy：改版前的純 pandas 版本 (benchmarks/legacy.py)
+- current：目前線上使用的版本
+- compact：掃描改用 float32 精簡容器 (bars.py)，量測前後的記憶體差異
+每個 (階段, 檔數) 在獨立子程序執行，量測牆鐘時間、Python 配置記憶體峰值 (tracemalloc) 與 RSS 峰值
+
+用法：
+  python benchmarks/bench.py                       # 全部跑一次，結果寫到 benchmarks/latest.json
+  python benchmarks/bench.py --sizes 8 400 --only scan
+  python benchmarks/bench.py --save-baseline       # 更新 benchmarks/baseline.json (要進版控)
+  python benchmarks/bench.py --compare             # 與 baseline 比較，退步超過門檻時 exit 1
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import resource
+import statistics
+import tracemalloc
+import multiprocessing as mp
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+import legacy
+
+# ================= ⚙️ 參數設定區 =================
+SIZES = (8, 400, 2000)           # 監控名單 / 戰情室掃描 / 全市場
+REPEAT = 3
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+LATEST_PATH = os.path.join(HERE, "latest.json")
+REGRESSION_PCT = 20.0            # 比 baseline 慢 / 胖超過此比例視為退步
+# ===============================================
+
+
+# --- 資料準備 ---
+def _daily(n): return synthetic.make_frames(n, "1d", seed=n)
+def _intraday(n, interval): return synthetic.make_frames(n, interval, seed=n + 1)
+
+
+def _with_indicators(calc, n):
+    return {s: calc(df.copy()) for s, df in _daily(n).items()}
+
+
+# --- 各階段 (setup 回傳資料，run 只計時這部分) ---
+def _calc_each(calc):
+    def run(frames):
+        for df in frames.values(): calc(df.copy())
+    return run
+
+
+def _sar_each(frames):
+    for df in frames.values():
+        legacy.calculate_sar(df['High'].values, df['Low'].values)
+
+
+def _sar_panel(arrays):
+    import indicators
+    indicators.calc_sar(*arrays)
+
+
+def _signals_each(check):
+    def run(frames):
+        for s, df in frames.items(): check(df, s, s)
+    return run
+
+
+def _scan_legacy(bulk):
+    candidates = []
+    for code in bulk.columns.get_level_values(0).unique():
+        df = bulk[code].copy()
+        if df.empty or df['Close'].isnull().all(): continue
+        df = legacy.page_indicators(df)
+        score, reasons = legacy.check_miniko_strategy(code, df)
+        if score > 0: candidates.append((code, score))
+    candidates.sort(key=lambda x: x[1], reverse=True)
+    return candidates[:20]
+
+
+def _scan_current(bulk):
+    import indicators
+    import screener
+    panel = indicators.to_panel(bulk)
+    ind = indicators.calc_panel_indicators(panel)
+    return screener.top_candidates(screener.score_panel(panel, ind), 20)
+
+
+def _scan_compact(bulk):
+    import bars
+    import screener
+    compact = bars.Bars.from_bulk(bulk)
+    return screener.top_candidates(screener.score_bars(compact), 20)
+
+
+def _sar_arrays(n):
+    panel = pd.concat({s: df[['High', 'Low']] for s, df in _daily(n).items()}, axis=1)
+    return (panel.xs('High', axis=1, level=1).values, panel.xs('Low', axis=1, level=1).values)
+
+
+def _current_calc():
+    import cloud_bot
+    return cloud_bot.calc_indicators
+
+
+def _current_check():
+    import cloud_bot
+    return cloud_bot.check_conditions
+
+
+# 名稱 → (setup(n), run 產生器)
+STAGES = {
+    "indicators_1d.legacy":  (_daily, lambda: _calc_each(legacy.calc_indicators)),
+    "indicators_1d.current": (_daily, lambda: _calc_each(_current_calc())),
+    "indicators_60m.legacy":  (lambda n: _intraday(n, "60m"), lambda: _calc_each(legacy.calc_indicators)),
+    "indicators_60m.current": (lambda n: _intraday(n, "60m"), lambda: _calc_each(_current_calc())),
+    "indicators_30m.legacy":  (lambda n: _intraday(n, "30m"), lambda: _calc_each(legacy.calc_indicators)),
+    "indicators_30m.current": (lambda n: _intraday(n, "30m"), lambda: _calc_each(_current_calc())),
+    "sar.legacy":  (_daily, lambda: _sar_each),
+    "sar.current": (_sar_arrays, lambda: _sar_panel),
+    "signals.legacy":  (lambda n: _with_indicators(legacy.calc_indicators, n), lambda: _signals_each(legacy.check_conditions)),
+    "signals.current": (lambda n: _with_indicators(_current_calc(), n), lambda: _signals_each(_current_check())),
+    "scan.legacy":  (lambda n: synthetic.make_bulk(_daily(n)), lambda: _scan_legacy),
+    "scan.current": (lambda n: synthetic.make_bulk(_daily(n)), lambda: _scan_current),
+    "scan.compact": (lambda n: synthetic.make_bulk(_daily(n)), lambda: _scan_compact),
+}
+
+
+# --- 量測 ---
+def _rss_kb(field):
+    """讀 /proc/self/status 的 VmRSS / VmHWM (非 Linux 退回 ru_maxrss)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reset_peak_rss():
+    """把 VmHWM 歸零到目前 RSS (Linux 4.0+)，讓峰值只反映被量測的階段"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _measure(name, n, repeat):
+    setup, make_run = STAGES[name]
+    data = setup(n)
+    run = make_run()
+    run(data)   # 暖機 (JIT 編譯、import)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        run(data)
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    exact = _reset_peak_rss()
+    rss_before = _rss_kb("VmRSS")
+    tracemalloc.start()
+    run(data)
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak = _rss_kb("VmHWM")
+
+    return {
+        "wall_min_s": min(times),
+        "wall_median_s": statistics.median(times),
+        "alloc_peak_mb": alloc_peak / 2**20,
+        "rss_peak_mb": rss_peak / 1024,
+        "rss_delta_mb": max(rss_peak - rss_before, 0) / 1024 if exact else None,
+    }
+
+
+def _child(name, n, repeat, queue):
+    try:
+        queue.put(_measure(name, n, repeat))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure_isolated(name, n, repeat):
+    """每個階段在新的子程序跑，RSS 互不干擾"""
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, n, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def _meta():
+    meta = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+    try:
+        import numba
+        meta["numba"] = numba.__version__
+    except ImportError:
+        meta["numba"] = None
+    if meta["cpu_count"] == 1:
+        meta["note"] = "單核環境量測：各階段都是單程序，數字可比；但不代表多核機器上的絕對時間"
+    return meta
+
+
+def run_all(sizes, only=None, repeat=REPEAT):
+    results = {}
+    for n in sizes:
+        for name in STAGES:
+            if only and not any(o in name for o in only): continue
+            key = f"{name}@{n}"
+            print(f"⏱️ {key:<32}", end="", flush=True)
+            r = measure_isolated(name, n, repeat)
+            results[key] = r
+            if "error" in r:
+                print(f" ❌ {r['error']}")
+            else:
+                rss = r['rss_delta_mb'] if r['rss_delta_mb'] is not None else r['rss_peak_mb']
+                print(f" {r['wall_median_s']*1000:10.1f} ms  alloc {r['alloc_peak_mb']:8.1f} MB  rss +{rss:7.1f} MB")
+    return {"meta": _meta(), "results": results}
+
+
+def compare(current, baseline, threshold=REGRESSION_PCT):
+    """列出與 baseline 的差異，回傳退步的項目"""
+    regressions = []
+    print(f"\n{'階段@檔數':<32}{'baseline ms':>12}{'now ms':>10}{'Δ時間':>9}{'Δalloc':>9}")
+    for key, now in current["results"].items():
+        base = baseline["results"].get(key)
+        if not base:
+            print(f"{key:<32}{'(baseline 沒有這一項，請重新 --save-baseline)':>12}")
+            continue
+        if "error" in base or "error" in now: continue
+        dt = (now["wall_median_s"] / base["wall_median_s"] - 1) * 100 if base["wall_median_s"] else 0.0
+        da = (now["alloc_peak_mb"] / base["alloc_peak_mb"] - 1) * 100 if base["alloc_peak_mb"] else 0.0
+        flag = ""
+        if dt > threshold or da > threshold:
+            flag = " ⚠️"
+            regressions.append(key)
+        print(f"{key:<32}{base['wall_median_s']*1000:12.1f}{now['wall_median_s']*1000:10.1f}{dt:+8.0f}%{da:+8.0f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Miniko 效能壓測")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--only", nargs="+", help="只跑名稱含這些字的階段 (如 scan sar)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_PCT)
+    args = parser.parse_args(argv)
+
+    report = run_all(args.sizes, args.only, args.repeat)
+    path = BASELINE_PATH if args.save_baseline else LATEST_PATH
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"\n💾 已寫入 {os.path.relpath(path)}")
+
+    if args.compare:
+        if not os.path.exists(BASELINE_PATH):
+            print("⚠️ 尚無 baseline.json，請先 --save-baseline")
+            return 1
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 退步 {len(regressions)} 項：{', '.join(regressions)}")
+            return 1
+        print("\n✅ 沒有退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
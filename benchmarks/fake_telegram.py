@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+本機假 Telegram 伺服器 (測試 notifier.py 用，不會真的發訊息)
+- POST /bot<token>/sendMessage：收下訊息並記錄，行為比照 Telegram：
+  超過 4096 字回 400、同一聊天室發太快回 429 + retry_after
+- 可注入隨機 502 錯誤，測試退避重試；script 可預先排定接下來幾次的回應狀態碼 (429 / 400 / 502…)
+- GET /messages：目前收到的所有訊息 (JSON)
+
+用法：
+  python benchmarks/fake_telegram.py --port 8081 --rate 1 --fail 0.1
+  MINIKO_TELEGRAM_API=http://127.0.0.1:8081 python cloud_bot.py
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================= ⚙️ 參數設定區 =================
+MAX_CHARS = 4096
+CHAT_RATE = 1.0        # 同一聊天室每秒最多幾則 (超過回 429)
+RETRY_AFTER = 1
+# ===============================================
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """收到的訊息存在 self.messages；rate=0 代表不限速"""
+    daemon_threads = True
+
+    def __init__(self, port=0, rate=CHAT_RATE, fail_rate=0.0, verbose=False):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.rate, self.fail_rate, self.verbose = rate, fail_rate, verbose
+        self.messages = []
+        self.script = []   # 依序強制回應的狀態碼 (用完才照常處理)
+        self.requests = self.throttled = self.failed = 0
+        self._last = {}   # chat_id → 上次收下的時間
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def accept(self, payload):
+        """回傳 (HTTP 狀態, 回應內容)"""
+        with self._lock:
+            self.requests += 1
+            text, chat = payload.get("text", ""), payload.get("chat_id")
+            status = self.script.pop(0) if self.script else 200
+            if status != 200:   # 200 = 這一次照常處理
+                return _scripted(status)
+            if random.random() < self.fail_rate:
+                self.failed += 1
+                return 502, {"ok": False, "description": "Bad Gateway"}
+            if not text:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message text is empty"}
+            if len(text.encode("utf-16-le")) // 2 > MAX_CHARS:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message is too long"}
+            now = time.monotonic()
+            if self.rate and now - self._last.get(chat, -1e9) < 1.0 / self.rate:
+                self.throttled += 1
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                             "parameters": {"retry_after": RETRY_AFTER}}
+            self._last[chat] = now
+            self.messages.append({"chat_id": chat, "text": text, "at": time.time()})
+            if self.verbose: print(f"📨 [{chat}] {len(text)} 字\n{text}\n")
+            return 200, {"ok": True, "result": {"message_id": len(self.messages)}}
+
+
+def _scripted(status):
+    if status == 429:
+        return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                     "parameters": {"retry_after": RETRY_AFTER}}
+    if status >= 500:
+        return status, {"ok": False, "description": "Bad Gateway"}
+    return status, {"ok": False, "error_code": status, "description": "Bad Request: chat not found"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive，才測得出連線重用
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not self.path.endswith("/sendMessage"):
+            self.rfile.read(length)
+            self._reply(404, {"ok": False, "description": "Not Found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {"ok": False, "description": "Bad Request: invalid JSON"})
+            return
+        self._reply(*self.server.accept(payload))
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/messages":
+            self._reply(404, {"ok": False, "description": "Not Found"})
+            return
+        with self.server._lock:
+            self._reply(200, {"ok": True, "messages": list(self.server.messages),
+                              "requests": self.server.requests, "throttled": self.server.throttled,
+                              "failed": self.server.failed})
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機假 Telegram 伺服器")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=float, default=CHAT_RATE, help="每聊天室每秒上限 (0 = 不限)")
+    parser.add_argument("--fail", type=float, default=0.0, help="隨機 502 的機率")
+    args = parser.parse_args(argv)
+    server = FakeTelegram(args.port, rate=args.rate, fail_rate=args.fail, verbose=True)
+    print(f"🧪 假 Telegram 伺服器：{server.url} (MINIKO_TELEGRAM_API={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+舊版純 pandas 實作 (凍結副本，只給壓測當「改版前」對照組，請勿在正式程式引用)
+來源：cloud_bot.calc_indicators / check_conditions、app.calculate_sar、
+個股戰情室頁面的 calculate_indicators / check_miniko_strategy、app.get_micro_wave (向量化之前的版本)
+唯一改動：fillna(method=...) 在新版 pandas 已移除，改成 ffill() / bfill()
+"""
+import numpy as np
+import pandas as pd
+
+
+def calc_indicators(df):
+    """cloud_bot / app 舊版：KD 用 Python 迴圈遞迴"""
+    if df is None or df.empty: return df
+
+    for ma in [5, 10, 20, 60, 120]:
+        df[f'MA{ma}'] = df['Close'].rolling(ma).mean()
+    df['SMA22'] = df['Close'].rolling(22).mean()
+
+    df['9_High'] = df['High'].rolling(9).max()
+    df['9_Low'] = df['Low'].rolling(9).min()
+    df['RSV'] = (df['Close'] - df['9_Low']) / (df['9_High'] - df['9_Low']) * 100
+    k, d = [50], [50]
+    for rsv in df['RSV'].fillna(50):
+        k.append(k[-1]*2/3 + rsv*1/3)
+        d.append(d[-1]*2/3 + k[-1]*1/3)
+    df['K'] = k[1:]
+    df['D'] = d[1:]
+
+    exp12 = df['Close'].ewm(span=12, adjust=False).mean()
+    exp26 = df['Close'].ewm(span=26, adjust=False).mean()
+    df['DIF'] = exp12 - exp26
+    df['MACD'] = df['DIF'].ewm(span=9, adjust=False).mean()
+    df['MACD_Hist'] = df['DIF'] - df['MACD']
+
+    df['Vol_MA5'] = df['Volume'].rolling(5).mean()
+    df['TR'] = np.maximum(df['High'] - df['Low'], np.abs(df['High'] - df['Close'].shift(1)))
+    df['ATR'] = df['TR'].rolling(14).mean()
+    return df
+
+
+def calculate_sar(high, low, accel=0.02, max_accel=0.2):
+    """app 舊版 SAR：逐根 Python 迴圈"""
+    sar = np.zeros(len(high))
+    trend = np.zeros(len(high))
+    ep = np.zeros(len(high))
+    af = np.zeros(len(high))
+    trend[0] = 1
+    sar[0] = low[0]
+    ep[0] = high[0]
+    af[0] = accel
+    for i in range(1, len(high)):
+        sar[i] = sar[i-1] + af[i-1] * (ep[i-1] - sar[i-1])
+        if trend[i-1] == 1:
+            if low[i] < sar[i]:
+                trend[i] = -1
+                sar[i] = ep[i-1]
+                ep[i] = low[i]
+                af[i] = accel
+            else:
+                trend[i] = 1
+                if high[i] > ep[i-1]:
+                    ep[i] = high[i]
+                    af[i] = min(af[i-1] + accel, max_accel)
+                else:
+                    ep[i] = ep[i-1]
+                    af[i] = af[i-1]
+                sar[i] = min(sar[i], low[i-1])
+                if i > 1: sar[i] = min(sar[i], low[i-2])
+        else:
+            if high[i] > sar[i]:
+                trend[i] = 1
+                sar[i] = ep[i-1]
+                ep[i] = high[i]
+                af[i] = accel
+            else:
+                trend[i] = -1
+                if low[i] < ep[i-1]:
+                    ep[i] = low[i]
+                    af[i] = min(af[i-1] + accel, max_accel)
+                else:
+                    ep[i] = ep[i-1]
+                    af[i] = af[i-1]
+                sar[i] = max(sar[i], high[i-1])
+                if i > 1: sar[i] = max(sar[i], high[i-2])
+    return sar
+
+
+def check_conditions(df, symbol, name):
+    """cloud_bot 舊版 6 大訊號"""
+    today = df.iloc[-1]
+    prev = df.iloc[-2]
+    signals = []
+
+    turnover = today['Close'] * today['Volume']
+    if turnover > 30000000 and today['Close'] > prev['Close']:
+        signals.append(f"🔥 <b>主力權證大單</b>")
+
+    is_sop = (prev['MACD_Hist'] <= 0 and today['MACD_Hist'] > 0) and \
+             (today['Close'] > today['SMA22']) and \
+             (today['K'] > today['D'])
+    if is_sop:
+        signals.append(f"✅ <b>SOP 起漲訊號</b>")
+
+    k_max_10 = df['K'].rolling(10).max().iloc[-1]
+    if (k_max_10 > 70) and (40 <= today['K'] <= 60) and (today['Close'] > today['MA20']):
+        signals.append(f"☕ <b>High C 高檔整理</b>")
+
+    if today['K'] < 40 and today['K'] > prev['K'] and today['K'] > today['D']:
+        signals.append(f"💧 <b>底部咕嚕咕嚕</b>")
+
+    if (today['Volume'] > today['Vol_MA5'] * 1.5) and (today['Close'] > prev['Close'] * 1.03):
+        signals.append(f"🚀 <b>出量突破</b>")
+
+    recent = df.iloc[-10:]
+    is_strong = (recent['Close'] >= recent['Open']) | (recent['Close'] > recent['Close'].shift(1))
+    consecutive = 0
+    for x in reversed(is_strong.values):
+        if x: consecutive += 1
+        else: break
+    if 3 <= consecutive <= 10:
+        signals.append(f"🛡️ <b>主力連買({consecutive}天)</b>")
+    return signals
+
+
+def page_indicators(df):
+    """個股戰情室舊版 calculate_indicators"""
+    try:
+        if df.empty: return df
+        df['Low_9'] = df['Low'].rolling(9).min()
+        df['High_9'] = df['High'].rolling(9).max()
+        df['RSV'] = (df['Close'] - df['Low_9']) / (df['High_9'] - df['Low_9']) * 100
+        df['K'] = df['RSV'].ewm(com=2).mean()
+        df['D'] = df['K'].ewm(com=2).mean()
+
+        exp12 = df['Close'].ewm(span=12, adjust=False).mean()
+        exp26 = df['Close'].ewm(span=26, adjust=False).mean()
+        df['DIF'] = exp12 - exp26
+        df['MACD'] = df['DIF'].ewm(span=9, adjust=False).mean()
+        df['MACD_Hist'] = df['DIF'] - df['MACD']
+
+        df['MA5'] = df['Close'].rolling(5).mean()
+        df['MA20'] = df['Close'].rolling(20).mean()
+        df['SAR_Bull'] = (df['Close'] > df['MA20']) & (df['MACD_Hist'] > 0)
+        return df
+    except: return pd.DataFrame()
+
+
+def check_miniko_strategy(stock_id, df):
+    """個股戰情室舊版逐檔計分"""
+    if df is None or len(df) < 30: return 0, []
+    if df.isnull().values.any():
+        df = df.ffill().bfill()
+
+    today = df.iloc[-1]
+    prev = df.iloc[-2]
+
+    vol_ma5 = df['Volume'].rolling(5).mean().iloc[-1]
+    if vol_ma5 == 0: vol_ma5 = 1
+    is_volume_surge = today['Volume'] > (vol_ma5 * 1.5)
+
+    min_volume = 1000000
+    if today['Close'] > 500: min_volume = 500000
+
+    if (today['Volume'] < min_volume) and (not is_volume_surge):
+        return 0, []
+
+    score = 0
+    reasons = []
+
+    macd_flip = (prev['MACD_Hist'] <= 0) and (today['MACD_Hist'] > 0)
+    kd_cross = (prev['K'] < prev['D']) and (today['K'] > today['D'])
+    sar_bull = today.get('SAR_Bull', False)
+
+    if macd_flip and sar_bull and kd_cross:
+        score += 1000
+        reasons.append("👑【SOP】三線合一(絕對優先)")
+
+    estimated_turnover = today['Close'] * today['Volume']
+    is_warrant_whale = estimated_turnover > 20000000
+    is_attacking = today['Close'] > prev['Close']
+
+    if is_warrant_whale and is_attacking:
+        score += 30
+        reasons.append("🔥權證大戶(>500萬)")
+    if is_volume_surge:
+        score += 20
+        reasons.append(f"爆量({int(today['Volume']/vol_ma5)}倍)")
+
+    max_k_recent = df['K'].rolling(10).max().iloc[-1]
+    is_high_consolidation = False
+    price_change_5d = (today['Close'] - df['Close'].iloc[-6]) / df['Close'].iloc[-6]
+
+    if (max_k_recent > 70) and (40 <= today['K'] <= 60) and (abs(price_change_5d) < 0.04):
+        is_high_consolidation = True
+        score += 10
+        reasons.append("高檔強勢整理")
+
+    if not is_high_consolidation:
+        kd_low = today['K'] < 50
+        k_hook = (today['K'] > prev['K'])
+        if kd_low and k_hook and (today['Close'] > today['MA5']):
+            score += 10
+            reasons.append("底部咕嚕咕嚕")
+
+    recent_closes = df['Close'].iloc[-10:].values
+    recent_opens = df['Open'].iloc[-10:].values
+    consecutive = 0
+    for i in range(len(recent_closes)-1, 0, -1):
+        if (recent_closes[i] >= recent_opens[i]) or (recent_closes[i] > recent_closes[i-1]):
+            consecutive += 1
+        else: break
+
+    if 3 <= consecutive <= 10:
+        score += 25
+        reasons.append(f"主力連買{consecutive}天")
+
+    return score, reasons
+
+
+def get_micro_wave(df, timeframe="日"):
+    """app / 個股戰情室舊版微波浪 (只看最後一根)"""
+    if df is None or len(df) < 15: return "資料不足(新股)"
+    price = df['Close'].iloc[-1]
+    ma20 = df['MA20'].iloc[-1] if 'MA20' in df.columns and not pd.isna(df['MA20'].iloc[-1]) else price
+    ma60 = df['MA60'].iloc[-1] if 'MA60' in df.columns and not pd.isna(df['MA60'].iloc[-1]) else price
+    k = df['K'].iloc[-1]
+    prev_k = df['K'].iloc[-2]
+    hist = df['MACD_Hist'].iloc[-1]
+    prev_hist = df['MACD_Hist'].iloc[-2]
+    trend = "Bull" if price >= ma60 else "Bear"
+    wave_label = ""
+    if trend == "Bull":
+        if price > ma20:
+            if hist > 0 and hist > prev_hist:
+                if k > 80: wave_label = "3-5 (噴出末段)"
+                else: wave_label = "3-3 (主升急漲)"
+            elif hist > 0 and hist < prev_hist: wave_label = "3-a (高檔震盪)"
+            else: wave_label = "3-1 (初升/轉折)"
+        else:
+            if price > ma60:
+                if k < 20: wave_label = "4-c (修正末端)"
+                elif k < prev_k: wave_label = "4-a (初跌修正)"
+                else: wave_label = "4-b (反彈逃命)"
+    else:
+        if price < ma20:
+            if k < 20: wave_label = "C-5 (趕底急殺)"
+            else: wave_label = "C-3 (主跌段)"
+        else:
+            if k > 80: wave_label = "B-c (反彈高點)"
+            else: wave_label = "B-a (跌深反彈)"
+    return wave_label
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+壓測用合成 K 線 (固定亂數種子，每次產生完全相同的資料)
+- 隨機漫步價格，含跳空缺口
+- 隨機零成交量 (停牌 / 冷門股) 的日子
+- 日 K：一年份交易日；分 K：一個月台股盤中 (09:00 ~ 13:30) 的 60 分 / 30 分 K
+"""
+import numpy as np
+import pandas as pd
+
+TW_TZ = "Asia/Taipei"
+DAILY_BARS = 245          # 約一年的交易日
+INTRADAY_DAYS = 21        # 約一個月的交易日
+GAP_PROB = 0.03           # 跳空機率
+ZERO_VOLUME_PROB = 0.02   # 零成交量機率
+
+
+def symbols(n):
+    """n 個假代號 (上市 / 上櫃交錯)"""
+    return [f"{1000 + i:04d}{'.TW' if i % 3 else '.TWO'}" for i in range(n)]
+
+
+def _walk(rng, n, start):
+    """一檔的 OHLCV 陣列 (n 根)"""
+    ret = rng.normal(0.0005, 0.02, n)
+    gaps = rng.random(n) < GAP_PROB
+    ret[gaps] += rng.choice([-1, 1], gaps.sum()) * rng.uniform(0.03, 0.08, gaps.sum())
+    close = start * np.exp(np.cumsum(ret))
+    open_ = np.empty(n)
+    open_[0] = start
+    open_[1:] = close[:-1] * (1 + np.where(gaps[1:], ret[1:] * 0.7, rng.normal(0, 0.003, n - 1)))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread * rng.random(n)
+    volume = np.round(rng.lognormal(14, 1.0, n), -3)
+    volume[rng.random(n) < ZERO_VOLUME_PROB] = 0
+    return open_, high, low, close, volume
+
+
+def _sessions(end, days):
+    return pd.bdate_range(end=end, periods=days, tz=TW_TZ)
+
+
+def _intraday_index(end, minutes):
+    """台股盤中 K 棒起點 (09:00 起，最後一根可不滿一根)"""
+    per_day = int(np.ceil(270 / minutes))
+    offsets = pd.to_timedelta(np.arange(per_day) * minutes + 9 * 60, unit="min")
+    days = _sessions(end, INTRADAY_DAYS)
+    return pd.DatetimeIndex([d + o for d in days for o in offsets])
+
+
+def make_frames(n_symbols, interval="1d", seed=0, end="2026-10-16"):
+    """回傳 {代號: OHLCV DataFrame}"""
+    rng = np.random.default_rng(seed)
+    if interval == "1d":
+        index = _sessions(end, DAILY_BARS)
+    else:
+        index = _intraday_index(end, {"60m": 60, "30m": 30}[interval])
+    frames = {}
+    for sym in symbols(n_symbols):
+        o, h, l, c, v = _walk(rng, len(index), rng.uniform(20, 900))
+        frames[sym] = pd.DataFrame({'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v}, index=index)
+    return frames
+
+
+def make_bulk(frames):
+    """組成 yf.download(group_by='ticker') 的寬表格式"""
+    return pd.concat(frames, axis=1)
@@ -1,12 +1,24 @@
 # -*- coding: utf-8 -*-
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import requests
-import time
 import sys
+import threading
 import os
-from datetime import datetime, timedelta
+import bar_store
+import indicators
+import fetcher
+import universe
+import scheduler
+import signal_rules
+import streaming
+import market_data
+import metrics
+import snapshot
+import backtest
+import notifier
+import state
+import resample
+import swings
 
 # ================= ⚙️ 參數設定區 =================
 # 在雲端環境請使用環境變數，本地測試可直接填入字串
@@ -20,37 +32,47 @@ WATCH_LIST = {
 }
 # ===============================================
 
-def send_telegram(message):
-    """發送 Telegram 訊息 (HTML 格式)"""
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": TELEGRAM_CHAT_ID, 
-            "text": message, 
-            "parse_mode": "HTML", 
-            "disable_web_page_preview": True
-        }
-        requests.post(url, json=payload)
-    except Exception as e:
-        print(f"❌ Telegram 發送失敗：{e}")
+def send_telegram(message, report=None, on_done=None):
+    """
+    發送 Telegram 訊息 (HTML 格式)：排進背景佇列，過長自動分則，不會卡住監控迴圈
+    on_done(ok) 在實際送達 (或放棄) 後由發送執行緒呼叫
+    """
+    notifier.get_notifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID).send(message, report=report, on_done=on_done)
+
+def send_telegram_batch(messages, report=None, on_done=None):
+    """同一輪觸發的多則警報合併成一則發送"""
+    notifier.get_notifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID).send_batch(messages, report=report, on_done=on_done)
 
-def get_data(symbol, period="1y", interval="1d"):
+def _fetch_data(symbol, period="1y", interval="1d"):
+    """依交易所索引決定 .TW / .TWO (未知才兩個都試)；網路異常直接拋出讓上層重試"""
+    df, _ = universe.resolve_fetch(
+        symbol, lambda s: bar_store.get_bars(s, period=period, interval=interval))
+    return df
+
+def get_data(symbol, period="1y", interval="1d", report=None):
     """
-    獲取指定時間頻率的K線數據 (支援多週期)
+    獲取指定時間頻率的K線數據 (支援多週期，走本地 K 線倉庫增量更新，限速 + 抖動重試)
     """
     try:
-        # 嘗試上市
-        ticker = yf.Ticker(symbol + ".TW")
-        df = ticker.history(period=period, interval=interval)
-        
-        # 如果上市抓不到，嘗試上櫃
-        if df.empty:
-            ticker = yf.Ticker(symbol + ".TWO")
-            df = ticker.history(period=period, interval=interval)
-        
-        if df.empty: return None
-        return df
-    except: return None
+        with metrics.stage("fetch", report=report, symbol=symbol, interval=interval):
+            df = fetcher.call_with_retry(_fetch_data, symbol, period, interval)
+    except Exception:
+        return None   # 失敗已由 metrics.stage 記錄
+    if df is None or df.empty:
+        metrics.inc("miniko_empty_frames_total", interval=interval, report=report)
+        metrics.event("empty_frame", symbol=symbol, interval=interval, report=report)
+        return None
+    return df
+
+def fetch_watchlist(codes, frames, report=None):
+    """
+    一次平行抓齊多檔 × 多週期的 K 線
+    frames 為 [(period, interval), ...]，回傳 {(code, period, interval): df 或 None}
+    """
+    jobs = [(code, period, interval, report) for code in codes for period, interval in frames]
+    with metrics.stage("fetch_batch", report=report, jobs=len(jobs)):
+        results = fetcher.fetch_many(get_data, jobs)
+    return {job[:3]: df for job, df in results.items()}
 
 def calc_indicators(df):
     """計算技術指標"""
@@ -62,15 +84,7 @@ def calc_indicators(df):
     df['SMA22'] = df['Close'].rolling(22).mean() 
     
     # KD (9,3,3)
-    df['9_High'] = df['High'].rolling(9).max()
-    df['9_Low'] = df['Low'].rolling(9).min()
-    df['RSV'] = (df['Close'] - df['9_Low']) / (df['9_High'] - df['9_Low']) * 100
-    k, d = [50], [50]
-    for rsv in df['RSV'].fillna(50):
-        k.append(k[-1]*2/3 + rsv*1/3)
-        d.append(d[-1]*2/3 + k[-1]*1/3)
-    df['K'] = k[1:]
-    df['D'] = d[1:]
+    df['RSV'], df['K'], df['D'] = indicators.calc_kd(df['High'], df['Low'], df['Close'])
     
     # MACD (12,26,9)
     exp12 = df['Close'].ewm(span=12, adjust=False).mean()
@@ -81,67 +95,24 @@ def calc_indicators(df):
     
     # 量能與 ATR
     df['Vol_MA5'] = df['Volume'].rolling(5).mean()
-    df['TR'] = np.maximum(df['High'] - df['Low'], np.abs(df['High'] - df['Close'].shift(1)))
-    df['ATR'] = df['TR'].rolling(14).mean()
+    tr = np.maximum(df['High'] - df['Low'], np.abs(df['High'] - df['Close'].shift(1)))
+    df['ATR'] = tr.rolling(14).mean()
     
     return df
 
 def get_fibonacci(df):
-    """計算費波那契回檔位"""
-    high = df['High'].iloc[-120:].max()
-    low = df['Low'].iloc[-120:].min()
-    diff = high - low
-    return {
-        "0.200": high - (diff * 0.2),
-        "0.382": high - (diff * 0.382),
-        "0.618": high - (diff * 0.618)
-    }
+    """計算費波那契回檔位 (錨定最近一段波段，見 swings.py)"""
+    return swings.levels(df)
 
 def check_conditions(df, symbol, name):
-    """檢核 6 大核心訊號"""
-    today = df.iloc[-1]
-    prev = df.iloc[-2]
-    signals = []
-    
-    # 1. 主力權證大單 (>3000萬 & 漲)
-    turnover = today['Close'] * today['Volume']
-    if turnover > 30000000 and today['Close'] > prev['Close']:
-        signals.append(f"🔥 <b>主力權證大單</b>")
-
-    # 2. SOP 起漲
-    is_sop = (prev['MACD_Hist'] <= 0 and today['MACD_Hist'] > 0) and \
-             (today['Close'] > today['SMA22']) and \
-             (today['K'] > today['D'])
-    if is_sop:
-        signals.append(f"✅ <b>SOP 起漲訊號</b>")
-
-    # 3. High C 高檔整理
-    k_max_10 = df['K'].rolling(10).max().iloc[-1]
-    if (k_max_10 > 70) and (40 <= today['K'] <= 60) and (today['Close'] > today['MA20']):
-         signals.append(f"☕ <b>High C 高檔整理</b>")
-
-    # 4. 底部咕嚕咕嚕
-    if today['K'] < 40 and today['K'] > prev['K'] and today['K'] > today['D']:
-        signals.append(f"💧 <b>底部咕嚕咕嚕</b>")
-        
-    # 5. 出量突破
-    if (today['Volume'] > today['Vol_MA5'] * 1.5) and (today['Close'] > prev['Close'] * 1.03):
-        signals.append(f"🚀 <b>出量突破</b>")
-
-    # 6. 主力連買
-    recent = df.iloc[-10:]
-    is_strong = (recent['Close'] >= recent['Open']) | (recent['Close'] > recent['Close'].shift(1))
-    consecutive = 0
-    for x in reversed(is_strong.values):
-        if x: consecutive += 1
-        else: break
-    if 3 <= consecutive <= 10:
-        signals.append(f"🛡️ <b>主力連買({consecutive}天)</b>")
-        
-    return signals
-
-def analyze_strategy(df):
-    """計算策略數據"""
+    """檢核 6 大核心訊號 (規則見 signal_rules.py)"""
+    return signal_rules.evaluate(df)
+
+def analyze_strategy(df, signals=None):
+    """
+    計算策略數據
+    有回測結果 (backtest.py) 時，勝率 / 目標命中率改用今天觸發訊號的歷史實績，否則沿用經驗加權分數
+    """
     today = df.iloc[-1]
     fib = get_fibonacci(df)
     atr = today['ATR'] if not pd.isna(today['ATR']) else today['Close'] * 0.02
@@ -149,6 +120,22 @@ def analyze_strategy(df):
     buy_aggressive = max(today['MA5'], fib['0.200']) 
     buy_conservative = max(today['MA20'], fib['0.382']) 
     
+    target_price = today['Close'] + (atr * 3)
+    bt = backtest.stats_for([signal_rules.signal_key(s) for s in signals or []])
+    if bt is not None:
+        # 歷史實績：WIN_HORIZON 日後收高的比例、ATR×3 目標命中率；積極/拉回門檻以一般交易日為基準
+        base = backtest.signal_summary("all") or bt
+        return {
+            "buy_agg": buy_aggressive,
+            "buy_con": buy_conservative,
+            "win_rate": bt['win'],
+            "target": target_price,
+            "prob_target": bt['hit'],
+            "backtest": bt,
+            "levels": (base['win'] + 10, base['win']),
+        }
+
+    backtest.fallback("cloud_bot")
     score = 50
     if today['Close'] > today['MA20']: score += 10 
     if today['MA20'] > today['MA60']: score += 10 
@@ -157,7 +144,6 @@ def analyze_strategy(df):
     if today['Volume'] > today['Vol_MA5']: score += 5 
     win_rate = min(score, 90)
     
-    target_price = today['Close'] + (atr * 3)
     prob_target = int(win_rate * 0.8)
     
     return {
@@ -165,217 +151,323 @@ def analyze_strategy(df):
         "buy_con": buy_conservative,
         "win_rate": win_rate,
         "target": target_price,
-        "prob_target": prob_target
+        "prob_target": prob_target,
+        "backtest": None,
+        "levels": (80, 60),
     }
 
+def format_backtest(bt):
+    """回測實績一行文字"""
+    label = signal_rules.SIGNAL_NAMES.get(bt['key'], "一般交易日")
+    days = f"，中位 {bt['days']:.0f} 天" if bt['days'] else ""
+    return (f"📈 回測({label}, n={bt['n']}): {backtest.WIN_HORIZON}日勝率 {bt['win']}% / "
+            f"均報酬 {bt['ret']:+.2f}% / ATR×3 命中 {bt['hit']}%{days}\n")
+
 # ==========================================
 # 🅱️ 模式 B: 盤中哨兵 (終極戰略版 - 含開機測試)
 # ==========================================
+# ⏰ 設定排程時間表
+SCHEDULE_TASKS = {
+    "09:30": "morning_scan",   # 09:30 開盤掃描
+    "10:20": "strategy",       # 10:20 戰略+訊號
+    "12:00": "strategy",       # 12:00 戰略+訊號
+    "13:36": "closing",        # 13:36 收盤
+    "17:01": "chips_mtf",      # 17:01 多週期
+    "18:40": "evening_summary" # 18:40 盤後總結
+}
+# 每種報告除了日線外還需要下載的週期 (報告開始前一次平行抓齊)
+# 60 分 K 由 30 分 K、週 K 由日 K 在本地重取樣 (resample.py)，不另外下載
+REPORT_FRAMES = {
+    "chips_mtf": [("1mo", "30m")],
+}
+# 即時訊號監控節奏 (秒)
+REALTIME_INTERVAL = 30
+# 盤後快照 (Yahoo 收盤資料定稿後)：排在晚班 (16:50 起跑、22:50 逾時) 的 18:40 總結之後，
+# 全市場約 1,800 檔的日 K / 30 分 K / 基本面有數小時可跑；早班 14:40 就會被砍，不能排在盤後不久
+# 建完上傳到 GitHub Release (需 GITHUB_TOKEN)，頁面主機由 snapshot.sync 下載
+SNAPSHOT_TIME = "18:50"
+
+def run_report(report_type, slot, on_done=None):
+    """生成並發送一份定時報告 (slot 為排程時段；on_done(ok) 在報告送達後回呼)"""
+    now_str = slot.strftime('%H:%M')
+    print(f"\n⏰ 時間到 ({now_str})！正在生成 {report_type} 報告...")
+
+    report_content = ""
+    # 設定標題
+    if report_type == "morning_scan":
+        report_content = f"🌅 <b>Miniko 09:30 開盤衝鋒掃描</b> 🌅\n<i>(早盤多空力道確認)</i>\n\n"
+    elif report_type == "strategy":
+        report_content = f"🔔 <b>Miniko {now_str} 盤中戰略與訊號</b> 🔔\n\n"
+    elif report_type == "closing":
+        report_content = f"🌇 <b>Miniko 13:36 收盤定心丸</b> 🌇\n<i>(收盤價已確認更新)</i>\n\n"
+    elif report_type == "chips_mtf":
+        report_content = f"🥡 <b>Miniko 17:01 多週期結構戰報</b> 🥡\n\n"
+    elif report_type == "evening_summary":
+        report_content = f"🌙 <b>Miniko 18:40 盤後籌碼與AI總建議</b> 🌙\n<i>(主力動向與隔日戰略)</i>\n\n"
+
+    has_data = False
+    frames = [("1y", "1d")] + REPORT_FRAMES.get(report_type, [])
+    fetched = fetch_watchlist(WATCH_LIST.keys(), frames, report=report_type)
+
+    for code, name in WATCH_LIST.items():
+        try:
+            # 基礎日線
+            df_day = fetched.get((code, "1y", "1d"))
+            if df_day is None: continue
+            with metrics.stage("indicator", report=report_type, symbol=code):
+                df_60m = calc_indicators(resample.resample_intraday(fetched.get((code, "1mo", "30m")), 60)) \
+                    if report_type == "chips_mtf" else None
+                df_week = calc_indicators(resample.to_weekly(df_day)) if report_type == "evening_summary" else None
+                df_day = calc_indicators(df_day)
+            today = df_day.iloc[-1]
+            prev = df_day.iloc[-2]
+
+            with metrics.stage("signal", report=report_type, symbol=code):
+                signals = check_conditions(df_day, code, name) \
+                    if report_type in ("morning_scan", "strategy", "evening_summary") else []
+                strat = analyze_strategy(df_day, signals) \
+                    if report_type in ("strategy", "closing", "evening_summary") else None
+
+            with metrics.stage("format", report=report_type, symbol=code):
+                # 判斷漲跌符號
+                pct = ((today['Close'] - prev['Close']) / prev['Close']) * 100
+                icon = "🔺" if pct > 0 else "💚" if pct < 0 else "➖"
+
+                report_content += f"<b>📌 {name} ({code})</b> {icon} {today['Close']}\n"
+
+                # === 09:30 開盤掃描 ===
+                if report_type == "morning_scan":
+                    vol_ratio = today['Volume'] / prev['Volume'] if prev['Volume'] > 0 else 0
+
+                    report_content += f"📊 早盤量能: 昨日的 {vol_ratio*100:.1f}%\n"
+                    if signals:
+                        report_content += f"⚡ 觸發訊號: {' '.join(signals)}\n"
+                    else:
+                        report_content += f"⚡ 狀態: 觀察中，無特殊訊號\n"
+
+                # === 10:20 & 12:00 盤中戰略 (含訊號偵測) ===
+                elif report_type == "strategy":
+                    report_content += f"🛒 建議買點: {strat['buy_agg']:.1f}(激) / {strat['buy_con']:.1f}(穩)\n"
+                    if strat['backtest']:
+                        report_content += format_backtest(strat['backtest'])
+                    else:
+                        report_content += f"🎲 預估勝率: {strat['win_rate']}%\n"
+
+                    # 顯示訊號
+                    if signals:
+                        report_content += f"⚡ 觸發訊號: {' | '.join(signals)}\n"
+                    else:
+                        report_content += f"⚡ 訊號狀態: 暫無特殊訊號\n"
+
+                # === 13:36 收盤建議 ===
+                elif report_type == "closing":
+                    report_content += f"💰 <b>最終收盤: {today['Close']} ({pct:+.2f}%)</b>\n"
+                    report_content += f"🎯 明日佈局: 若回測 {strat['buy_con']:.1f} 可低接\n"
+                    report_content += f"📊 停損建議: 跌破 {today['MA20']:.1f} 減碼\n"
+
+                # === 17:01 多週期 ===
+                elif report_type == "chips_mtf":
+                    k60 = df_60m.iloc[-1]['K'] if df_60m is not None else 50
+                    report_content += f"🔸 60分K: KD值 {int(k60)} ({'過熱' if k60>80 else '低檔' if k60<20 else '中性'})\n"
+                    report_content += f"🔹 日線趨勢: {'多頭排列' if today['MA20']>today['MA60'] else '整理'}\n"
+
+                # === 18:40 盤後籌碼與AI總建議 ===
+                elif report_type == "evening_summary":
+                    # 1. 籌碼推估
+                    vol_status = "量增價漲(主力進場)" if (today['Volume'] > today['Vol_MA5'] and today['Close'] > prev['Close']) else \
+                                 "量縮整理(主力惜售)" if (today['Volume'] < today['Vol_MA5'] and abs(pct) < 1) else \
+                                 "出貨跡象" if (today['Volume'] > today['Vol_MA5'] and pct < -1) else "中性"
+
+                    # 2. 週線趨勢
+                    wk_trend = "長線多頭" if df_week.iloc[-1]['Close'] > df_week.iloc[-1]['MA20'] else "長線保守"
+
+                    # 3. 綜合 AI 建議
+                    report_content += f"🛡️ <b>籌碼動向(推估)</b>: {vol_status}\n"
+                    report_content += f"📅 <b>長線格局</b>: {wk_trend}\n"
+                    if signals:
+                        report_content += f"🚨 <b>今日訊號總結</b>: {' | '.join(signals)}\n"
+
+                    # 最終一句話
+                    strong_at, ok_at = strat['levels']
+                    ai_msg = "🔥 積極操作" if (strat['win_rate'] >= strong_at) else \
+                             "✅ 拉回買進" if (strat['win_rate'] >= ok_at) else \
+                             "⚠️ 觀望/減碼"
+                    if strat['backtest']:
+                        report_content += format_backtest(strat['backtest'])
+                    report_content += f"💡 <b>AI總結</b>: 勝率{strat['win_rate']}% -> {ai_msg}\n"
+
+                report_content += f"------------------\n"
+            has_data = True
+        except Exception as e:
+            # 單檔失敗不影響整份報告，但要留下紀錄
+            metrics.failure("report_symbol", e, report=report_type, symbol=code)
+
+    if has_data:
+        send_telegram(report_content, report=report_type, on_done=on_done)
+
+def update_stream(streams, code, fetched):
+    """
+    更新單檔串流指標：第一次用一年日線暖機，之後只把最近幾根日 K 餵進去 (O(1) 更新今天)
+    回傳 StreamingIndicators；抓不到資料回傳 None
+    """
+    stream = streams.get(code)
+    if stream is None:
+        df = fetched.get((code, "1y", "1d"))
+        if df is None or len(df) < 2: return None
+        stream = streams[code] = streaming.StreamingIndicators.from_history(df)
+        return stream
+    df = fetched.get((code, "5d", "1d"))
+    if df is None: return stream
+    for ts, row in zip(df.index, df[['Open', 'High', 'Low', 'Close', 'Volume']].values):
+        if ts.date() >= stream.last_date:
+            stream.update(ts, *row)
+    return stream
+
+def bar_fingerprint(stream):
+    """今天這根 K 棒的指紋 (日期 + 收盤 + 量)：沒變就代表上次已經判斷過"""
+    today = stream.today
+    return f"{stream.last_date}|{today['Close']:.4f}|{today['Volume']:.0f}"
+
+# 已排進佇列、尚未確認送達的警報 (代號, 訊號) → 送達前同一訊號不重複發
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+def _alerts_done(store, pending, slot):
+    """警報批次的送達回呼：送達才寫冷卻與 K 棒指紋，失敗則下一輪重判重發"""
+    def on_done(ok):
+        for code, keys, fingerprint, signals in pending:
+            if ok:
+                store.mark_alert(code, keys, slot)
+                store.save_bar(code, fingerprint, signals, slot)
+            with _in_flight_lock:
+                _in_flight.difference_update((code, k) for k in keys)
+    return on_done
+
+def run_realtime(store, streams, slot):
+    """
+    盤中即時訊號監控 (只在交易時段由排程器觸發)
+    冷卻以「每檔 × 每個訊號」計 (store 持久化，重啟後接續)；同一根 K 棒沒變就不重判
+    有警報的股票等訊息確認送達後才寫入冷卻 (_alerts_done)
+    """
+    now_str = slot.strftime('%H:%M')
+    print(f"\r🔄 [{slot:%H:%M:%S}] 交易中 - 監控掃描中...", end="")
+
+    # 尚未暖機的股票抓一年日線，其餘只抓最近幾根
+    codes = list(WATCH_LIST)
+    fetched = fetch_watchlist([c for c in codes if c not in streams], [("1y", "1d")], report="realtime")
+    fetched.update(fetch_watchlist([c for c in codes if c in streams], [("5d", "1d")], report="realtime"))
+
+    alerts, pending = [], []
+    for code, name in WATCH_LIST.items():
+        try:
+            with metrics.stage("indicator", report="realtime", symbol=code):
+                stream = update_stream(streams, code, fetched)
+            if stream is None or stream.today is None: continue
+            fingerprint = bar_fingerprint(stream)
+            if store.last_bar(code)[0] == fingerprint:
+                metrics.inc("miniko_unchanged_bars_total", report="realtime")
+                continue
+            with metrics.stage("signal", report="realtime", symbol=code):
+                signals = stream.signals()
+                with _in_flight_lock:
+                    cooling = store.cooling(code, slot) | {k for c, k in _in_flight if c == code}
+                fresh = [s for s in signals if (signal_rules.signal_key(s) or s) not in cooling]
+
+            if fresh:
+                with metrics.stage("format", report="realtime", symbol=code):
+                    today = stream.today
+                    prev = stream.prev
+                    pct = ((today['Close'] - prev['Close']) / prev['Close']) * 100
+                    icon = "🔺" if pct > 0 else "💚" if pct < 0 else "➖"
+
+                    msg = f"🚨 <b>Miniko 盤中訊號快報</b> 🚨\n\n"
+                    msg += f"<b>{name} ({code})</b> 觸發條件！\n"
+                    msg += f"💰 現價: {today['Close']} {icon} ({pct:+.2f}%)\n"
+                    msg += f"📊 量能: {int(today['Volume']/1000)} 張\n"
+                    msg += f"---------------------\n"
+                    msg += "\n".join([f"{s}" for s in fresh])
+                    msg += f"\n---------------------\n"
+                    msg += f"<i>(觸發時間: {now_str})</i>"
+
+                keys = [signal_rules.signal_key(s) or s for s in fresh]
+                with _in_flight_lock:
+                    _in_flight.update((code, k) for k in keys)
+                alerts.append(msg)
+                pending.append((code, keys, fingerprint, signals))
+            else:
+                store.save_bar(code, fingerprint, signals, slot)
+        except Exception as e:
+            metrics.failure("realtime_symbol", e, report="realtime", symbol=code)
+    # 同一輪的警報合併成一則 (避免連發觸發 Telegram 限速)
+    send_telegram_batch(alerts, report="realtime", on_done=_alerts_done(store, pending, slot))
+
+def run_snapshot(slot=None, on_done=None):
+    """盤後全市場快照：指標 / 波浪 / 費波那契 / SOP / 分數 → .snapshot/ (頁面優先讀取)"""
+    print(f"\n📦 開始建立盤後快照...")
+    summary = snapshot.build()
+    if summary is None:
+        print("❌ 快照建立失敗 (沒有任何資料)")
+        return
+    sop = int(summary['perfect_sop'].sum())
+    print(f"✅ 快照完成：{len(summary)} 檔，完美 SOP {sop} 檔")
+    # 頁面跑在另一台主機，要上傳到 GitHub Release 才讀得到 (見 snapshot.sync)
+    if snapshot.publish(): print("📤 快照已發佈到 GitHub Release")
+    if on_done: on_done(True)   # 快照不發訊息，寫完即完成
+
+def _cycle(report, fn, *args, **kwargs):
+    """整輪 (一份報告 / 一次盤中掃描) 的總耗時"""
+    with metrics.stage("cycle", report=report):
+        fn(*args, **kwargs)
+
+def _once(store, name, slot, fn, *args):
+    """
+    每個時段只做一次的任務 (報告 / 快照)：重啟後已完成的時段直接略過
+    fn 以 on_done 回報結果；訊息真的送達 (快照真的寫完) 才記為完成，中途被砍的下次會重做
+    """
+    if store.is_done(name, slot):
+        print(f"\n⏭️ {name} ({slot:%m/%d %H:%M}) 已完成過，略過")
+        metrics.inc("miniko_already_done_total", report=name)
+        return
+
+    def on_done(ok):
+        if ok: store.mark_done(name, slot)
+
+    _cycle(name, fn, *args, on_done=on_done)
+
 def run_monitor():
     print("👀 Miniko 盤中哨兵模式啟動 (已校正 UTC+8)...")
     print("🚀 功能更新: [09:30 開盤] + [10:20/12:00 戰報(含訊號)] + [13:36 收盤] + [18:40 總結]")
     
-    # 🔥🔥🔥 測試通知 🔥🔥🔥
-    send_telegram("🚀 Miniko 系統連線測試成功！已更新時刻表：\n1. 09:30 開盤衝鋒掃描\n2. 10:20/12:00 戰略+訊號回報\n3. 13:36 收盤定心丸\n4. 18:40 盤後籌碼AI總結")
-    
-    alert_history = {} 
+    # 已發的報告 / 警報冷卻 / 最後判斷的 K 棒都存在 .state/ (重啟不重發)
+    provider = market_data.get_provider()
+    store = state.StateStore()
+    store.prune(provider.now())
+    # 回測結果 (每週由 GitHub Actions 產生並發佈)：報告的勝率 / 目標命中率用這份數字
+    backtest.sync()
+
+    # 🔥🔥🔥 測試通知 (一天只發一次) 🔥🔥🔥
+    today = provider.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    _once(store, "startup", today, send_telegram,
+          "🚀 Miniko 系統連線測試成功！已更新時刻表：\n1. 09:30 開盤衝鋒掃描\n2. 10:20/12:00 戰略+訊號回報\n3. 13:36 收盤定心丸\n4. 18:40 盤後籌碼AI總結")
     
-    # ⏰ 設定排程時間表
-    schedule_tasks = {
-        "09:30": "morning_scan",   # 09:30 開盤掃描
-        "10:20": "strategy",       # 10:20 戰略+訊號
-        "12:00": "strategy",       # 12:00 戰略+訊號
-        "13:36": "closing",        # 13:36 收盤
-        "17:01": "chips_mtf",      # 17:01 多週期
-        "18:40": "evening_summary" # 18:40 盤後總結
-    }
-    # 初始化發送狀態
-    scheduled_report_sent = {t: False for t in schedule_tasks}
-
-    while True: 
-        # 1. 取得準確的台灣時間 (UTC+8)
-        now_tw = datetime.utcnow() + timedelta(hours=8)
-        now_str = now_tw.strftime('%H:%M')
-        weekday = now_tw.weekday() # 0=週一 ~ 6=週日
-
-        # 2. 定義時段狀態
-        is_working_day = (0 <= weekday <= 4)
-        
-        # 機器人清醒時間 (08:50 ~ 19:00) 
-        is_active_hours = is_working_day and (8 <= now_tw.hour <= 19)
-        
-        # 盤中交易時間 (09:00 ~ 13:30)
-        is_trading_hours = is_working_day and (
-            (now_tw.hour == 9) or 
-            (now_tw.hour > 9 and now_tw.hour < 13) or 
-            (now_tw.hour == 13 and now_tw.minute <= 30)
-        )
-
-        # 3. 休眠判斷
-        if not is_active_hours:
-            print(f"\r💤 [{now_str}] 休市中 (Miniko 下班)...", end="")
-            # 每日 00:00 重置報告發送狀態
-            if now_str == "00:00":
-                for t in schedule_tasks: scheduled_report_sent[t] = False
-            time.sleep(60) 
-            continue 
-
-        # ================= 工作時段邏輯 =================
-        status_msg = "交易中" if is_trading_hours else "盤後待命"
-        print(f"\r🔄 [{now_str}] {status_msg} - 監控掃描中...", end="")
-        
-        # --- 🕒 定時報告處理 ---
-        if now_str in schedule_tasks and not scheduled_report_sent[now_str]:
-            report_type = schedule_tasks[now_str]
-            print(f"\n⏰ 時間到 ({now_str})！正在生成 {report_type} 報告...")
-            
-            report_content = ""
-            # 設定標題
-            if report_type == "morning_scan":
-                report_content = f"🌅 <b>Miniko 09:30 開盤衝鋒掃描</b> 🌅\n<i>(早盤多空力道確認)</i>\n\n"
-            elif report_type == "strategy":
-                report_content = f"🔔 <b>Miniko {now_str} 盤中戰略與訊號</b> 🔔\n\n"
-            elif report_type == "closing":
-                report_content = f"🌇 <b>Miniko 13:36 收盤定心丸</b> 🌇\n<i>(收盤價已確認更新)</i>\n\n"
-            elif report_type == "chips_mtf":
-                report_content = f"🥡 <b>Miniko 17:01 多週期結構戰報</b> 🥡\n\n"
-            elif report_type == "evening_summary":
-                report_content = f"🌙 <b>Miniko 18:40 盤後籌碼與AI總建議</b> 🌙\n<i>(主力動向與隔日戰略)</i>\n\n"
-
-            has_data = False
-
-            for code, name in WATCH_LIST.items():
-                try:
-                    # 基礎日線
-                    df_day = get_data(code, period="1y", interval="1d")
-                    if df_day is None: continue
-                    df_day = calc_indicators(df_day)
-                    today = df_day.iloc[-1]
-                    prev = df_day.iloc[-2]
-                    
-                    # 判斷漲跌符號
-                    pct = ((today['Close'] - prev['Close']) / prev['Close']) * 100
-                    icon = "🔺" if pct > 0 else "💚" if pct < 0 else "➖"
-                    
-                    report_content += f"<b>📌 {name} ({code})</b> {icon} {today['Close']}\n"
-                    
-                    # === 09:30 開盤掃描 ===
-                    if report_type == "morning_scan":
-                        signals = check_conditions(df_day, code, name)
-                        vol_ratio = today['Volume'] / prev['Volume'] if prev['Volume'] > 0 else 0
-                        
-                        report_content += f"📊 早盤量能: 昨日的 {vol_ratio*100:.1f}%\n"
-                        if signals:
-                            report_content += f"⚡ 觸發訊號: {' '.join(signals)}\n"
-                        else:
-                            report_content += f"⚡ 狀態: 觀察中，無特殊訊號\n"
-
-                    # === 10:20 & 12:00 盤中戰略 (修正：補回訊號偵測) ===
-                    elif report_type == "strategy":
-                        strat = analyze_strategy(df_day)
-                        # ⬇️ 這裡補回來了！會檢查訊號 ⬇️
-                        signals = check_conditions(df_day, code, name)
-                        
-                        report_content += f"🛒 建議買點: {strat['buy_agg']:.1f}(激) / {strat['buy_con']:.1f}(穩)\n"
-                        report_content += f"🎲 預估勝率: {strat['win_rate']}%\n"
-                        
-                        # 顯示訊號
-                        if signals:
-                            report_content += f"⚡ 觸發訊號: {' | '.join(signals)}\n"
-                        else:
-                            report_content += f"⚡ 訊號狀態: 暫無特殊訊號\n"
-
-                    # === 13:36 收盤建議 ===
-                    elif report_type == "closing":
-                        strat = analyze_strategy(df_day)
-                        report_content += f"💰 <b>最終收盤: {today['Close']} ({pct:+.2f}%)</b>\n"
-                        report_content += f"🎯 明日佈局: 若回測 {strat['buy_con']:.1f} 可低接\n"
-                        report_content += f"📊 停損建議: 跌破 {today['MA20']:.1f} 減碼\n"
-
-                    # === 17:01 多週期 ===
-                    elif report_type == "chips_mtf":
-                        df_60m = get_data(code, period="1mo", interval="60m")
-                        df_60m = calc_indicators(df_60m)
-                        k60 = df_60m.iloc[-1]['K'] if df_60m is not None else 50
-                        report_content += f"🔸 60分K: KD值 {int(k60)} ({'過熱' if k60>80 else '低檔' if k60<20 else '中性'})\n"
-                        report_content += f"🔹 日線趨勢: {'多頭排列' if today['MA20']>today['MA60'] else '整理'}\n"
-
-                    # === 18:40 盤後籌碼與AI總建議 ===
-                    elif report_type == "evening_summary":
-                        # 1. 籌碼推估
-                        vol_status = "量增價漲(主力進場)" if (today['Volume'] > today['Vol_MA5'] and today['Close'] > prev['Close']) else \
-                                     "量縮整理(主力惜售)" if (today['Volume'] < today['Vol_MA5'] and abs(pct) < 1) else \
-                                     "出貨跡象" if (today['Volume'] > today['Vol_MA5'] and pct < -1) else "中性"
-                        
-                        # 2. 週線趨勢
-                        df_week = get_data(code, period="2y", interval="1wk")
-                        df_week = calc_indicators(df_week)
-                        wk_trend = "長線多頭" if df_week.iloc[-1]['Close'] > df_week.iloc[-1]['MA20'] else "長線保守"
-
-                        # 3. 綜合 AI 建議
-                        strat = analyze_strategy(df_day)
-                        signals = check_conditions(df_day, code, name)
-                        
-                        report_content += f"🛡️ <b>籌碼動向(推估)</b>: {vol_status}\n"
-                        report_content += f"📅 <b>長線格局</b>: {wk_trend}\n"
-                        if signals:
-                            report_content += f"🚨 <b>今日訊號總結</b>: {' | '.join(signals)}\n"
-                        
-                        # 最終一句話
-                        ai_msg = "🔥 積極操作" if (strat['win_rate'] >= 80) else \
-                                 "✅ 拉回買進" if (strat['win_rate'] >= 60) else \
-                                 "⚠️ 觀望/減碼"
-                        report_content += f"💡 <b>AI總結</b>: 勝率{strat['win_rate']}% -> {ai_msg}\n"
-
-                    report_content += f"------------------\n"
-                    has_data = True
-                except Exception as e:
-                    # print(f"Error: {e}") 
-                    pass
-            
-            if has_data:
-                send_telegram(report_content)
-            
-            scheduled_report_sent[now_str] = True 
-        
-        # 每日 08:00 重置所有旗標 (跨日保護)
-        if now_str == "08:00": 
-            for t in schedule_tasks: scheduled_report_sent[t] = False
-
-        # --- 🔥 [即時] 訊號監控 (限交易時段) ---
-        if is_trading_hours:
-            for code, name in WATCH_LIST.items():
-                try:
-                    # 冷卻檢查 (避免一直叫)
-                    last_sent_time = alert_history.get(code)
-                    if last_sent_time and (datetime.utcnow() - last_sent_time).seconds < 3600:
-                        continue
-
-                    df = get_data(code)
-                    if df is None: continue
-                    df = calc_indicators(df)
-                    signals = check_conditions(df, code, name)
-                    
-                    if signals:
-                        today = df.iloc[-1]
-                        prev = df.iloc[-2]
-                        pct = ((today['Close'] - prev['Close']) / prev['Close']) * 100
-                        icon = "🔺" if pct > 0 else "💚" if pct < 0 else "➖"
-                        
-                        msg = f"🚨 <b>Miniko 盤中訊號快報</b> 🚨\n\n"
-                        msg += f"<b>{name} ({code})</b> 觸發條件！\n"
-                        msg += f"💰 現價: {today['Close']} {icon} ({pct:+.2f}%)\n"
-                        msg += f"📊 量能: {int(today['Volume']/1000)} 張\n"
-                        msg += f"---------------------\n"
-                        msg += "\n".join([f"{s}" for s in signals])
-                        msg += f"\n---------------------\n"
-                        msg += f"<i>(觸發時間: {now_str})</i>"
-                        
-                        send_telegram(msg)
-                        alert_history[code] = datetime.utcnow()
-                except: pass
-            
-        time.sleep(30)
+    metrics.serve()   # http://127.0.0.1:9464/metrics
+    streams = {}   # 每檔的串流指標狀態 (盤中 O(1) 更新)
+
+    # 事件驅動：定時報告每個交易日各觸發一次 (錯過的時段會補發，已發過的時段略過)，
+    # 即時監控只在盤中依固定節奏觸發，其餘時間直接睡到下一個事件
+    # 時鐘跟著資料來源走：重播模式下整個交易日可以快轉跑完
+    sched = scheduler.Scheduler(clock=provider.now, sleep=provider.sleep)
+    for hhmm, report_type in SCHEDULE_TASKS.items():
+        sched.every_trading_day(hhmm, report_type,
+                                lambda slot, rt=report_type: _once(store, rt, slot, run_report, rt, slot))
+    sched.every_trading_day(SNAPSHOT_TIME, "snapshot",
+                            lambda slot: _once(store, "snapshot", slot, run_snapshot, slot))
+    sched.during_session(REALTIME_INTERVAL, "realtime",
+                         lambda slot: _cycle("realtime", run_realtime, store, streams, slot))
+    sched.run_forever()
 
 if __name__ == "__main__":
-    run_monitor()
+    if len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        run_snapshot()
+    else:
+        run_monitor()
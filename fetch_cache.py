@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+跨 Session 共用的行情快取 (程序內、有記憶體上限、LRU 淘汰)
+鍵 = (資源, 代號, 參數..., 到期時刻)，到期時刻依資源對齊：
+- 日 K：對齊收盤 (13:30)，盤後整晚到下個交易日收盤前都命中
+- 60 分 / 30 分 K：對齊目前這根 K 棒結束；休市時對齊下次開盤
+- 基本面：固定 TTL
+60 分 K / 週 K 不另外下載，由快取裡的 30 分 K / 日 K 重取樣而來 (見 resample.py)，合成結果也各自快取。
+波段 / 費波那契 / 支撐壓力 (swings.levels) 同樣依 K 棒收盤快取。
+盤中最後一根 K 棒仍在變動，另有 SESSION_MAX_TTL 上限。
+Streamlit 所有 Session 共用同一個已 import 的模組，所以這份快取天然跨使用者共用；
+同一個鍵同時被多人查詢時只會抓一次 (其他人等結果)。
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+
+import bar_store
+import market_data
+import resample
+import scheduler
+import swings
+
+# ================= ⚙️ 參數設定區 =================
+MAX_BYTES = int(os.environ.get("MINIKO_CACHE_MB", "256")) * 1024 * 1024
+SESSION_MAX_TTL = timedelta(minutes=5)   # 盤中任何 K 棒資源最多沿用 5 分鐘
+INFO_TTL = timedelta(hours=6)
+BAR_MINUTES = {"60m": 60, "30m": 30, "15m": 15, "5m": 5}
+# ===============================================
+
+
+def _sizeof(value):
+    """估計佔用位元組 (DataFrame 用 memory_usage，容器遞迴加總)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) \
+            else int(value.memory_usage(deep=True))
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + _sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    # 呼叫端 (calc_indicators) 會原地加欄位，不能把共用的那份交出去
+    return value.copy() if isinstance(value, (pd.DataFrame, pd.Series)) else value
+
+
+class LRUCache:
+    """有位元組上限的 LRU 快取 (執行緒安全)：超過上限從最久沒用的開始淘汰"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()   # key → (value, 到期時刻, 位元組)
+        self._lock = threading.Lock()
+        self._loading = {}            # key → Lock (同一鍵只讓一個人去抓)
+
+    def _drop(self, key):
+        _, _, size = self._items.pop(key)
+        self.bytes -= size
+
+    def get(self, key, now):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= now:
+                if item is not None: self._drop(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, expires):
+        size = _sizeof(value)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._items: self._drop(key)
+            self._items[key] = (value, expires, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def get_or_load(self, key, expires, load, now):
+        """命中就回傳；否則呼叫 load()，None / 空表不快取"""
+        value = self.get(key, now)
+        if value is not None: return value
+        with self._lock:
+            gate = self._loading.setdefault(key, threading.Lock())
+        with gate:
+            value = self.get(key, now)
+            if value is None:
+                value = load()
+                if value is not None and not getattr(value, "empty", False):
+                    self.put(key, value, expires)
+        with self._lock:
+            self._loading.pop(key, None)
+        return value
+
+    def invalidate(self, symbol=None):
+        """清掉某檔 (或全部) 的快取"""
+        with self._lock:
+            for key in [k for k in self._items if symbol is None or k[1] == symbol]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_cache = LRUCache()
+
+
+# --- 到期時刻 ---
+def _now():
+    return market_data.get_provider().now()
+
+
+def _at(day, hhmm):
+    h, m = map(int, hhmm.split(":"))
+    return day.replace(hour=h, minute=m, second=0, microsecond=0)
+
+
+def _in_session(now):
+    return scheduler.is_trading_day(now) and \
+        _at(now, scheduler.SESSION_START) <= now < _at(now, scheduler.SESSION_END)
+
+
+def bar_close(interval, now):
+    """
+    目前這份 interval 資料何時會變：
+    日 K → 下一個收盤；分 K → 這根 K 棒結束 (休市時為下次開盤)
+    """
+    start, end = _at(now, scheduler.SESSION_START), _at(now, scheduler.SESSION_END)
+    minutes = BAR_MINUTES.get(interval)
+    if minutes is None:
+        if scheduler.is_trading_day(now) and now < end: return end
+        return _at(scheduler.next_trading_day(now), scheduler.SESSION_END)
+    if not _in_session(now):
+        day = now if scheduler.is_trading_day(now) and now < start else scheduler.next_trading_day(now)
+        return _at(day, scheduler.SESSION_START)
+    step = timedelta(minutes=minutes)
+    return min(start + ((now - start) // step + 1) * step, end)
+
+
+def _expires(boundary, now):
+    return min(boundary, now + SESSION_MAX_TTL) if _in_session(now) else boundary
+
+
+# --- 對外 ---
+def _load_bars(symbol, period, interval):
+    """可合成的週期由來源週期重取樣 (來源走 get_bars，同樣吃快取)，否則下載"""
+    source = resample.source_for(interval, period)
+    if source is None:
+        return bar_store.get_bars(symbol, period=period, interval=interval)
+    return resample.derive(get_bars(symbol, period=period, interval=source), interval)
+
+
+def get_bars(symbol, period="1y", interval="1d"):
+    """bar_store.get_bars 加上共用快取與多週期合成 (重播資料源不快取)"""
+    if not market_data.get_provider().cacheable:
+        return _load_bars(symbol, period, interval)
+    now = _now()
+    boundary = bar_close(interval, now)
+    key = ("bars", symbol, period, interval, boundary)
+    return _copy(_cache.get_or_load(key, _expires(boundary, now),
+                                    lambda: _load_bars(symbol, period, interval), now))
+
+
+def get_levels(symbol, df, interval="1d"):
+    """swings.levels(df) 依 K 棒收盤快取：同一根 K 棒內重複查詢 (多人 / 重新整理) 不重算"""
+    if df is None or df.empty: return None
+    if not market_data.get_provider().cacheable: return swings.levels(df)
+    now = _now()
+    boundary = bar_close(interval, now)
+    key = ("levels", symbol, interval, df.index[-1], boundary)
+    return _cache.get_or_load(key, _expires(boundary, now), lambda: swings.levels(df), now)
+
+
+def get_info(symbol):
+    """基本面 info (固定 TTL)"""
+    provider = market_data.get_provider()
+    if not provider.cacheable: return provider.info(symbol)
+    now = _now()
+    return _cache.get_or_load(("info", symbol), now + INFO_TTL, lambda: provider.info(symbol) or None, now)
+
+
+def invalidate(symbol=None):
+    _cache.invalidate(symbol)
+
+
+def stats():
+    return _cache.stats()
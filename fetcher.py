@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+並行抓取層：有上限的執行緒池 + 每個主機的速率限制 + 隨機抖動重試
+一份報告需要的所有 (股票 × 週期) 一次平行抓完，總耗時約等於單次抓取。
+限速由 market_data 的 Provider 在每一次 HTTP 請求前取號 (limiter_for)，
+所以 .TW / .TWO 都試、K 線倉庫補抓還原權值這類「一次呼叫多個請求」也都算進去。
+"""
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ================= ⚙️ 參數設定區 =================
+MAX_WORKERS = int(os.environ.get("MINIKO_FETCH_WORKERS", "8"))   # 同時抓取上限
+HOST_RATE = {"yahoo": 8.0}                                        # 每秒請求數上限
+DEFAULT_RATE = 4.0
+RETRIES = 2
+BASE_DELAY = 0.5
+# ===============================================
+
+
+class RateLimiter:
+    """最小請求間隔限速 (執行緒安全)：每次 wait() 依序排隊取得發送時間"""
+
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, n=1):
+        """取得 n 個請求的發送額度 (批次下載一次送出 n 個請求)，必要時睡到輪到自己"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval * n
+        delay = slot - now
+        if delay > 0: time.sleep(delay)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host):
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(HOST_RATE.get(host, DEFAULT_RATE))
+        return _limiters[host]
+
+
+def call_with_retry(fn, *args, retries=RETRIES, base_delay=BASE_DELAY, **kwargs):
+    """
+    呼叫 fn，拋出例外時以指數退避 + 隨機抖動重試 (限速在 Provider 的每次請求)
+    重試用盡仍失敗則把最後的例外拋出
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if attempt == retries: raise
+            time.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+def fetch_many(fn, jobs, max_workers=MAX_WORKERS):
+    """
+    平行執行 fn(*job)，回傳 {job: 結果}；單一任務失敗時結果為 None，不影響其他任務
+    jobs 為 tuple 清單，例如 [("2330", "1y", "1d"), ("2330", "1mo", "60m")]
+    """
+    jobs = list(dict.fromkeys(jobs))
+    if not jobs: return {}
+
+    def run(job):
+        try:
+            return fn(*job)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        return dict(zip(jobs, pool.map(run, jobs)))
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+共用技術指標引擎
+cloud_bot / app / 個股AI戰情室 共用同一套公式，確保三邊數字一致。
+所有函數都同時支援單檔 (Series / 1-D) 與多檔寬表 (DataFrame / 2-D：日期 × 股票)。
+"""
+import numpy as np
+import pandas as pd
+
+import bars
+
+try:
+    from numba import njit
+except ImportError:  # 沒裝 numba 就走純 NumPy 批次版本
+    njit = None
+
+# KD 平滑起始值：K = 2/3 前K + 1/3 RSV
+KD_SEED = 50.0
+
+
+def _kd_columns(x, seed):
+    """逐檔逐根遞迴 (與原始迴圈同一個運算式，結果逐位元相同)"""
+    T, N = x.shape
+    out = np.empty((T, N))
+    for j in range(N):
+        k = seed
+        for i in range(T):
+            k = k*2/3 + x[i, j]*1/3
+            out[i, j] = k
+    return out
+
+
+def _kd_lockstep(x, seed):
+    """沒有 numba 時：每根 K 棒對所有股票做一次向量運算 (同一個運算式)"""
+    out = np.empty_like(x)
+    k = np.full(x.shape[1], seed)
+    for i in range(len(x)):
+        k = k*2/3 + x[i]*1/3
+        out[i] = k
+    return out
+
+
+if njit is not None:
+    _kd_columns = njit(cache=True)(_kd_columns)
+
+
+def kd_smooth(values, seed=KD_SEED):
+    """
+    KD 遞迴平滑 (前值 × 2/3 + 今值 × 1/3，起始值 50)，沿 axis 0 (時間軸) 計算，可直接吃 2-D 多檔陣列
+    與原本逐筆迴圈逐位元相同 (線性濾波的寫法會差到 1e-14，K 剛好落在門檻上時訊號會不同)
+    """
+    x = np.asarray(values, dtype=float)
+    one_d = x.ndim == 1
+    x = np.ascontiguousarray(x[:, None] if one_d else x)
+    out = _kd_columns(x, float(seed)) if njit is not None else _kd_lockstep(x, float(seed))
+    return out[:, 0] if one_d else out
+
+
+def calc_rsv(high, low, close, n=9):
+    """RSV = (收盤 - n日最低) / (n日最高 - n日最低) × 100"""
+    high_n = high.rolling(n).max()
+    low_n = low.rolling(n).min()
+    return (close - low_n) / (high_n - low_n) * 100
+
+
+def calc_kd(high, low, close, n=9):
+    """
+    KD (9,3,3)，回傳 (RSV, K, D)
+    與原本逐筆迴圈 (RSV 缺值補 50、K/D 起始 50) 數值一致；傳入 DataFrame 則一次算多檔
+    """
+    rsv = calc_rsv(high, low, close, n)
+    k = kd_smooth(rsv.fillna(50).values)
+    d = kd_smooth(k)
+    if isinstance(rsv, pd.DataFrame):
+        return rsv, pd.DataFrame(k, index=rsv.index, columns=rsv.columns), \
+            pd.DataFrame(d, index=rsv.index, columns=rsv.columns)
+    return rsv, pd.Series(k, index=rsv.index), pd.Series(d, index=rsv.index)
+
+
+# --- Parabolic SAR ---
+def _sar_scalar(high, low, accel, max_accel):
+    """
+    逐根計算 SAR (與 app.calculate_sar 原始迴圈同一套運算)
+    有 numba 時會被 JIT 編譯；比較式刻意寫成 if，與 Python min/max 的 NaN 行為一致
+    """
+    n = len(high)
+    sar = np.zeros(n)
+    trend = np.zeros(n)
+    ep = np.zeros(n)
+    af = np.zeros(n)
+    if n == 0: return sar
+    trend[0] = 1
+    sar[0] = low[0]
+    ep[0] = high[0]
+    af[0] = accel
+    for i in range(1, n):
+        sar[i] = sar[i-1] + af[i-1] * (ep[i-1] - sar[i-1])
+        if trend[i-1] == 1:
+            if low[i] < sar[i]:
+                trend[i] = -1
+                sar[i] = ep[i-1]
+                ep[i] = low[i]
+                af[i] = accel
+            else:
+                trend[i] = 1
+                if high[i] > ep[i-1]:
+                    ep[i] = high[i]
+                    step = af[i-1] + accel
+                    af[i] = max_accel if max_accel < step else step
+                else:
+                    ep[i] = ep[i-1]
+                    af[i] = af[i-1]
+                if low[i-1] < sar[i]: sar[i] = low[i-1]
+                if i > 1 and low[i-2] < sar[i]: sar[i] = low[i-2]
+        else:
+            if high[i] > sar[i]:
+                trend[i] = 1
+                sar[i] = ep[i-1]
+                ep[i] = high[i]
+                af[i] = accel
+            else:
+                trend[i] = -1
+                if low[i] < ep[i-1]:
+                    ep[i] = low[i]
+                    step = af[i-1] + accel
+                    af[i] = max_accel if max_accel < step else step
+                else:
+                    ep[i] = ep[i-1]
+                    af[i] = af[i-1]
+                if high[i-1] > sar[i]: sar[i] = high[i-1]
+                if i > 1 and high[i-2] > sar[i]: sar[i] = high[i-2]
+    return sar
+
+
+if njit is not None:
+    _sar_scalar = njit(cache=True)(_sar_scalar)
+
+
+def _sar_lockstep(high, low, accel, max_accel):
+    """
+    多檔同步步進的 SAR：每根 K 棒對所有股票做一次向量運算 (T 次迴圈，而非 T × N)
+    每檔從自己第一根有效 K 棒起算 (新股前段為 NaN)，結果與逐檔計算逐位元相同
+    """
+    T, N = high.shape
+    out = np.full((T, N), np.nan)
+    valid = ~(np.isnan(high) | np.isnan(low))
+    start = np.where(valid.any(axis=0), valid.argmax(axis=0), T)
+
+    sar = np.full(N, np.nan)
+    ep = np.full(N, np.nan)
+    af = np.full(N, accel)
+    up = np.ones(N, dtype=bool)
+
+    for i in range(T):
+        h, l = high[i], low[i]
+        init = start == i
+        run = start < i
+        if init.any():
+            sar = np.where(init, l, sar)
+            ep = np.where(init, h, ep)
+            af = np.where(init, accel, af)
+            up = np.where(init, True, up)
+        if run.any():
+            s = sar + af * (ep - sar)
+            flip_dn = run & up & (l < s)
+            flip_up = run & ~up & (h > s)
+            stay_up = run & up & ~flip_dn
+            stay_dn = run & ~up & ~flip_up
+
+            step = af + accel
+            step = np.where(max_accel < step, max_accel, step)
+            new_hi = stay_up & (h > ep)
+            new_lo = stay_dn & (l < ep)
+
+            # 續多：SAR 不得高於前兩根低點；續空：SAR 不得低於前兩根高點
+            lp1, hp1 = low[i-1], high[i-1]
+            s_up = np.where(lp1 < s, lp1, s)
+            s_dn = np.where(hp1 > s, hp1, s)
+            if i >= 2:
+                deep = (i - start) > 1
+                lp2, hp2 = low[i-2], high[i-2]
+                s_up = np.where(deep & (lp2 < s_up), lp2, s_up)
+                s_dn = np.where(deep & (hp2 > s_dn), hp2, s_dn)
+
+            new_sar = np.where(stay_up, s_up, np.where(stay_dn, s_dn, ep))
+            new_ep = np.where(flip_dn, l, np.where(flip_up, h,
+                              np.where(new_hi, h, np.where(new_lo, l, ep))))
+            new_af = np.where(flip_dn | flip_up, accel, np.where(new_hi | new_lo, step, af))
+
+            sar = np.where(run, new_sar, sar)
+            ep = np.where(run, new_ep, ep)
+            af = np.where(run, new_af, af)
+            up = np.where(flip_dn, False, np.where(flip_up, True, up))
+        out[i] = np.where(start <= i, sar, np.nan)
+    return out
+
+
+def calc_sar(high, low, accel=0.02, max_accel=0.2):
+    """
+    Parabolic SAR，可傳 1-D (單檔) 或 2-D (日期 × 股票)
+    有 numba 時逐檔跑 JIT 版本，否則走多檔同步步進的純 NumPy 版本
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    one_d = high.ndim == 1
+    if one_d:
+        high, low = high[:, None], low[:, None]
+
+    if njit is not None:
+        out = np.full(high.shape, np.nan)
+        for j in range(high.shape[1]):
+            ok = ~(np.isnan(high[:, j]) | np.isnan(low[:, j]))
+            if not ok.any(): continue
+            s = ok.argmax()
+            out[s:, j] = _sar_scalar(high[s:, j].copy(), low[s:, j].copy(), accel, max_accel)
+    else:
+        out = _sar_lockstep(high, low, accel, max_accel)
+    return out[:, 0] if one_d else out
+
+
+# --- 多檔寬表 (Panel) 引擎 ---
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def to_panel(bulk, tickers=None):
+    """
+    yf.download(group_by='ticker') 的寬表 → {欄位: DataFrame(日期 × 股票)}
+    單檔下載 (非 MultiIndex) 時需傳入 tickers 指定欄名
+    """
+    panel = {}
+    if bulk is None or bulk.empty: return panel
+    if isinstance(bulk.columns, pd.MultiIndex):
+        fields = set(bulk.columns.get_level_values(1))
+        for f in PANEL_FIELDS:
+            if f in fields:
+                panel[f] = bulk.xs(f, axis=1, level=1).astype(float)
+    else:
+        name = tickers[0] if tickers else 'Close'
+        for f in PANEL_FIELDS:
+            if f in bulk.columns:
+                panel[f] = bulk[[f]].astype(float).set_axis([name], axis=1)
+    return panel
+
+
+def calc_panel_indicators(panel, mas=(5, 10, 20, 60)):
+    """
+    一次算完整個寬表的技術指標 (rolling / ewm 都沿時間軸，所有股票同時計算)
+    回傳 {指標名: DataFrame(日期 × 股票)}，欄名與 calc_indicators 相同
+    """
+    close, high, low = panel['Close'], panel['High'], panel['Low']
+    ind = {}
+
+    # 均線
+    for ma in mas:
+        ind[f'MA{ma}'] = close.rolling(ma).mean()
+    ind['SMA22'] = close.rolling(22).mean()
+
+    # KD (9,3,3)
+    ind['RSV'], ind['K'], ind['D'] = calc_kd(high, low, close)
+
+    # MACD (12,26,9)
+    exp12 = close.ewm(span=12, adjust=False).mean()
+    exp26 = close.ewm(span=26, adjust=False).mean()
+    ind['DIF'] = exp12 - exp26
+    ind['MACD'] = ind['DIF'].ewm(span=9, adjust=False).mean()
+    ind['MACD_Hist'] = ind['DIF'] - ind['MACD']
+
+    # 量能與 ATR
+    if 'Volume' in panel:
+        ind['Vol_MA5'] = panel['Volume'].rolling(5).mean()
+    tr = np.maximum(high - low, (high - close.shift(1)).abs())
+    ind['ATR'] = tr.rolling(14).mean()
+
+    # 布林通道與乖離
+    bb_mid = close.rolling(20).mean()
+    bb_std = close.rolling(20).std()
+    ind['BB_Up'] = bb_mid + 2 * bb_std
+    ind['BB_Low'] = bb_mid - 2 * bb_std
+    ind['BB_Pct'] = (close - ind['BB_Low']) / (ind['BB_Up'] - ind['BB_Low'])
+    ind['BIAS_20'] = (close - bb_mid) / bb_mid * 100
+
+    # SAR (多檔同步)
+    ind['SAR'] = pd.DataFrame(calc_sar(high.values, low.values), index=close.index, columns=close.columns)
+    ind['SAR_Bull'] = close > ind['SAR']
+    return ind
+
+
+def panel_frame(panel, ind, ticker):
+    """從寬表取出單一股票的 K 線 + 指標 (只對通過初篩的候選股才組出 DataFrame)"""
+    cols = {f: df[ticker] for f, df in panel.items()}
+    cols.update({name: df[ticker] for name, df in ind.items()})
+    return pd.DataFrame(cols)
+
+
+# --- 精簡陣列版 (bars.Bars)：中間值放暫存陣列，只留計分需要的最後幾列 ---
+class Scratch:
+    """可重複使用的 float64 暫存陣列 (同名同形狀只配置一次；每條執行緒各用一份)"""
+
+    def __init__(self):
+        self._bufs = {}
+
+    def get(self, name, shape):
+        buf = self._bufs.get(name)
+        if buf is None or buf.shape != shape:
+            buf = self._bufs[name] = np.empty(shape)
+        return buf
+
+    def load(self, name, values):
+        """把 (float32) 陣列轉成 float64 放進暫存"""
+        buf = self.get(name, values.shape)
+        np.copyto(buf, values)
+        return buf
+
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for b in self._bufs.values())
+
+
+def _rolling(x, n, reducer, out):
+    """沿時間軸的 n 期滾動 (視窗含 NaN 或不足 n 期為 NaN，與 pandas rolling 相同)"""
+    out[:n - 1] = np.nan
+    if len(x) >= n:
+        reducer(np.lib.stride_tricks.sliding_window_view(x, n, axis=0), axis=-1, out=out[n - 1:])
+    return out
+
+
+def _ewm(x, span):
+    return pd.DataFrame(x, copy=False).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def calc_score_indicators(high, low, close, tail, scratch=None):
+    """
+    screener 計分用的 K / D / MACD_Hist / MA5 / SAR_Bull (與 calc_panel_indicators 同公式)
+    輸入為 (日期 × 股票) 陣列 (可為 float32)；遞迴指標需要全長，但只回傳最後 tail 列，
+    缺值已沿時間軸前補 / 後補 (與 score_panel 的補值相同)
+    """
+    scratch = scratch or Scratch()
+    shape = close.shape
+    h, l, c = scratch.load('high', high), scratch.load('low', low), scratch.load('close', close)
+
+    # KD (9,3,3)：9 日高低點與 RSV 都在暫存陣列
+    high_9 = _rolling(h, 9, np.max, scratch.get('high_9', shape))
+    low_9 = _rolling(l, 9, np.min, scratch.get('low_9', shape))
+    rsv = scratch.get('rsv', shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.subtract(c, low_9, out=rsv)
+        np.subtract(high_9, low_9, out=high_9)
+        np.divide(rsv, high_9, out=rsv)
+    rsv *= 100
+    rsv[np.isnan(rsv)] = 50
+    k = kd_smooth(rsv)
+    d = kd_smooth(k)
+
+    # MACD (12,26,9)
+    dif = _ewm(c, 12) - _ewm(c, 26)
+    hist = dif - _ewm(dif, 9)
+
+    ma5 = _rolling(c, 5, np.mean, scratch.get('ma5', shape))
+    sar = calc_sar(h, l)
+    with np.errstate(invalid='ignore'):
+        sar_bull = c[-tail:] > sar[-tail:]
+    return {'K': k[-tail:], 'D': d[-tail:], 'MACD_Hist': bars.fill_gaps(hist)[-tail:],
+            'MA5': bars.fill_gaps(ma5)[-tail:], 'SAR_Bull': sar_bull}
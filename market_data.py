@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+行情資料來源 (Provider) 抽象層
+- YFinanceProvider：正式環境，直接打 Yahoo
+- ReplayProvider：讀取錄製好的 K 線與基本面快照，依可調速度的虛擬時鐘重播
+  (離線壓測、重現錯誤警報、把一整個交易日快轉跑過盤中哨兵)
+
+選擇方式：環境變數 MINIKO_PROVIDER = "yfinance" (預設) 或 "replay:<錄製目錄>"
+重播參數：MINIKO_REPLAY_SPEED (倍速，預設 60)、MINIKO_REPLAY_START ("2026-10-16 08:55")
+
+錄製：python market_data.py record <輸出目錄> 2330.TW 8299.TWO ...
+"""
+import os
+import sys
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import yfinance as yf
+
+import fetcher
+
+TW = timezone(timedelta(hours=8))
+TW_TZ = "Asia/Taipei"
+
+# 錄製的週期與範圍 (60 分 K / 週 K 由 resample.py 從 30 分 K / 日 K 合成，不必錄)
+RECORD_FRAMES = [("2y", "1d"), ("1mo", "30m")]
+INTERVAL_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "1h": 60}
+SESSION_CLOSE = (13, 30)
+
+
+def _now_tw():
+    return datetime.now(TW).replace(tzinfo=None)
+
+
+class YFinanceProvider:
+    """Yahoo Finance (正式環境)：每次 HTTP 請求前先向 fetcher 的 yahoo 限速器取號"""
+    name = "yfinance"
+    cacheable = True   # 結果可存進本地 K 線倉庫
+    host = "yahoo"
+
+    def history(self, symbol, period=None, interval="1d", start=None):
+        fetcher.limiter_for(self.host).wait()
+        ticker = yf.Ticker(symbol)
+        if start is not None:
+            return ticker.history(start=start.strftime('%Y-%m-%d'), interval=interval)
+        return ticker.history(period=period, interval=interval)
+
+    def download(self, tickers, period=None, interval="1d", start=None):
+        """多檔批次下載，回傳 group_by='ticker' 的寬表"""
+        kwargs = {"start": start.strftime('%Y-%m-%d')} if start is not None else {"period": period}
+        # yfinance 每檔各發一個請求
+        fetcher.limiter_for(self.host).wait(len(tickers.split() if isinstance(tickers, str) else tickers))
+        return yf.download(tickers, interval=interval, group_by='ticker',
+                           threads=True, progress=False, **kwargs)
+
+    def info(self, symbol):
+        fetcher.limiter_for(self.host).wait()
+        return yf.Ticker(symbol).info
+
+    def now(self):
+        """台灣時間 (naive)"""
+        return _now_tw()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class ReplayProvider:
+    """
+    錄製檔重播：root/bars/<interval>/<symbol>.parquet、root/info/<symbol>.json
+    只回傳虛擬時鐘「當下」已經收完的 K 棒；今天的日 K 由已收完的分 K 即時合成
+    speed=None 代表不跑時鐘，直接提供全部資料 (適合純吞吐量壓測)
+    """
+    name = "replay"
+    cacheable = False   # 重播資料不寫進正式的 K 線倉庫
+
+    def __init__(self, root, speed=60.0, start_at=None):
+        self.root = root
+        self.speed = speed
+        self.start_at = start_at
+        self._t0 = time.monotonic()
+        self._frames = {}
+        if speed is not None and start_at is None:
+            raise ValueError("重播時鐘需要起始時間 (MINIKO_REPLAY_START)")
+
+    # --- 虛擬時鐘 ---
+    def now(self):
+        if self.speed is None: return _now_tw()
+        return self.start_at + timedelta(seconds=(time.monotonic() - self._t0) * self.speed)
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed if self.speed else 0)
+
+    # --- 資料 ---
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        if key not in self._frames:
+            path = os.path.join(self.root, "bars", interval, f"{symbol}.parquet")
+            self._frames[key] = pd.read_parquet(path) if os.path.exists(path) else None
+        return self._frames[key]
+
+    def _visible(self, symbol, interval):
+        """虛擬時鐘下已可看到的 K 棒"""
+        df = self._load(symbol, interval)
+        if df is None or self.speed is None: return df
+        now = pd.Timestamp(self.now()).tz_localize(TW_TZ)
+        if interval in INTERVAL_MINUTES:
+            end = df.index + pd.Timedelta(minutes=INTERVAL_MINUTES[interval])
+            return df[end <= now]
+        today = now.normalize()
+        past = df[df.index < today]
+        if interval != "1d": return df[df.index <= now]
+        close_at = today + pd.Timedelta(hours=SESSION_CLOSE[0], minutes=SESSION_CLOSE[1])
+        if now >= close_at: return df[df.index <= now]
+        partial = self._partial_daily(symbol, today)
+        return past if partial is None else pd.concat([past, partial])
+
+    def _partial_daily(self, symbol, today):
+        """用今天已收完的最細分 K 合成盤中日 K"""
+        for interval in sorted(INTERVAL_MINUTES, key=INTERVAL_MINUTES.get):
+            intraday = self._visible(symbol, interval) if self._load(symbol, interval) is not None else None
+            if intraday is None: continue
+            bars = intraday[intraday.index >= today]
+            if bars.empty: return None
+            return pd.DataFrame({
+                'Open': [bars['Open'].iloc[0]], 'High': [bars['High'].max()],
+                'Low': [bars['Low'].min()], 'Close': [bars['Close'].iloc[-1]],
+                'Volume': [bars['Volume'].sum()],
+            }, index=pd.DatetimeIndex([today]))
+        return None
+
+    def history(self, symbol, period=None, interval="1d", start=None):
+        df = self._visible(symbol, interval)
+        if df is None: return pd.DataFrame()
+        if start is not None:
+            start = pd.Timestamp(start)
+            start = start.tz_localize(TW_TZ) if start.tz is None else start
+            return df[df.index >= start]
+        days = {"5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731}.get(period)
+        if days is None or df.empty: return df
+        return df[df.index >= df.index[-1].normalize() - pd.Timedelta(days=days)]
+
+    def download(self, tickers, period=None, interval="1d", start=None):
+        frames = {t: self.history(t, period, interval, start) for t in tickers}
+        frames = {t: df for t, df in frames.items() if not df.empty}
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+    def info(self, symbol):
+        path = os.path.join(self.root, "info", f"{symbol}.json")
+        if not os.path.exists(path): return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+# --- 目前使用的 Provider ---
+_provider = None
+
+
+def _from_env():
+    spec = os.environ.get("MINIKO_PROVIDER", "yfinance")
+    if spec.startswith("replay:"):
+        speed = os.environ.get("MINIKO_REPLAY_SPEED", "60")
+        start = os.environ.get("MINIKO_REPLAY_START")
+        return ReplayProvider(
+            spec[len("replay:"):],
+            speed=None if speed.lower() == "none" else float(speed),
+            start_at=datetime.fromisoformat(start) if start else None,
+        )
+    return YFinanceProvider()
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = _from_env()
+    return _provider
+
+
+def set_provider(provider):
+    """切換資料來源 (壓測 / 重播用)"""
+    global _provider
+    _provider = provider
+
+
+# --- 錄製 ---
+def record(symbols, out_dir, frames=RECORD_FRAMES, with_info=True):
+    """把指定股票的 K 線與基本面快照存成重播格式"""
+    source = YFinanceProvider()
+    for symbol in symbols:
+        for period, interval in frames:
+            try:
+                df = source.history(symbol, period=period, interval=interval)
+            except Exception as e:
+                print(f"❌ {symbol} {interval} 錄製失敗：{e}")
+                continue
+            if df is None or df.empty: continue
+            idx = pd.DatetimeIndex(df.index)
+            df = df.set_axis(idx.tz_localize(TW_TZ) if idx.tz is None else idx.tz_convert(TW_TZ))
+            path = os.path.join(out_dir, "bars", interval, f"{symbol}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path)
+        if with_info:
+            try:
+                info = source.info(symbol)
+                path = os.path.join(out_dir, "info", f"{symbol}.json")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(info, f, ensure_ascii=False, default=str)
+            except Exception as e:
+                print(f"❌ {symbol} 基本面錄製失敗：{e}")
+        print(f"✅ 已錄製 {symbol}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "record":
+        record(sys.argv[3:], sys.argv[2])
+    else:
+        print("用法: python market_data.py record <輸出目錄> <代號.TW> [...]")
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+盤中哨兵的效能量測 (Instrumentation)
+- stage()：包住 抓資料 / 指標 / 訊號 / 組訊息 / 發送 每個階段，記錄耗時與成敗
+- 計數器：失敗、空資料、.TWO 後綴備援等
+- 延遲直方圖 (Prometheus 格式的累積 bucket)
+輸出：
+- 輪替式 JSONL 檔 (每個階段一行事件，例外附上錯誤訊息)
+- 本機 http://127.0.0.1:<port>/metrics 的 Prometheus 文字格式
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# ================= ⚙️ 參數設定區 =================
+LOG_PATH = os.environ.get(
+    "MINIKO_METRICS_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".metrics", "monitor.jsonl")
+)
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+# /metrics 端點埠號 (0 = 不開)
+METRICS_PORT = int(os.environ.get("MINIKO_METRICS_PORT", "9464"))
+METRICS_HOST = "127.0.0.1"
+
+# 延遲 bucket (秒)：涵蓋本機指標計算 (ms 級) 到 Yahoo / Telegram 逾時
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# ===============================================
+
+_lock = threading.Lock()
+_counters = {}     # (名稱, labels) → 數值
+_histograms = {}   # (名稱, labels) → [各 bucket 次數..., +Inf 次數, 總和]
+_logger = None
+_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+# --- 事件紀錄 ---
+def _get_logger():
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("miniko.metrics")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        try:
+            os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+            handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES,
+                                          backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        except OSError:
+            logger.addHandler(logging.NullHandler())
+        _logger = logger
+    return _logger
+
+
+def event(kind, **fields):
+    """寫一行 JSONL 事件"""
+    record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "event": kind}
+    record.update(fields)
+    _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+# --- 計數器 / 直方圖 ---
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+
+@contextmanager
+def stage(name, report=None, symbol=None, **extra):
+    """
+    量測一個階段：耗時進直方圖 miniko_stage_seconds，失敗計入 miniko_failures_total 並寫入事件
+    例外會繼續往外拋，由呼叫端決定要不要略過這檔
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        seconds = time.perf_counter() - t0
+        observe("miniko_stage_seconds", seconds, stage=name, report=report)
+        inc("miniko_failures_total", stage=name, report=report)
+        event("stage", stage=name, report=report, symbol=symbol, seconds=round(seconds, 6),
+              ok=False, error=f"{type(e).__name__}: {e}", **extra)
+        raise
+    seconds = time.perf_counter() - t0
+    observe("miniko_stage_seconds", seconds, stage=name, report=report)
+    event("stage", stage=name, report=report, symbol=symbol, seconds=round(seconds, 6), ok=True, **extra)
+
+
+def failure(where, error, report=None, symbol=None):
+    """記錄被吞掉的例外 (取代原本的 except: pass)"""
+    inc("miniko_failures_total", stage=where, report=report)
+    event("failure", stage=where, report=report, symbol=symbol, error=f"{type(error).__name__}: {error}")
+
+
+# --- Prometheus 文字格式 ---
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render():
+    """目前所有計數器與直方圖 (Prometheus text exposition format)"""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name: lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name: continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), hist[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """背景執行緒開 /metrics 端點 (重複呼叫只開一次；埠號 0 或被占用就略過)"""
+    global _server
+    if _server is not None or not port: return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"⚠️ metrics 端點無法啟動 ({host}:{port})：{e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="miniko-metrics", daemon=True).start()
+    print(f"📈 效能指標：http://{host}:{port}/metrics")
+    return _server
+
+
+def reset():
+    """清空計數 (重播 / 壓測用)"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
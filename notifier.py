@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Telegram 發送佇列 (Outbound Queue)
+send() 只把訊息丟進佇列就回來，盤中哨兵不會被網路卡住；背景執行緒負責實際發送：
+- 共用 requests.Session (連線重用，不必每則訊息重新握手)
+- 超過 4096 字的報告依 ------------------ 分隔線切成多則 (分隔線切不開再依換行切)
+- 每個聊天室限速；被 Telegram 回 429 就照 retry_after 等，網路 / 5xx 錯誤指數退避重試
+- send_batch()：同一輪觸發的多則警報合併成一則送出
+- on_done(ok)：整則 (含切出的每一段) 處理完才在發送執行緒回呼，呼叫端據此才記錄「已發送」
+
+測試時把 MINIKO_TELEGRAM_API 指向本機假伺服器 (benchmarks/fake_telegram.py)
+"""
+import os
+import time
+import queue
+import atexit
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import fetcher
+import metrics
+
+# ================= ⚙️ 參數設定區 =================
+API_BASE = os.environ.get("MINIKO_TELEGRAM_API", "https://api.telegram.org")
+
+MAX_CHARS = 4096              # Telegram 單則訊息上限 (以 UTF-16 字元計)
+SEPARATOR = "------------------"
+CHAT_RATE = 1.0               # 同一聊天室每秒最多幾則
+TIMEOUT = 10
+RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+DRAIN_TIMEOUT = 30            # 程式結束時最多等佇列送完幾秒
+# ===============================================
+
+
+# --- 切割 ---
+def _units(text):
+    """Telegram 以 UTF-16 計長度 (emoji 算 2)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_split(text, limit):
+    """沒有換行可切時，直接依長度切"""
+    parts, cur = [], ""
+    for ch in text:
+        if _units(cur) + _units(ch) > limit:
+            parts.append(cur)
+            cur = ""
+        cur += ch
+    return parts + [cur] if cur else parts
+
+
+def _pack(pieces, joiner, limit):
+    """把片段依序塞進 ≤ limit 的訊息 (單一片段過長會先往下切)"""
+    out, cur = [], ""
+    for piece in pieces:
+        if _units(piece) > limit:
+            if cur: out.append(cur)
+            cur = ""
+            sub = _pack(piece.split("\n"), "\n", limit) if joiner != "\n" else _hard_split(piece, limit)
+            out.extend(sub[:-1])
+            cur = sub[-1] if sub else ""
+            continue
+        candidate = cur + joiner + piece if cur else piece
+        if _units(candidate) > limit:
+            out.append(cur)
+            cur = piece
+        else:
+            cur = candidate
+    if cur: out.append(cur)
+    return out
+
+
+def split_message(text, limit=MAX_CHARS):
+    """
+    切成多則 ≤ limit 的訊息：優先在分隔線之後切 (一檔股票不會被拆開)，
+    其次在換行切，最後才硬切；分隔線留在前一則的結尾
+    """
+    if _units(text) <= limit: return [text]
+    # 只認整行的分隔線 (警報內文自己的 ------------------------- 不算)
+    pieces, cur = [], []
+    for line in text.split("\n"):
+        cur.append(line)
+        if line == SEPARATOR:
+            pieces.append("\n".join(cur) + "\n")
+            cur = []
+    if any(cur): pieces.append("\n".join(cur))
+    return [p.rstrip("\n") for p in _pack(pieces, "", limit) if p.strip()]
+
+
+def coalesce(messages):
+    """同一輪的多則警報合併成一則 (以分隔線隔開)"""
+    return f"\n{SEPARATOR}\n".join(m.rstrip("\n") for m in messages)
+
+
+# --- 發送 ---
+class SendError(Exception):
+    pass
+
+
+class _Delivery:
+    """一則訊息 (可能切成多段) 的送達狀態：最後一段處理完才回呼 on_done(ok)"""
+
+    def __init__(self, parts, on_done):
+        self.left, self.ok, self.on_done = parts, True, on_done
+
+    def part_done(self, ok):
+        self.left -= 1
+        self.ok = self.ok and ok
+        if self.left == 0 and self.on_done is not None:
+            try:
+                self.on_done(self.ok)
+            except Exception as e:
+                print(f"❌ 送達回呼失敗：{e}")
+
+
+class Notifier:
+    """背景執行緒 + 佇列的 Telegram 發送器"""
+
+    def __init__(self, token, chat_id, api_base=API_BASE,
+                 rate=CHAT_RATE, retries=RETRIES, base_delay=BASE_DELAY, timeout=TIMEOUT):
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.retries, self.base_delay, self.timeout = retries, base_delay, timeout
+        self.limiter = fetcher.RateLimiter(rate)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.sent = self.dropped = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def send(self, message, report=None, on_done=None):
+        """
+        排入佇列 (立即返回)；過長自動切成多則
+        on_done(ok) 在每一段都處理完後於發送執行緒呼叫 (ok = 全部送達)；空訊息不排入也不回呼
+        """
+        if not message or not message.strip(): return
+        self._ensure_worker()
+        parts = split_message(message)
+        delivery = _Delivery(len(parts), on_done)
+        for part in parts:
+            self._queue.put((part, report, delivery))
+        metrics.inc("miniko_telegram_queued_total", report=report)
+
+    def send_batch(self, messages, report=None, on_done=None):
+        """同一輪的多則訊息合併成一則再排入佇列"""
+        messages = [m for m in messages if m and m.strip()]
+        if messages: self.send(coalesce(messages), report=report, on_done=on_done)
+
+    def flush(self, timeout=DRAIN_TIMEOUT):
+        """等佇列送完 (最多 timeout 秒)；回傳是否全部送完"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline: return False
+            time.sleep(0.05)
+        return True
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="miniko-telegram", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            text, report, delivery = self._queue.get()
+            ok = False
+            try:
+                with metrics.stage("send", report=report, chars=_units(text)):
+                    self._post(text)
+                self.sent += 1
+                ok = True
+            except Exception as e:
+                self.dropped += 1
+                metrics.inc("miniko_telegram_dropped_total", report=report)
+                print(f"❌ Telegram 發送失敗：{e}")
+            finally:
+                delivery.part_done(ok)
+                self._queue.task_done()
+
+    def _post(self, text):
+        """發一則：429 依 retry_after 等待，網路 / 5xx 退避重試，其他 4xx 直接放棄"""
+        payload = {"chat_id": self.chat_id, "text": text,
+                   "parse_mode": "HTML", "disable_web_page_preview": True}
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            delay = min(self.base_delay * (2 ** attempt), MAX_DELAY) * (0.5 + random.random())
+            try:
+                resp = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if resp.ok: return
+                error = SendError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+                if resp.status_code == 429:
+                    metrics.inc("miniko_telegram_throttled_total")
+                    try:
+                        delay = float(resp.json()["parameters"]["retry_after"])
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                elif resp.status_code < 500:
+                    raise error
+            if attempt == self.retries: raise error
+            time.sleep(delay)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_notifier(token, chat_id):
+    """程序共用的發送器 (第一次呼叫時建立，程式結束前會等佇列送完)"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Notifier(token, chat_id)
+            atexit.register(_default.flush)
+        return _default
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+多週期 K 棒重取樣 (Resample)
+只下載最細的週期，其餘在本地合成，所有週期的波浪判斷都出自同一份資料：
+- 30 分 K → 60 分 K：以開盤 09:00 對齊 (09:00 / 10:00 / 11:00 / 12:00 / 13:00 半根)
+- 分 K → 日 K：同一交易日合併
+- 日 K → 週 K：以週一為標籤 (與 Yahoo 週 K 相同)
+13:30 收盤集合競價那筆 (時間戳 ≥ 13:30) 併入當天最後一根 K 棒，不會多出一根孤兒 K 棒。
+Yahoo 分 K 只能回溯約 60 天，超過就無法由 30 分 K 合成，改回直接下載。
+"""
+import pandas as pd
+
+import scheduler
+
+# ================= ⚙️ 參數設定區 =================
+# 合成週期 → (來源週期, 分鐘數；None 代表依日曆合併)
+DERIVED = {
+    "60m": ("30m", 60),
+    "1wk": ("1d", None),
+}
+SOURCE_LIMIT_DAYS = {"30m": 59}   # 來源週期可回溯上限 (超過就不能合成)
+PERIOD_DAYS = {"5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653}
+
+OHLCV_AGG = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+# ===============================================
+
+
+def _minutes(hhmm):
+    h, m = map(int, hhmm.split(":"))
+    return h * 60 + m
+
+
+SESSION_OPEN = _minutes(scheduler.SESSION_START)
+SESSION_MINUTES = _minutes(scheduler.SESSION_END) - SESSION_OPEN
+
+
+def source_for(interval, period):
+    """interval 可由哪個週期合成 (period 超過來源回溯上限或不支援則回傳 None)"""
+    if interval not in DERIVED: return None
+    source = DERIVED[interval][0]
+    limit = SOURCE_LIMIT_DAYS.get(source)
+    days = PERIOD_DAYS.get(period)
+    if limit and (days is None or days > limit): return None
+    return source
+
+
+def session_bins(index, minutes):
+    """
+    每根分 K 所屬的 minutes 分鐘 K 棒起點 (以 09:00 開盤對齊)
+    收盤集合競價 (≥ 13:30) 與盤前 (< 09:00) 的資料收進當天第一 / 最後一根
+    """
+    day = index.normalize()
+    offset = (index.hour * 60 + index.minute - SESSION_OPEN).to_numpy()
+    offset = offset.clip(0, SESSION_MINUTES - 1) // minutes * minutes
+    return day + pd.to_timedelta(offset + SESSION_OPEN, unit="m")
+
+
+def _aggregate(df, keys):
+    agg = {c: f for c, f in OHLCV_AGG.items() if c in df.columns}
+    out = df[list(agg)].groupby(keys).agg(agg)
+    out = out[out['Close'].notna()] if 'Close' in out else out
+    out.index.name = df.index.name
+    return out
+
+
+def resample_intraday(df, minutes):
+    """分 K → 較長的分 K (對齊台股盤中時段)"""
+    if df is None or df.empty: return df
+    return _aggregate(df, session_bins(df.index, minutes))
+
+
+def to_daily(df):
+    """分 K → 日 K"""
+    if df is None or df.empty: return df
+    return _aggregate(df, df.index.normalize())
+
+
+def to_weekly(df):
+    """日 K → 週 K (標籤為該週週一)"""
+    if df is None or df.empty: return df
+    day = df.index.normalize()
+    return _aggregate(df, day - pd.to_timedelta(day.weekday, unit="D"))
+
+
+def derive(df, interval):
+    """由來源週期的 df 合成 interval"""
+    _, minutes = DERIVED[interval]
+    return resample_intraday(df, minutes) if minutes else to_weekly(df)
+
+
+def patch_daily(daily, intraday):
+    """日 K 還沒有的交易日 (盤中 / Yahoo 日 K 尚未定稿) 用分 K 合成補上"""
+    if intraday is None or intraday.empty: return daily
+    if daily is None or daily.empty: return to_daily(intraday)
+    fresh = to_daily(intraday)
+    fresh = fresh[fresh.index > daily.index[-1]]
+    if fresh.empty: return daily
+    return pd.concat([daily, fresh])
+
+
+# --- 寬表 (日期 × 股票) 版：盤後快照 / 全市場用 ---
+def resample_panel(panel, minutes):
+    """{欄位: DataFrame(分 K × 股票)} → 較長週期的同格式寬表"""
+    if not panel: return panel
+    bins = session_bins(next(iter(panel.values())).index, minutes)
+    out = {f: df.groupby(bins).agg(OHLCV_AGG[f]) for f, df in panel.items() if f in OHLCV_AGG}
+    if 'Close' in out:
+        keep = out['Close'].notna().any(axis=1)
+        out = {f: df[keep] for f, df in out.items()}
+    return out
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+事件驅動排程器 (取代 30 秒輪詢)
+用 heap 存每個任務的下一次觸發時間，程序只睡到最近的事件為止。
+- 定時報告：每個交易日固定時刻觸發一次，錯過的時段在寬限時間內補發
+- 即時監控：只在盤中 (09:00 ~ 13:30) 依固定節奏觸發，休市時段完全不醒
+"""
+import os
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+
+import metrics
+
+TW = timezone(timedelta(hours=8))
+
+# 休市日 (國定假日)：環境變數 MINIKO_HOLIDAYS="2026-01-01,2026-02-16,..."
+HOLIDAYS = {
+    d.strip() for d in os.environ.get("MINIKO_HOLIDAYS", "").split(",") if d.strip()
+}
+
+SESSION_START = "09:00"
+SESSION_END = "13:30"
+CATCHUP_GRACE = timedelta(minutes=30)   # 報告錯過多久內仍要補發
+
+
+def now_tw():
+    """台灣時間 (naive datetime，UTC+8)"""
+    return datetime.now(TW).replace(tzinfo=None)
+
+
+def _at(day, hhmm):
+    h, m = map(int, hhmm.split(":"))
+    return datetime(day.year, day.month, day.day, h, m)
+
+
+def is_trading_day(day):
+    return day.weekday() <= 4 and day.strftime('%Y-%m-%d') not in HOLIDAYS
+
+
+def next_trading_day(day):
+    day = day + timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+class DailyJob:
+    """每個交易日 hh:mm 觸發一次"""
+
+    def __init__(self, name, hhmm, fn, grace=CATCHUP_GRACE):
+        self.name, self.hhmm, self.fn, self.grace = name, hhmm, fn, grace
+
+    def first_fire(self, now):
+        slot = _at(now, self.hhmm)
+        # 今天的時段剛錯過 (寬限內) 也要補發
+        if is_trading_day(now) and slot >= now - self.grace:
+            return slot
+        return _at(next_trading_day(now), self.hhmm)
+
+    def next_fire(self, last_slot, now):
+        return _at(next_trading_day(last_slot), self.hhmm)
+
+
+class SessionJob:
+    """盤中每 seconds 秒觸發一次 (跑太久就直接從現在接續，不補跑錯過的節拍)"""
+
+    def __init__(self, name, seconds, fn, start=SESSION_START, end=SESSION_END):
+        self.name, self.fn = name, fn
+        self.grace = None
+        self.interval = timedelta(seconds=seconds)
+        self.start, self.end = start, end
+
+    def _align(self, t):
+        if is_trading_day(t):
+            if t < _at(t, self.start): return _at(t, self.start)
+            if t <= _at(t, self.end): return t
+        return _at(next_trading_day(t), self.start)
+
+    def first_fire(self, now):
+        return self._align(now)
+
+    def next_fire(self, last_slot, now):
+        return self._align(max(last_slot + self.interval, now))
+
+
+class Scheduler:
+    def __init__(self, clock=now_tw, sleep=time.sleep):
+        self.clock, self.sleep = clock, sleep
+        self._heap = []
+        self._seq = itertools.count()
+
+    def _push(self, when, job):
+        heapq.heappush(self._heap, (when, next(self._seq), job))
+
+    def every_trading_day(self, hhmm, name, fn, grace=CATCHUP_GRACE):
+        job = DailyJob(name, hhmm, fn, grace)
+        self._push(job.first_fire(self.clock()), job)
+        return job
+
+    def during_session(self, seconds, name, fn):
+        job = SessionJob(name, seconds, fn)
+        self._push(job.first_fire(self.clock()), job)
+        return job
+
+    def next_event(self):
+        """(觸發時間, 任務名稱)，沒有任務回傳 None"""
+        if not self._heap: return None
+        when, _, job = self._heap[0]
+        return when, job.name
+
+    def run_pending(self):
+        """執行所有已到期的任務 (依時間先後)，回傳執行過的 (時段, 名稱)"""
+        done = []
+        while self._heap and self._heap[0][0] <= self.clock():
+            slot, _, job = heapq.heappop(self._heap)
+            if job.grace is not None and self.clock() - slot > job.grace:
+                # 落後太久 (例如主機休眠) 的時段直接略過，不發過期報告
+                print(f"\n⏭️ 略過過期任務 {job.name} ({slot:%m/%d %H:%M})")
+                metrics.inc("miniko_skipped_slots_total", report=job.name)
+            else:
+                try:
+                    job.fn(slot)
+                except Exception as e:
+                    print(f"\n❌ 排程任務 {job.name} ({slot:%H:%M}) 失敗：{e}")
+                    metrics.failure("job", e, report=job.name)
+                done.append((slot, job.name))
+            self._push(job.next_fire(slot, self.clock()), job)
+        return done
+
+    def run_forever(self):
+        while self._heap:
+            self.run_pending()
+            when, name = self.next_event()
+            wait = (when - self.clock()).total_seconds()
+            if wait > 0:
+                print(f"\r💤 下一個事件 {when:%m/%d %H:%M:%S} ({name})，休眠 {int(wait)} 秒...", end="")
+                self.sleep(wait)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Miniko 選股計分引擎 (SOP 優先計分制，向量化版本)
+對整個 (日期 × 股票) 寬表一次算出每檔的分數與入選理由位元遮罩；
+各項加分條件寫在 SCORE_RULES (規則語言見 signal_dsl.py)，載入時編譯一次。
+全市場模式把股票池切成分片，丟給 process pool 各自下載 + 計分，只回傳有分數的精簡紀錄。
+"""
+import os
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+import bars
+import indicators
+import metrics
+import signal_dsl
+
+# 入選理由位元
+R_SOP = 1        # 👑 SOP 三線合一
+R_WHALE = 2      # 🔥 權證大戶
+R_SURGE = 4      # 爆量
+R_HIGH_C = 8     # 高檔強勢整理
+R_GULU = 16      # 底部咕嚕咕嚕
+R_STREAK = 32    # 主力連買
+
+# 連買天數只看最近 10 根 K 棒 (最多 9 組前後比較)
+STREAK_WINDOW = 9
+# 資料滿 30 根才計分；score_panel 只需最後 SCORE_TAIL 根
+MIN_BARS = 30
+SCORE_TAIL = 12
+
+# 計分門檻 (sweep.py 以同樣的鍵名掃描)
+THRESHOLDS = {
+    "whale_turnover": 20000000,       # 權證大戶：成交金額 (元)
+    "surge_ratio": 1.5,               # 爆量：成交量 / 5 日均量
+    "min_volume": 1000000,            # 流動性：最低成交量 (股)
+    "min_volume_high_price": 500000,  # 高價股的最低成交量
+    "high_price": 500,
+    "high_c_kmax": 70,                # 高檔整理：10 日內 K 最高值
+    "high_c_k_low": 40,               # 高檔整理：今日 K 區間
+    "high_c_k_high": 60,
+    "high_c_flat": 0.04,              # 高檔整理：5 日漲跌幅上限
+    "gulu_k": 50,                     # 底部咕嚕：K 值上限
+    "streak_min": 3,                  # 主力連買天數區間
+    "streak_max": 10,
+}
+
+# 加分條件 (依序編譯，後面的可引用前面的；Eligible = 可交易且資料已暖機)
+SCORE_RULES = {
+    "streak_days": f"streak({STREAK_WINDOW})",
+    "vol_ratio": "Volume / Vol_MA5",
+    # 🔥 流動性過濾：成交量 > 1000張 (股價>500 則 500張) 或 爆量 1.5 倍
+    "surge": "Volume > Vol_MA5 * surge_ratio",
+    "liquid": "(Volume >= where(Close > high_price, min_volume_high_price, min_volume) | surge) & Eligible",
+    # ✅ C. SOP (MACD + SAR + KD) -> 絕對優先
+    "sop": "MACD_Hist.cross_up(0) & SAR_Bull & K.prev() < D.prev() & K > D",
+    # ✅ A. 權證/爆量
+    "whale": "Close * Volume > whale_turnover & Close.rising()",
+    # ✅ B. 型態 (高檔整理與咕嚕互斥)
+    "high_c": "K.max(10) > high_c_kmax & K.between(high_c_k_low, high_c_k_high) & "
+              "abs((Close - Close.prev(5)) / Close.prev(5)) < high_c_flat",
+    "gulu": "~high_c & K < gulu_k & K.rising() & Close > MA5",
+    # ✅ D. 主力連買 (3~10天)
+    "streak": "streak_days.between(streak_min, streak_max)",
+}
+SCORE = signal_dsl.RuleSet(SCORE_RULES)
+# (條件, 分數, 理由位元)；只有通過流動性過濾的才加分
+SCORE_POINTS = [
+    ("sop", 1000, R_SOP), ("whale", 30, R_WHALE), ("surge", 20, R_SURGE),
+    ("high_c", 10, R_HIGH_C), ("gulu", 10, R_GULU), ("streak", 25, R_STREAK),
+]
+
+# 每條執行緒一份指標暫存陣列 (Streamlit 多個 Session 同時掃描互不干擾)
+_local = threading.local()
+
+# 全市場掃描：每個分片一次批次下載的檔數、平行的程序數
+SHARD_SIZE = 150
+SCAN_WORKERS = int(os.environ.get("MINIKO_SCAN_WORKERS", os.cpu_count() or 4))
+# 回傳給主程序的欄位 (精簡型別)
+COMPACT_DTYPES = {'score': 'int32', 'reasons': 'int16', 'vol_ratio': 'float32',
+                  'streak': 'int16', 'close': 'float32', 'chg': 'float32', 'volume': 'float64'}
+
+
+def score_features(close, open_, volume, k, d, hist, ma5, sar_bull, tradable, start=0):
+    """
+    SCORE_RULES 用到、與門檻無關的 (日期 × 股票) 陣列 (參數掃描時只算一次)
+    輸入為已補值的寬表；tradable 為可交易遮罩 (每檔一個值或逐日)；start 為第一列在全部資料中的位置
+    """
+    vol_ma5 = volume.rolling(5).mean().values
+    warm = (np.arange(start, start + len(close)) >= MIN_BARS - 1)[:, None]
+    return SCORE.features({
+        'Close': close.values, 'Open': open_.values, 'Volume': volume.values,
+        'Vol_MA5': np.where(vol_ma5 == 0, 1, vol_ma5),
+        'K': k.values, 'D': d.values, 'MACD_Hist': hist.values, 'MA5': ma5.values,
+        'SAR_Bull': np.asarray(sar_bull, dtype=bool),
+        'Eligible': np.asarray(tradable, dtype=bool) & warm,
+    })
+
+
+def score_from_features(f, t=THRESHOLDS):
+    """score_features 的結果 + 門檻 → {score, reasons, vol_ratio, streak}"""
+    hit = SCORE.apply(f, t)
+    liquid = hit['liquid']
+    shape = np.shape(hit['vol_ratio'])
+    score = np.zeros(shape, dtype=np.int64)
+    reasons = np.zeros(shape, dtype=np.int64)
+    for name, points, bit in SCORE_POINTS:
+        mask = hit[name] & liquid
+        score[mask] += points
+        reasons[mask] |= bit
+    return {'score': score, 'reasons': reasons, 'vol_ratio': hit['vol_ratio'], 'streak': hit['streak_days']}
+
+
+def score_matrix(close, open_, volume, k, d, hist, ma5, sar_bull, tradable, start=0, t=THRESHOLDS):
+    """
+    每個 (日期 × 股票) 的分數與理由位元 (回測逐日用；score_panel 取最後一列)
+    輸入為已補值的寬表；tradable 為可交易遮罩 (每檔一個值或逐日)；start 為第一列在全部資料中的位置
+    回傳 {score, reasons, vol_ratio, streak}，皆為 (日期 × 股票) 陣列
+    """
+    return score_from_features(
+        score_features(close, open_, volume, k, d, hist, ma5, sar_bull, tradable, start), t)
+
+
+def _score_last(close, open_, volume, k, d, hist, ma5, sar_bull, has_data, start, tickers):
+    """已補值的最後幾列 → 最後一天的分數表 (score_panel / score_bars 共用)"""
+    m = score_matrix(close, open_, volume, k, d, hist, ma5, sar_bull, has_data, start=start)
+    c0, c1 = close.values[-1], close.values[-2]
+    return pd.DataFrame({
+        'score': m['score'][-1],
+        'reasons': m['reasons'][-1],
+        'vol_ratio': m['vol_ratio'][-1],
+        'streak': m['streak'][-1],
+        'close': c0,
+        'chg': (c0 - c1) / c1 * 100,
+        'volume': volume.values[-1],
+    }, index=tickers)
+
+
+def score_panel(panel, ind):
+    """
+    整個寬表一次計分，回傳以股票代號為索引的 DataFrame：
+    score (分數)、reasons (理由位元)、vol_ratio、streak、close、chg (%)、volume
+    """
+    raw_close = panel['Close']
+    tickers = raw_close.columns
+    has_data = raw_close.notna().any().values
+
+    # 缺值先前補再後補 (停牌日沿用前一日)
+    close = raw_close.ffill().bfill()
+    open_ = panel['Open'].ffill().bfill()
+    volume = panel['Volume'].ffill().bfill()
+    k = ind['K'].ffill().bfill()
+    d = ind['D'].ffill().bfill()
+    hist = ind['MACD_Hist'].ffill().bfill()
+    ma5 = ind['MA5'].ffill().bfill()
+
+    # 只有最後一列要用：截掉用不到的舊資料 (最長回看 10 根 + 前一根)，暖機門檻照全長計算
+    tail = SCORE_TAIL if len(close) >= MIN_BARS else len(close)
+    return _score_last(close.iloc[-tail:], open_.iloc[-tail:], volume.iloc[-tail:],
+                       k.iloc[-tail:], d.iloc[-tail:], hist.iloc[-tail:], ma5.iloc[-tail:],
+                       ind['SAR_Bull'].values[-tail:].astype(bool), has_data, len(close) - tail, tickers)
+
+
+def score_bars(compact):
+    """
+    score_panel 的精簡版：吃 bars.Bars (float32 價格)，只算計分要用的 5 個指標，
+    中間值放在這條執行緒的暫存陣列，最後只組出 SCORE_TAIL 列的小表
+    """
+    n = len(compact)
+    tail = SCORE_TAIL if n >= MIN_BARS else n
+    scratch = getattr(_local, "scratch", None)
+    if scratch is None: scratch = _local.scratch = indicators.Scratch()
+    ind = indicators.calc_score_indicators(compact.high, compact.low, compact.close, tail, scratch)
+
+    def frame(values):
+        return pd.DataFrame(np.asarray(values, dtype=float), index=compact.dates[-tail:], columns=compact.tickers)
+
+    return _score_last(frame(bars.fill_gaps(compact.close)[-tail:]), frame(bars.fill_gaps(compact.open)[-tail:]),
+                       frame(compact.filled_volume()[-tail:]), frame(ind['K']), frame(ind['D']),
+                       frame(ind['MACD_Hist']), frame(ind['MA5']), ind['SAR_Bull'],
+                       compact.valid.any(axis=0), n - tail, compact.tickers)
+
+
+def reason_labels(row):
+    """把理由位元還原成文字 (順序與原本逐檔計分相同)"""
+    labels = []
+    bits = int(row['reasons'])
+    if bits & R_SOP: labels.append("👑【SOP】三線合一(絕對優先)")
+    if bits & R_WHALE: labels.append("🔥權證大戶(>500萬)")
+    if bits & R_SURGE: labels.append(f"爆量({int(row['vol_ratio'])}倍)")
+    if bits & R_HIGH_C: labels.append("高檔強勢整理")
+    if bits & R_GULU: labels.append("底部咕嚕咕嚕")
+    if bits & R_STREAK: labels.append(f"主力連買{int(row['streak'])}天")
+    return labels
+
+
+def top_candidates(scores, n=20):
+    """取分數最高的 n 檔 (argpartition 選出後只排序這 n 檔)；分數 0 不入選"""
+    values = scores['score'].values
+    positive = np.flatnonzero(values > 0)
+    if len(positive) == 0: return scores.iloc[:0]
+    n = min(n, len(positive))
+    pick = np.sort(positive[np.argpartition(-values[positive], n - 1)[:n]])
+    pick = pick[np.argsort(-values[pick], kind='stable')]
+    return scores.iloc[pick]
+
+
+# --- 全市場掃描 ---
+def scan_shard(tickers, period="3mo"):
+    """單一分片：批次下載 → 指標 → 計分，只回傳分數 > 0 的精簡紀錄 (在子程序執行)"""
+    compact = bars.Bars.from_bulk(bar_store.get_bars_bulk(tickers, period=period), tickers)
+    if compact is None:
+        return pd.DataFrame(columns=list(COMPACT_DTYPES)).astype(COMPACT_DTYPES)
+    scores = score_bars(compact)
+    return scores.loc[scores['score'] > 0, list(COMPACT_DTYPES)].astype(COMPACT_DTYPES)
+
+
+def pool_context():
+    """process pool 的啟動方式"""
+    # Streamlit 本身有多條執行緒，fork 可能複製到鎖住的鎖；改用 forkserver / spawn
+    methods = mp.get_all_start_methods()
+    return mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def scan_universe(tickers, period="3mo", shard_size=SHARD_SIZE, workers=SCAN_WORKERS, on_progress=None):
+    """
+    全市場掃描：切成每片 shard_size 檔，由 process pool 平行下載與計分
+    回傳所有分數 > 0 的紀錄 (格式同 score_panel)；on_progress(完成片數, 總片數) 可更新進度條
+    """
+    tickers = list(tickers)
+    shards = [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+    if not shards: return pd.DataFrame(columns=list(COMPACT_DTYPES))
+
+    results = []
+    with metrics.stage("scan_universe", tickers=len(tickers), shards=len(shards)):
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(shards))),
+                                 mp_context=pool_context()) as pool:
+            futures = {pool.submit(scan_shard, shard, period): i for i, shard in enumerate(shards)}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # 單一分片失敗 (例如下載逾時) 不影響其他分片
+                    metrics.failure("scan_shard", e, symbol=f"shard{futures[future]}")
+                if on_progress: on_progress(done, len(shards))
+
+    results = [r for r in results if not r.empty]
+    if not results: return pd.DataFrame(columns=list(COMPACT_DTYPES))
+    return pd.concat(results)
+
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+訊號規則語言 (Signal DSL)
+訊號 / 計分 / 波浪規則寫成一行式子，載入時編譯一次，之後直接在 (日期 × 股票) 陣列上向量化求值：
+
+    "MACD_Hist.cross_up(0) & Close > SMA22 & K > D"
+
+- 大寫開頭的名稱是欄位 (Close、K、MACD_Hist、SMA22…)，由呼叫端提供陣列
+- 小寫名稱是門檻 (whale_turnover…)，求值時由門檻表代入；與同一組規則裡先定義的規則同名則引用該規則
+- & | ~ 是邏輯運算 (優先順序低於比較，不必加括號)，支援 + - * / 與連續比較 (a <= K <= b)
+- 方法：x.prev(n=1)、x.max(n)、x.min(n)、x.mean(n)、x.rising()、x.falling()、
+  x.cross_up(y)、x.cross_down(y)、x.between(a, b)
+- 函數：abs(x)、where(條件, a, b)、fill(x, y) (x 缺值用 y)、streak(n) (連續強勢天數，最多 n)、
+  window_streak(n) (只看最近 n 根的連續強勢天數，視窗第一根沒有前一根可比，只看是否收紅)
+
+與門檻無關的子式 (指標位移、滾動最大值、純欄位比較…) 由 features() 一次算好，
+apply() 只剩門檻比較與邏輯運算 —— 參數掃描換一組門檻不必重算特徵。
+單檔用 last()、寬表只看最後一天用 tail()，都只取最後 lookback 根計算；
+盤中串流用 stream()：有歷史的節點各自保存已收盤 K 棒的值，每次只做純量運算。
+"""
+import ast
+import operator
+from collections import deque
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+_BIN_OPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide}
+_CMP_OPS = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le,
+            ast.Eq: operator.eq, ast.NotEq: operator.ne}
+_NAN = float('nan')
+
+
+# --- 陣列運算 (沿時間軸 = 第 0 軸；一維單檔或二維寬表皆可) ---
+def _shift(x, n=1):
+    if np.ndim(x) == 0: return x
+    x = np.asarray(x, dtype=float)
+    out = np.full_like(x, np.nan)
+    if n < len(x): out[n:] = x[:len(x) - n]
+    return out
+
+
+def _window(reducer):
+    def run(x, n):
+        x = np.asarray(x, dtype=float)
+        out = np.full_like(x, np.nan)
+        if len(x) >= n:
+            out[n - 1:] = reducer(np.lib.stride_tricks.sliding_window_view(x, n, axis=0), axis=-1)
+        return out
+    return run
+
+
+def _streak(open_, close, cap):
+    """連續強勢天數 (收紅 或 收盤高於前一根)，最多 cap；第一根只看是否收紅"""
+    strong = (close >= open_) | (close > _shift(close))
+    c = np.cumsum(strong, axis=0)
+    reset = np.maximum.accumulate(np.where(strong, 0, c), axis=0)
+    return np.minimum(c - reset, cap)
+
+
+def _window_streak(open_, close, n):
+    """最近 n 根內的連續強勢天數：視窗第一根 (往前第 n-1 根) 只看是否收紅"""
+    run = _streak(open_, close, np.inf)
+    red_start = _shift(close >= open_, n - 1) == 1
+    return np.where(run >= n, np.where(red_start, n, n - 1), run)
+
+
+def _fill(x, y):
+    return np.where(np.isnan(x), y, x)
+
+
+# 方法 / 函數 → (實作, 需要的額外歷史根數)
+_METHODS = {
+    "prev": (_shift, lambda n=1: n),
+    "max": (_window(np.max), lambda n: n - 1),
+    "min": (_window(np.min), lambda n: n - 1),
+    "mean": (_window(np.mean), lambda n: n - 1),
+    "rising": (lambda x: x > _shift(x), lambda: 1),
+    "falling": (lambda x: x < _shift(x), lambda: 1),
+    "cross_up": (lambda x, y: (_shift(x) <= _shift(y)) & (x > y), lambda y: 1),
+    "cross_down": (lambda x, y: (_shift(x) >= _shift(y)) & (x < y), lambda y: 1),
+    "between": (lambda x, lo, hi: (lo <= x) & (x <= hi), lambda lo, hi: 0),
+}
+_FUNCS = {
+    "abs": (np.abs, lambda x: 0),
+    "where": (np.where, lambda c, a, b: 0),
+    "fill": (_fill, lambda x, y: 0),
+}
+
+
+# --- 串流狀態 (單檔逐根純量求值；value 不改動狀態，commit 在收盤時寫入該根) ---
+class _Lag:
+    """保留最近 size 根已收盤的參數值，fn(歷史, *今天的參數) 算出今天的值"""
+    __slots__ = ('hist', 'fn')
+
+    def __init__(self, size, fn):
+        self.hist, self.fn = deque(maxlen=size), fn
+
+    def value(self, *args):
+        return self.fn(self.hist, *args)
+
+    def commit(self, *args):
+        self.hist.append(args)
+
+
+class _Run:
+    """連續強勢天數：只存到昨天為止的天數 (不設上限)、昨收與視窗內各根是否收紅"""
+    __slots__ = ('n', 'window', 'run', 'prev_close', 'red')
+
+    def __init__(self, n, window):
+        self.n, self.window = n, window
+        self.run, self.prev_close = 0, _NAN
+        self.red = deque(maxlen=max(n - 1, 0))
+
+    def _today(self, o, c):
+        return self.run + 1 if (c >= o or c > self.prev_close) else 0
+
+    def value(self, o, c):
+        run = self._today(o, c)
+        if not self.window: return min(run, self.n)
+        if run < self.n: return run
+        red_start = self.red[0] if self.n > 1 else c >= o
+        return self.n if red_start else self.n - 1
+
+    def commit(self, o, c):
+        self.run, self.prev_close = self._today(o, c), c
+        self.red.append(c >= o)
+
+
+def _rolling(reducer, n):
+    return _Lag(n - 1, lambda h, x: reducer([a for a, in h] + [x]) if len(h) == n - 1 else _NAN)
+
+
+# 有歷史的方法 → 串流狀態 (參數同 _METHODS)
+_STREAMS = {
+    "prev": lambda n=1: _Lag(n, lambda h, x: h[0][0] if len(h) == n else _NAN),
+    "max": lambda n: _rolling(np.max, n),
+    "min": lambda n: _rolling(np.min, n),
+    "mean": lambda n: _rolling(np.mean, n),
+    "rising": lambda: _Lag(1, lambda h, x: bool(h) and x > h[-1][0]),
+    "falling": lambda: _Lag(1, lambda h, x: bool(h) and x < h[-1][0]),
+    "cross_up": lambda: _Lag(1, lambda h, x, y: bool(h) and h[-1][0] <= h[-1][1] and x > y),
+    "cross_down": lambda: _Lag(1, lambda h, x, y: bool(h) and h[-1][0] >= h[-1][1] and x < y),
+}
+
+
+# --- 語法樹 ---
+class _Node:
+    """
+    編譯後的節點：key 為正規化後的子式文字 (特徵快取的鍵)；pure = 不含門檻；lookback = 需要的額外根數
+    stream = 有歷史的節點建立串流狀態的函數 (其餘為 None)
+    """
+    __slots__ = ('key', 'kind', 'value', 'fn', 'args', 'pure', 'const', 'lookback', 'stream')
+
+    def __init__(self, key, kind, value=None, fn=None, args=(), extra=0, stream=None):
+        self.key, self.kind, self.value, self.fn, self.args = key, kind, value, fn, tuple(args)
+        self.stream = stream
+        self.pure = kind != 'param' and all(a.pure for a in self.args)
+        self.const = kind == 'const' or (kind == 'op' and all(a.const for a in self.args))
+        self.lookback = extra + max((a.lookback for a in self.args), default=0)
+
+    def columns(self):
+        if self.kind == 'col': return {self.value}
+        return set().union(*(a.columns() for a in self.args)) if self.args else set()
+
+    def params(self):
+        if self.kind == 'param': return {self.value}
+        return set().union(*(a.params() for a in self.args)) if self.args else set()
+
+
+def _normalize(text):
+    # & | ~ 換成 and / or / not：優先順序低於比較，"a > b & c > d" 才會照字面意思分組
+    return " ".join(text.replace("&", " and ").replace("|", " or ").replace("~", " not ").split())
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)): return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub): return -_literal(node.operand)
+    raise ValueError(f"方法參數必須是數字常數：{ast.unparse(node)}")
+
+
+class _Compiler:
+    def __init__(self, rules):
+        self.rules = rules   # 已編譯的規則 (可被後面的規則引用)
+
+    def compile(self, text):
+        try:
+            tree = ast.parse(_normalize(text), mode='eval').body
+        except SyntaxError as e:
+            raise ValueError(f"規則語法錯誤：{text} ({e.msg})") from None
+        return self.node(tree)
+
+    def node(self, t):
+        key = ast.unparse(t)
+        if isinstance(t, ast.Constant):
+            if not isinstance(t.value, (int, float, bool)): raise ValueError(f"不支援的常數：{key}")
+            return _Node(key, 'const', value=t.value)
+        if isinstance(t, ast.Name):
+            if t.id in self.rules: return self.rules[t.id]
+            if t.id[0].isupper(): return _Node(key, 'col', value=t.id)
+            return _Node(key, 'param', value=t.id)
+        if isinstance(t, ast.BoolOp):
+            fn = np.logical_and if isinstance(t.op, ast.And) else np.logical_or
+            args = [self.node(v) for v in t.values]
+            return _Node(key, 'op', fn=lambda *xs: reduce(fn, xs), args=args)
+        if isinstance(t, ast.UnaryOp):
+            fn = {ast.Not: np.logical_not, ast.USub: np.negative, ast.UAdd: np.positive}[type(t.op)]
+            return _Node(key, 'op', fn=fn, args=[self.node(t.operand)])
+        if isinstance(t, ast.BinOp) and type(t.op) in _BIN_OPS:
+            return _Node(key, 'op', fn=_BIN_OPS[type(t.op)], args=[self.node(t.left), self.node(t.right)])
+        if isinstance(t, ast.Compare):
+            ops = [_CMP_OPS[type(op)] for op in t.ops]
+            args = [self.node(t.left)] + [self.node(c) for c in t.comparators]
+
+            def compare(*xs, ops=ops):
+                out = ops[0](xs[0], xs[1])
+                for i, op in enumerate(ops[1:], 1):
+                    out = out & op(xs[i], xs[i + 1])
+                return out
+            return _Node(key, 'op', fn=compare, args=args)
+        if isinstance(t, ast.Call) and not t.keywords:
+            if isinstance(t.func, ast.Attribute) and t.func.attr in _METHODS:
+                fn, extra = _METHODS[t.func.attr]
+                target = self.node(t.func.value)
+                stream = _STREAMS.get(t.func.attr)
+                if t.func.attr in ("prev", "max", "min", "mean"):
+                    n = [_literal(a) for a in t.args]
+                    return _Node(key, 'op', fn=lambda x, fn=fn, n=n: fn(x, *n), args=[target], extra=extra(*n),
+                                 stream=lambda stream=stream, n=n: stream(*n))
+                args = [self.node(a) for a in t.args]
+                return _Node(key, 'op', fn=fn, args=[target] + args, extra=extra(*args), stream=stream)
+            if isinstance(t.func, ast.Name) and t.func.id in ("streak", "window_streak"):
+                n = _literal(t.args[0])
+                window = t.func.id == "window_streak"
+                fn = _window_streak if window else _streak
+                return _Node(key, 'op', fn=lambda o, c, fn=fn, n=n: fn(o, c, n),
+                             args=[_Node("Open", 'col', value="Open"), _Node("Close", 'col', value="Close")],
+                             extra=n - 1 if window else n, stream=lambda n=n, window=window: _Run(n, window))
+            if isinstance(t.func, ast.Name) and t.func.id in _FUNCS:
+                fn, extra = _FUNCS[t.func.id]
+                args = [self.node(a) for a in t.args]
+                return _Node(key, 'op', fn=fn, args=args, extra=extra(*args))
+        raise ValueError(f"不支援的語法：{key}")
+
+
+# --- 規則集 ---
+class RuleSet:
+    """
+    一組具名規則 (依序編譯，後面的規則可引用前面的)
+    columns：需要的欄位；params：用到的門檻；lookback：只算最後一根時需要的 K 棒數
+    """
+
+    def __init__(self, rules):
+        compiler = _Compiler({})
+        self.nodes = {}
+        for name, text in rules.items():
+            self.nodes[name] = compiler.rules[name] = compiler.compile(text)
+        self.columns = sorted(set().union(*(n.columns() for n in self.nodes.values())))
+        self.params = sorted(set().union(*(n.params() for n in self.nodes.values())))
+        self.lookback = 1 + max(n.lookback for n in self.nodes.values())
+
+    def _roots(self):
+        """與門檻無關、又不是常數的最大子式 (特徵)"""
+        roots, stack = {}, list(self.nodes.values())
+        while stack:
+            node = stack.pop()
+            if node.const: continue
+            if node.pure: roots.setdefault(node.key, node)
+            else: stack.extend(node.args)
+        return roots
+
+    def features(self, env):
+        """env {欄位: 陣列} → {子式: 陣列}；共用的子式 (如 Close.prev()) 只算一次"""
+        missing = [c for c in self.columns if c not in env]
+        if missing: raise KeyError(f"缺少欄位：{', '.join(missing)}")
+        cache = {}
+
+        def run(node):
+            if node.kind == 'const': return node.value
+            if node.kind == 'col': return np.asarray(env[node.value])
+            if node.key not in cache:
+                cache[node.key] = node.fn(*(run(a) for a in node.args))
+            return cache[node.key]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {key: run(node) for key, node in self._roots().items()}
+
+    def apply(self, features, t=None):
+        """features() 的結果 + 門檻 → {規則名稱: 陣列}"""
+        t = t or {}
+
+        def run(node):
+            if node.kind == 'const': return node.value
+            if node.kind == 'param':
+                if node.value not in t: raise KeyError(f"缺少門檻：{node.value}")
+                return t[node.value]
+            if node.pure and not node.const: return features[node.key]
+            return node.fn(*(run(a) for a in node.args))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {name: run(node) for name, node in self.nodes.items()}
+
+    def evaluate(self, env, t=None):
+        """整張寬表求值 (每個日期 × 股票)"""
+        return self.apply(self.features(env), t)
+
+    def tail(self, frames, t=None):
+        """寬表只算最後一個日期：{欄位: DataFrame(日期 × 股票)} → {規則名稱: 每檔一個值} (只取最後 lookback 列)"""
+        env = {c: np.asarray(frames[c])[-self.lookback:] for c in self.columns if c in frames}
+        return {name: np.asarray(v)[-1] if np.ndim(v) else v for name, v in self.evaluate(env, t).items()}
+
+    def last(self, df, t=None):
+        """單檔 DataFrame 最後一根的結果 {規則名稱: 純量} (只取最後 lookback 根計算；缺的欄位視為缺值)"""
+        tail = df.iloc[-self.lookback:]
+        env = {c: tail[c].to_numpy(dtype=float) if c in tail else np.full(len(tail), np.nan)
+               for c in self.columns}
+        return {name: np.asarray(v)[-1].item() if np.ndim(v) else v
+                for name, v in self.evaluate(env, t).items()}
+
+    def stream(self, t=None):
+        """單檔盤中串流求值器 (門檻 t 在建立時代入)，見 RuleStream"""
+        return RuleStream(self, t)
+
+
+class RuleStream:
+    """
+    單檔串流求值：有歷史的子式 (位移、滾動、連續天數…) 各自保存已收盤 K 棒的狀態，
+    evaluate(row) 只對今天的一列做純量運算 (不改動狀態)；commit(row) 在收盤時把該列寫入狀態
+    row 為 {欄位: 數值}，缺的欄位視為缺值；結果與 RuleSet.last() 對同一段歷史相同
+    """
+
+    def __init__(self, rules, t=None):
+        self.rules, self.t = rules, t or {}
+        self.states, stack = {}, list(rules.nodes.values())
+        while stack:
+            node = stack.pop()
+            if node.stream is not None and node.key not in self.states:
+                self.states[node.key] = node.stream()
+            stack.extend(node.args)
+
+    def _run(self, row):
+        """今天一列的 {規則名稱: 值} 與各串流節點今天的參數"""
+        cache, inputs = {}, {}
+
+        def run(node):
+            if node.kind == 'const': return node.value
+            if node.kind == 'col': return row.get(node.value, _NAN)
+            if node.kind == 'param':
+                if node.value not in self.t: raise KeyError(f"缺少門檻：{node.value}")
+                return self.t[node.value]
+            if node.key not in cache:
+                args = [run(a) for a in node.args]
+                state = self.states.get(node.key)
+                if state is None:
+                    cache[node.key] = node.fn(*args)
+                else:
+                    inputs[node.key] = args
+                    cache[node.key] = state.value(*args)
+            return cache[node.key]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {name: run(node) for name, node in self.rules.nodes.items()}, inputs
+
+    def evaluate(self, row):
+        """今天 (尚未收盤) 的一列 → {規則名稱: 純量}"""
+        return {name: np.asarray(v).item() for name, v in self._run(row)[0].items()}
+
+    def commit(self, row):
+        """一根已收盤 K 棒寫入各串流節點的狀態"""
+        for key, args in self._run(row)[1].items():
+            self.states[key].commit(*args)
+
+
+def frame_env(frames, columns):
+    """{欄位: DataFrame(日期 × 股票)} → {欄位: ndarray} (只取規則用到的欄位)"""
+    return {c: frames[c].to_numpy() if isinstance(frames[c], (pd.DataFrame, pd.Series)) else frames[c]
+            for c in columns if c in frames}
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+cloud_bot 的 6 大核心訊號與個股戰情室的 SOP 細項 (規則語言見 signal_dsl.py)
+規則只寫一次、載入時編譯：
+- evaluate：單檔最後一根 (cloud_bot 批次 DataFrame、個股戰情室)；盤中串流 StreamingIndicators 用 SIGNALS.stream() + labels
+- evaluate_panel：(日期 × 股票) 全歷史版本 (回測)；panel_features / signal_masks 拆成特徵與門檻兩段 (參數掃描)
+- SOP：KD / MACD / SAR 細項，個股戰情室與盤後快照共用
+"""
+import signal_dsl
+
+# 訊號代號 (回測統計用)：依訊號文字開頭的 emoji 對應
+SIGNAL_KEYS = {
+    "🔥": "whale", "✅": "sop", "☕": "high_c", "💧": "gulu", "🚀": "breakout", "🛡️": "streak",
+}
+SIGNAL_NAMES = {
+    "whale": "主力權證大單", "sop": "SOP 起漲訊號", "high_c": "High C 高檔整理",
+    "gulu": "底部咕嚕咕嚕", "breakout": "出量突破", "streak": "主力連買",
+}
+
+# 訊號門檻 (sweep.py 以同樣的鍵名掃描)
+THRESHOLDS = {
+    "whale_turnover": 30000000,   # 主力權證大單：成交金額 (元)
+    "surge_ratio": 1.5,           # 出量突破：成交量 / 5 日均量
+    "breakout_pct": 0.03,         # 出量突破：漲幅
+    "high_c_kmax": 70,            # High C：10 日內 K 最高值
+    "high_c_k_low": 40,           # High C：今日 K 區間
+    "high_c_k_high": 60,
+    "gulu_k": 40,                 # 底部咕嚕：K 值上限
+    "streak_min": 3,              # 主力連買天數區間
+    "streak_max": 10,
+}
+# 連買天數只看最近 10 根 K 棒 (視窗第一根只看是否收紅)
+STREAK_BARS = 10
+
+
+# 6 大訊號 (名稱 = 訊號代號；consecutive 是連買天數本身，不是訊號)
+RULES = {
+    "consecutive": f"window_streak({STREAK_BARS})",
+    "whale": "Close * Volume > whale_turnover & Close.rising()",
+    "sop": "MACD_Hist.cross_up(0) & Close > SMA22 & K > D",
+    "high_c": "K.max(10) > high_c_kmax & K.between(high_c_k_low, high_c_k_high) & Close > MA20",
+    "gulu": "K < gulu_k & K.rising() & K > D",
+    "breakout": "Volume > Vol_MA5 * surge_ratio & Close > Close.prev() * (1 + breakout_pct)",
+    "streak": "consecutive.between(streak_min, streak_max)",
+}
+SIGNALS = signal_dsl.RuleSet(RULES)
+
+# 訊號文字 (依觸發順序列出)
+SIGNAL_LABELS = {
+    "whale": "🔥 <b>主力權證大單</b>",
+    "sop": "✅ <b>SOP 起漲訊號</b>",
+    "high_c": "☕ <b>High C 高檔整理</b>",
+    "gulu": "💧 <b>底部咕嚕咕嚕</b>",
+    "breakout": "🚀 <b>出量突破</b>",
+    "streak": "🛡️ <b>主力連買({consecutive}天)</b>",
+}
+
+# SOP 細項 (個股戰情室檢核表 / 盤後快照)
+SOP_RULES = {
+    "kd_cross": "K.prev() < D.prev() & K > D",
+    "kd_bull": "K > D",
+    "macd_flip": "MACD_Hist.cross_up(0)",
+    "macd_bull": "MACD_Hist > 0",
+    "sar_bull": "Close > SAR",
+    "perfect_sop": "kd_bull & macd_bull & sar_bull",
+    "sop_pass": "(kd_bull | macd_bull) & sar_bull",
+    "gulu_watch": "K < 50 & K.rising()",   # 檢核表的咕嚕 (比 6 大訊號寬鬆：不要求 K > D)
+}
+SOP = signal_dsl.RuleSet(SOP_RULES)
+
+
+def evaluate(df, t=THRESHOLDS):
+    """檢核 6 大核心訊號 (df 為含指標的日 K，只用最後 SIGNALS.lookback 根)，回傳訊號文字清單"""
+    if len(df) < 2: return []
+    return labels(SIGNALS.last(df, t))
+
+
+def labels(hit):
+    """SIGNALS 單根的結果 (last() / 串流 evaluate()) → 訊號文字清單"""
+    consecutive = int(hit["consecutive"])
+    return [label.format(consecutive=consecutive) for key, label in SIGNAL_LABELS.items() if hit[key]]
+
+
+def signal_key(label):
+    """evaluate() 回傳的訊號文字 → 訊號代號"""
+    for emoji, key in SIGNAL_KEYS.items():
+        if label.startswith(emoji): return key
+    return None
+
+
+def _env(close, open_, volume, ind):
+    frames = {**ind, 'Close': close, 'Open': open_, 'Volume': volume}
+    return signal_dsl.frame_env(frames, SIGNALS.columns)
+
+
+def panel_features(close, open_, volume, ind):
+    """evaluate_panel 用到、與門檻無關的 (日期 × 股票) 陣列 (參數掃描時只算一次)"""
+    return SIGNALS.features(_env(close, open_, volume, ind))
+
+
+def signal_masks(f, t=THRESHOLDS):
+    """panel_features 的結果 + 門檻 → {訊號代號: 布林陣列}"""
+    out = SIGNALS.apply(f, t)
+    return {key: out[key] for key in SIGNAL_NAMES}
+
+
+def evaluate_panel(close, open_, volume, ind, t=THRESHOLDS):
+    """
+    6 大訊號的全歷史版本：每個 (日期 × 股票) 當天是否觸發，回傳 {訊號代號: 布林陣列}
+    close / open_ / volume / ind[...] 為已補值的寬表
+    """
+    return signal_masks(panel_features(close, open_, volume, ind), t)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+盤後快照 (Nightly Snapshot)
+收盤後把全市場的指標、波浪、費波那契、SOP 旗標與 Miniko 分數一次算好，存成欄式 Parquet：
+- summary.parquet：每檔一列 (代號、名稱、分數、理由位元、SOP 細項、三週期波浪代碼、波段費波那契與支撐壓力、基本面)
+- bars.parquet：每檔最近 CHART_BARS 根日 K + 指標 + 日線波浪代碼 (個股戰情室畫圖 / 檢核直接用，依代號排序可快速過濾)
+兩個頁面在非盤中時段先讀快照，毫秒級出結果；盤中才走即時抓取。
+
+快照在 GitHub Actions 的雲端機器人上建立 (cloud_bot 的 SNAPSHOT_TIME)，頁面跑在另一台主機：
+建完由 publish() 上傳到 GitHub Release (artifacts.py)，頁面主機讀取前呼叫 sync()，
+本機快照不是最新收盤日就先看 Release 上的 meta.json，有較新的才下載 summary / bars。
+"""
+import os
+import json
+import threading
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import bar_store
+import indicators
+import screener
+import waves
+import swings
+import signal_rules
+import resample
+import fetcher
+import metrics
+import market_data
+import scheduler
+import artifacts
+
+# ================= ⚙️ 參數設定區 =================
+SNAPSHOT_DIR = os.environ.get(
+    "MINIKO_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+)
+SUMMARY_PATH = os.path.join(SNAPSHOT_DIR, "summary.parquet")
+BARS_PATH = os.path.join(SNAPSHOT_DIR, "bars.parquet")
+META_PATH = os.path.join(SNAPSHOT_DIR, "meta.json")   # 與 parquet 內嵌的資訊相同 (給 sync 先比對，免下載大檔)
+SYNC_INTERVAL = timedelta(minutes=10)                  # 頁面主機檢查 Release 的最短間隔
+
+PRICE_FIELDS = ('Open', 'High', 'Low', 'Close')   # 缺值時沿用前一日的欄位
+SHARD_SIZE = 300        # 每批下載 / 計算的檔數 (控制記憶體)
+CHART_BARS = 60         # 每檔保留的日 K 根數
+DAILY_MAS = (5, 10, 20, 60, 120, 240)
+SPECIAL_MAS = (7, 22, 34, 58, 116, 224)
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'SAR'] + \
+              [f'MA{m}' for m in DAILY_MAS] + [f'SMA{m}' for m in SPECIAL_MAS] + \
+              ['RSV', 'K', 'D', 'DIF', 'MACD', 'MACD_Hist', 'BB_Up', 'BB_Low', 'BB_Pct', 'BIAS_20', 'ATR']
+
+# 基本面只留頁面會用到的欄位
+FUND_FIELDS = ['exDividendDate', 'lastDividendValue', 'dividendRate',
+               'trailingEps', 'forwardEps', 'targetMeanPrice', 'targetHighPrice']
+
+_META_KEY = b"miniko_snapshot"
+# ===============================================
+
+_sync_lock = threading.Lock()
+_last_sync = None
+
+
+# --- 建立 ---
+def _raw_panel(tickers, period, interval):
+    bulk = bar_store.get_bars_bulk(tickers, period=period, interval=interval)
+    if bulk is None or bulk.empty: return None
+    return indicators.to_panel(bulk, tickers)
+
+
+def _fill_panel(panel):
+    """
+    停牌 / 缺資料的日子：只有價格沿用前一日，成交量記 0
+    (沿用前一日的量會灌高量比、分數與連買，也與逐檔即時抓取的結果不同)
+    """
+    out = {f: df.ffill() if f in PRICE_FIELDS else df for f, df in panel.items()}
+    if 'Volume' in panel:
+        out['Volume'] = panel['Volume'].fillna(0).where(out['Close'].notna())
+    return out
+
+
+def _panel_for(tickers, period, interval):
+    panel = _raw_panel(tickers, period, interval)
+    return None if panel is None else _fill_panel(panel)
+
+
+def _daily_shard(tickers):
+    """日線：指標、分數、SOP 旗標、波浪、費波那契 (整片寬表一次算)"""
+    panel = _panel_for(tickers, "2y", "1d")
+    if panel is None: return None, None
+    close = panel['Close']
+    ind = indicators.calc_panel_indicators(panel, mas=DAILY_MAS)
+    for m in SPECIAL_MAS:
+        ind[f'SMA{m}'] = close.rolling(m).mean()
+
+    scores = screener.score_panel(panel, ind)
+    sop = signal_rules.SOP.tail({**ind, 'Close': close})
+    wave = waves.panel_history(close, ind)
+
+    summary = pd.DataFrame({
+        'date': close.index[-1].strftime('%Y-%m-%d'),
+        'close': close.iloc[-1], 'prev_close': close.iloc[-2],
+        'volume': panel['Volume'].iloc[-1],
+        **{name: sop[name] for name in signal_rules.SOP_RULES},
+        'wave_d': wave.iloc[-1],
+    })
+    # 波段轉折 / 費波那契 / 支撐壓力 (每檔一列，頁面直接查欄位)
+    summary = summary.join(swings.analyze(panel['High'], panel['Low'], close))
+    summary = summary.join(scores[['score', 'reasons', 'vol_ratio', 'streak', 'chg']])
+
+    # 最近 CHART_BARS 根 (長表：代號 × 日期)
+    recent = {c: (panel[c] if c in panel else ind[c]).iloc[-CHART_BARS:] for c in BAR_COLUMNS}
+    recent['Wave'] = wave.iloc[-CHART_BARS:]
+    bars = pd.concat({c: df.stack(future_stack=True) for c, df in recent.items()}, axis=1)
+    bars.index = bars.index.set_names(['Date', 'code'])
+    bars = bars.reset_index().dropna(subset=['Close'])
+    return summary, bars
+
+
+def _panel_waves(panel):
+    panel = _fill_panel(panel)
+    ind = indicators.calc_panel_indicators(panel)
+    return waves.panel_history(panel['Close'], ind).iloc[-1]
+
+
+def _intraday_waves(tickers):
+    """60 分 / 30 分波浪：只批次下載 30 分 K，60 分 K 由它重取樣"""
+    panel = _raw_panel(tickers, "1mo", "30m")
+    if not panel: return pd.Series(dtype='int8'), pd.Series(dtype='int8')
+    return _panel_waves(resample.resample_panel(panel, 60)), _panel_waves(panel)
+
+
+def _fundamentals(tickers):
+    provider = market_data.get_provider()
+
+    def fetch(symbol):
+        info = fetcher.call_with_retry(provider.info, symbol)
+        return {f: info.get(f) for f in FUND_FIELDS}
+
+    results = fetcher.fetch_many(fetch, [(t,) for t in tickers])
+    rows = {job[0]: r for job, r in results.items() if r}
+    return pd.DataFrame.from_dict(rows, orient='index', columns=FUND_FIELDS)
+
+
+def _atomic_write(table, path):
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def build(stocks=None, with_fundamentals=True, shard_size=SHARD_SIZE):
+    """
+    建立全市場快照 (stocks 為 [{'code', 'name'}]，預設用證交所全市場清單)
+    回傳 summary DataFrame；分片依序處理以壓住記憶體
+    """
+    import universe
+    stocks = stocks if stocks is not None else universe.fetch_full_universe()
+    names = {s['code']: s['name'] for s in stocks}
+    tickers = list(names)
+
+    summaries, bars = [], []
+    with metrics.stage("snapshot", tickers=len(tickers)):
+        for i in range(0, len(tickers), shard_size):
+            shard = tickers[i:i + shard_size]
+            try:
+                summary, recent = _daily_shard(shard)
+                if summary is None: continue
+                summary['wave_60'], summary['wave_30'] = _intraday_waves(shard)
+                if with_fundamentals:
+                    summary = summary.join(_fundamentals(shard))
+                summaries.append(summary)
+                bars.append(recent)
+            except Exception as e:
+                metrics.failure("snapshot_shard", e, symbol=f"shard{i // shard_size}")
+            print(f"📦 快照進度 {min(i + shard_size, len(tickers))}/{len(tickers)}")
+
+    if not summaries: return None
+    summary = pd.concat(summaries)
+    summary.index.name = 'code'
+    summary.insert(0, 'name', [names.get(c, c) for c in summary.index])
+    for col in ('wave_60', 'wave_30'):
+        summary[col] = summary[col].fillna(waves.NO_DATA_CODE).astype('int8')
+    if with_fundamentals:
+        for col in FUND_FIELDS:
+            summary[col] = pd.to_numeric(summary[col], errors='coerce')
+    summary = summary.reset_index()
+
+    bars = pd.concat(bars).sort_values(['code', 'Date'])
+    float_cols = [c for c in BAR_COLUMNS if c != 'Volume']
+    bars[float_cols] = bars[float_cols].astype('float32')
+
+    _save(summary, bars, {
+        "built_at": scheduler.now_tw().isoformat(timespec="seconds"),
+        "trade_date": summary['date'].max(),
+        "symbols": len(summary),
+    })
+    return summary
+
+
+def _save(summary, bars, info):
+    """寫入 summary / bars (parquet 內嵌快照資訊) 與 meta.json"""
+    info = json.dumps(info).encode()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for df, path in ((summary, SUMMARY_PATH), (bars, BARS_PATH)):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _META_KEY: info})
+        _atomic_write(table, path)
+    with open(META_PATH + ".tmp", "wb") as f:
+        f.write(info)
+    os.replace(META_PATH + ".tmp", META_PATH)
+
+
+# --- 發佈 / 同步 (雲端機器人 → 頁面主機) ---
+def publish():
+    """把快照上傳到 GitHub Release (meta.json 最後上傳，頁面主機看到新的 meta 時大檔已就位)"""
+    return artifacts.publish([SUMMARY_PATH, BARS_PATH, META_PATH])
+
+
+def _embedded(path):
+    raw = (pq.read_schema(path).metadata or {}).get(_META_KEY)
+    return json.loads(raw) if raw else None
+
+
+def sync(now=None):
+    """
+    頁面主機：本機快照不是最新收盤日時，從 GitHub Release 換上雲端機器人發佈的快照
+    盤中不檢查；每 SYNC_INTERVAL 最多檢查一次 (多個 Session 同時呼叫只有一個會去抓)。回傳是否有換上新快照
+    """
+    global _last_sync
+    now = now or scheduler.now_tw()
+    if in_session(now) or is_fresh(now=now): return False
+    if not _sync_lock.acquire(blocking=False): return False
+    try:
+        if _last_sync is not None and now - _last_sync < SYNC_INTERVAL: return False
+        _last_sync = now
+        remote = artifacts.fetch_json(os.path.basename(META_PATH))
+        local = meta() or {}
+        if not remote or remote.get("trade_date", "") <= local.get("trade_date", ""): return False
+
+        def consistent(tmps):
+            # 上傳途中可能讀到新舊混雜的檔案：兩個 parquet 內嵌的資訊都要等於 meta.json
+            return all(_embedded(tmps[os.path.basename(p)]) == remote for p in (SUMMARY_PATH, BARS_PATH))
+
+        # bars 先換、summary 最後 (meta() 讀 summary，換上 summary 才算新快照)
+        ok = artifacts.download([os.path.basename(BARS_PATH), os.path.basename(SUMMARY_PATH)],
+                                SNAPSHOT_DIR, check=consistent)
+        if ok:
+            with open(META_PATH, "w") as f:
+                json.dump(remote, f)
+            print(f"📦 已同步盤後快照 ({remote['trade_date']} 收盤，{remote.get('symbols')} 檔)")
+        return ok
+    finally:
+        _sync_lock.release()
+
+
+# --- 讀取 ---
+def meta():
+    """快照資訊 {built_at, trade_date, symbols}；沒有快照回傳 None"""
+    if not os.path.exists(SUMMARY_PATH): return None
+    try:
+        raw = (pq.read_schema(SUMMARY_PATH).metadata or {}).get(_META_KEY)
+        return json.loads(raw) if raw else None
+    except Exception:
+        return None
+
+
+def _last_session_date(now):
+    """最近一個已收盤交易日"""
+    day = now
+    if not scheduler.is_trading_day(day) or now.strftime('%H:%M') < scheduler.SESSION_END:
+        day -= timedelta(days=1)
+        while not scheduler.is_trading_day(day):
+            day -= timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def in_session(now=None):
+    """現在是否為盤中 (盤中快照已過時，頁面應走即時)"""
+    now = now or scheduler.now_tw()
+    return scheduler.is_trading_day(now) and \
+        scheduler.SESSION_START <= now.strftime('%H:%M') <= scheduler.SESSION_END
+
+
+def is_fresh(info=None, now=None):
+    """快照涵蓋最近一個收盤日、且目前不在盤中"""
+    info = info if info is not None else meta()
+    now = now or scheduler.now_tw()
+    if not info or in_session(now): return False
+    return info.get("trade_date", "") >= _last_session_date(now)
+
+
+def load_summary():
+    """整張 summary (以代號為索引)；沒有快照回傳 None"""
+    if not os.path.exists(SUMMARY_PATH): return None
+    return pd.read_parquet(SUMMARY_PATH).set_index('code')
+
+
+def load_bars(code):
+    """單檔最近 CHART_BARS 根日 K + 指標 (只讀該代號的資料列)"""
+    if not os.path.exists(BARS_PATH): return None
+    df = pd.read_parquet(BARS_PATH, filters=[('code', '==', code)])
+    if df.empty: return None
+    return df.drop(columns='code').set_index('Date')
+
+
+def lookup(code):
+    """單檔 summary 列 (dict)；不在快照中回傳 None"""
+    if not os.path.exists(SUMMARY_PATH): return None
+    df = pd.read_parquet(SUMMARY_PATH, filters=[('code', '==', code)])
+    if df.empty: return None
+    row = df.iloc[0].to_dict()
+    row['fundamentals'] = {f: (None if pd.isna(row.get(f)) else row.get(f)) for f in FUND_FIELDS if f in row}
+    return row
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+盤中哨兵的持久化狀態 (SQLite，WAL 模式)
+GitHub Actions 一天重啟兩次、盤中也可能當掉；重啟後讀回這份狀態就能接續，不會重發：
+- reports：已發送的定時報告 / 已完成的排程任務 (任務名稱 + 時段)
+- cooldowns：每檔 × 每個訊號最後一次發警報的時間 (冷卻期內同一訊號不再發)
+- last_bar：每檔最後一次判斷過的 K 棒指紋與訊號 (同一根 K 棒沒變就不重算、不重發)
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+# ================= ⚙️ 參數設定區 =================
+STATE_PATH = os.environ.get(
+    "MINIKO_STATE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".state", "monitor.db")
+)
+ALERT_COOLDOWN = timedelta(hours=1)   # 同一檔同一訊號的警報間隔
+KEEP_DAYS = 14                        # 超過幾天的紀錄開檔時清掉
+# ===============================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    name TEXT NOT NULL, slot TEXT NOT NULL, done_at TEXT NOT NULL,
+    PRIMARY KEY (name, slot)
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    code TEXT NOT NULL, signal TEXT NOT NULL, sent_at TEXT NOT NULL,
+    PRIMARY KEY (code, signal)
+);
+CREATE TABLE IF NOT EXISTS last_bar (
+    code TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, signals TEXT NOT NULL, evaluated_at TEXT NOT NULL
+);
+"""
+
+
+def _iso(t):
+    return t.isoformat(timespec="seconds")
+
+
+class StateStore:
+    """單一 SQLite 檔 (執行緒安全；每次寫入即提交，當掉也只會少最後一筆)"""
+
+    def __init__(self, path=STATE_PATH, cooldown=ALERT_COOLDOWN):
+        self.path, self.cooldown = path, cooldown
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    # --- 定時報告 / 排程任務 ---
+    def is_done(self, name, slot):
+        return bool(self._query("SELECT 1 FROM reports WHERE name = ? AND slot = ?", (name, _iso(slot))))
+
+    def mark_done(self, name, slot, now=None):
+        self._query("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)",
+                    (name, _iso(slot), _iso(now or datetime.now())))
+
+    # --- 警報冷卻 (每檔 × 每個訊號) ---
+    def cooling(self, code, now):
+        """冷卻中的訊號代號集合"""
+        since = _iso(now - self.cooldown)
+        rows = self._query("SELECT signal FROM cooldowns WHERE code = ? AND sent_at > ?", (code, since))
+        return {r[0] for r in rows}
+
+    def mark_alert(self, code, signals, now):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO cooldowns VALUES (?, ?, ?)",
+                                 [(code, s, _iso(now)) for s in signals])
+
+    # --- 最後一次判斷的 K 棒 ---
+    def last_bar(self, code):
+        """(指紋, 訊號清單)；沒有紀錄回傳 (None, [])"""
+        rows = self._query("SELECT fingerprint, signals FROM last_bar WHERE code = ?", (code,))
+        return (rows[0][0], json.loads(rows[0][1])) if rows else (None, [])
+
+    def save_bar(self, code, fingerprint, signals, now):
+        self._query("INSERT OR REPLACE INTO last_bar VALUES (?, ?, ?, ?)",
+                    (code, fingerprint, json.dumps(signals, ensure_ascii=False), _iso(now)))
+
+    # --- 維護 ---
+    def prune(self, now, keep_days=KEEP_DAYS):
+        cutoff = _iso(now - timedelta(days=keep_days))
+        with self._lock:
+            self._db.execute("DELETE FROM reports WHERE slot < ?", (cutoff,))
+            self._db.execute("DELETE FROM cooldowns WHERE sent_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM last_bar WHERE evaluated_at < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
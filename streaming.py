@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+串流指標 (每檔一個狀態物件)
+歷史 K 棒只在暖機時走一次；之後盤中每次收到「今天」最新的 K 棒，
+只用環形緩衝區 / EMA 狀態做 O(1) 更新，就能重新判斷 6 大訊號，不必重算整年資料。
+訊號規則也是串流求值 (signal_dsl.RuleStream)：連買天數、昨日 K / 收盤等都是狀態，盤中只做純量運算。
+"""
+import math
+from collections import deque
+
+import signal_rules
+
+MA_WINDOWS = (5, 10, 20, 60, 120)
+SMA_WINDOWS = (22,)
+KD_WINDOW = 9
+ATR_WINDOW = 14
+VOL_WINDOW = 5
+
+_NAN = float('nan')
+
+
+def _ema_alpha(span):
+    return 2 / (span + 1)
+
+
+class StreamingIndicators:
+    """
+    單檔串流指標：已收盤的 K 棒進入緩衝區 (commit)，今天盤中的 K 棒只是暫存 (pending)，
+    同一天重複 update 只會覆蓋暫存值，換日時才把前一天寫入狀態
+    """
+
+    def __init__(self):
+        longest = max(MA_WINDOWS + SMA_WINDOWS)
+        # 已收盤資料的環形緩衝 (只保留計算今天需要的長度 = 視窗 - 1)
+        self.closes = deque(maxlen=longest - 1)
+        self.highs = deque(maxlen=KD_WINDOW - 1)
+        self.lows = deque(maxlen=KD_WINDOW - 1)
+        self.volumes = deque(maxlen=VOL_WINDOW - 1)
+        self.trs = deque(maxlen=ATR_WINDOW - 1)
+        self.sums = {w: 0.0 for w in MA_WINDOWS + SMA_WINDOWS}   # 各均線「前 w-1 根」的收盤總和
+
+        # 遞迴狀態 (截至最後一根已收盤 K 棒)
+        self.k = 50.0
+        self.d = 50.0
+        self.ema12 = None
+        self.ema26 = None
+        self.signal = None
+        self.prev_close = _NAN
+        self.rules = signal_rules.SIGNALS.stream(signal_rules.THRESHOLDS)   # 訊號規則的串流狀態
+
+        self.prev = None        # 最後一根已收盤 K 棒的指標列
+        self.today = None       # 今天 (暫存) K 棒的指標列
+        self._pending = None    # (日期, open, high, low, close, volume)
+
+    # --- 建立 ---
+    @classmethod
+    def from_history(cls, df):
+        """用日 K 歷史暖機；最後一列視為今天 (可能尚未收盤)"""
+        stream = cls()
+        for ts, row in zip(df.index, df[['Open', 'High', 'Low', 'Close', 'Volume']].values):
+            stream.update(ts, *row)
+        return stream
+
+    # --- 計算 (不改動狀態) ---
+    def _compute(self, o, h, l, c, v):
+        row = {'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v}
+        n = len(self.closes)
+
+        for w in MA_WINDOWS:
+            row[f'MA{w}'] = (self.sums[w] + c) / w if n >= w - 1 else _NAN
+        for w in SMA_WINDOWS:
+            row[f'SMA{w}'] = (self.sums[w] + c) / w if n >= w - 1 else _NAN
+
+        # KD (9,3,3)：RSV 缺值補 50
+        rsv = _NAN
+        if len(self.highs) == KD_WINDOW - 1:
+            high_n = max(max(self.highs), h)
+            low_n = min(min(self.lows), l)
+            if high_n != low_n:
+                rsv = (c - low_n) / (high_n - low_n) * 100
+        if math.isnan(rsv): rsv = 50
+        row['K'] = self.k*2/3 + rsv*1/3
+        row['D'] = self.d*2/3 + row['K']*1/3
+
+        # MACD (12,26,9)
+        if self.ema12 is None:
+            ema12 = ema26 = c
+        else:
+            ema12 = (1 - _ema_alpha(12)) * self.ema12 + _ema_alpha(12) * c
+            ema26 = (1 - _ema_alpha(26)) * self.ema26 + _ema_alpha(26) * c
+        dif = ema12 - ema26
+        signal = dif if self.signal is None else (1 - _ema_alpha(9)) * self.signal + _ema_alpha(9) * dif
+        row['DIF'], row['MACD'], row['MACD_Hist'] = dif, signal, dif - signal
+        row['_ema12'], row['_ema26'] = ema12, ema26
+
+        # 量能與 ATR
+        row['Vol_MA5'] = (sum(self.volumes) + v) / VOL_WINDOW if len(self.volumes) == VOL_WINDOW - 1 else _NAN
+        tr = max(h - l, abs(h - self.prev_close)) if not math.isnan(self.prev_close) else _NAN
+        row['_TR'] = tr
+        window = list(self.trs) + [tr]
+        row['ATR'] = sum(window) / ATR_WINDOW \
+            if len(window) == ATR_WINDOW and not any(math.isnan(x) for x in window) else _NAN
+        return row
+
+    # --- 收盤寫入狀態 ---
+    def _commit(self, o, h, l, c, v):
+        row = self._compute(o, h, l, c, v)
+        self.closes.append(c)
+        # 每天收盤重算一次精確總和 (避免浮點累積誤差)，盤中更新仍是 O(1)
+        recent = list(self.closes)
+        for w in MA_WINDOWS + SMA_WINDOWS:
+            self.sums[w] = sum(recent[-(w - 1):]) if w > 1 else 0.0
+        self.highs.append(h)
+        self.lows.append(l)
+        self.volumes.append(v)
+        self.trs.append(row['_TR'])
+        self.rules.commit(row)
+        self.k, self.d = row['K'], row['D']
+        self.ema12, self.ema26, self.signal = row['_ema12'], row['_ema26'], row['MACD']
+        self.prev_close = c
+        self.prev = row
+
+    # --- 對外介面 ---
+    def update(self, ts, o, h, l, c, v):
+        """
+        餵入一根日 K (ts 為時間戳)：同一天覆蓋今天的暫存值，新的一天先把前一天收盤寫入狀態
+        回傳今天的指標列
+        """
+        day = ts.date() if hasattr(ts, 'date') else ts
+        if self._pending is not None and day != self._pending[0]:
+            self._commit(*self._pending[1:])
+        self._pending = (day, float(o), float(h), float(l), float(c), float(v))
+        self.today = self._compute(*self._pending[1:])
+        return self.today
+
+    @property
+    def last_date(self):
+        return self._pending[0] if self._pending else None
+
+    def signals(self):
+        """以目前的今天 / 昨天狀態判斷 6 大訊號 (資料不足兩根回傳空清單)"""
+        if self.today is None or self.prev is None: return []
+        return signal_rules.labels(self.rules.evaluate(self.today))
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+策略門檻參數掃描 (Parameter Sweep)
+門檻 (權證大單金額、爆量倍數、High C 的 K 區間、連買天數、流動性門檻、現實係數…) 以網格或隨機抽樣組合，
+每組都在同一份歷史寬表上重算訊號並統計觸發後的實際表現，輸出排名表。
+- 與門檻無關的部分 (規則裡不含門檻的子式、往後報酬、目標到價天數) 只算一次，存成 .sweep/features.npz
+- 評估時把這些陣列放進共享記憶體，process pool 的每個子程序直接掛載，不複製、不 pickle DataFrame
+- 每組參數只剩門檻比較與加總 (signal_rules.signal_masks / screener.score_from_features)
+
+用法：
+  python sweep.py --target score --samples 300          # 戰情室計分：隨機抽 300 組
+  python sweep.py --target whale --grid                 # 主力權證大單：完整網格
+  python sweep.py --target score --param score.min_volume=500000,1000000,2000000 --grid
+  python sweep.py --rebuild --period 5y --limit 600     # 重建歷史特徵快取
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import screener
+import signal_rules
+import metrics
+import scheduler
+
+# ================= ⚙️ 參數設定區 =================
+SWEEP_DIR = os.environ.get(
+    "MINIKO_SWEEP_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sweep")
+)
+FEATURES_PATH = os.path.join(SWEEP_DIR, "features.npz")
+META_PATH = os.path.join(SWEEP_DIR, "meta.json")
+
+WORKERS = int(os.environ.get("MINIKO_SWEEP_WORKERS", os.cpu_count() or 4))
+BATCH = 8                 # 每個子程序任務一次評估幾組參數
+MIN_EVENTS = 100          # 觸發次數太少的組合不列入排名
+SEED = 7
+
+# 掃描空間 (鍵名 = 模組.門檻名；signal.* → signal_rules、score.* → screener、target.* → 目標價估計)
+GRID = {
+    "signal.whale_turnover": [10000000, 20000000, 30000000, 50000000],
+    "signal.surge_ratio": [1.2, 1.5, 2.0, 3.0],
+    "signal.high_c_k_low": [30, 40, 50],
+    "signal.high_c_k_high": [60, 70],
+    "signal.streak_min": [2, 3, 4, 5],
+    "signal.breakout_pct": [0.02, 0.03, 0.05],
+    "signal.gulu_k": [30, 40, 50],
+    "score.whale_turnover": [10000000, 20000000, 30000000, 50000000],
+    "score.surge_ratio": [1.2, 1.5, 2.0, 3.0],
+    "score.min_volume": [500000, 1000000, 2000000],
+    "score.high_c_k_low": [30, 40, 50],
+    "score.high_c_k_high": [60, 70],
+    "score.streak_min": [2, 3, 4, 5],
+    "target.reality_factor": [1.5, 2.0, 2.5, 3.0],
+}
+# 6 大訊號各自用到的門檻 (單一訊號只掃自己的參數)
+SIGNAL_PARAMS = {
+    "whale": ("whale_turnover",),
+    "sop": (),
+    "high_c": ("high_c_kmax", "high_c_k_low", "high_c_k_high"),
+    "gulu": ("gulu_k",),
+    "breakout": ("surge_ratio", "breakout_pct"),
+    "streak": ("streak_min", "streak_max"),
+}
+DEFAULTS = {
+    **{f"signal.{k}": v for k, v in signal_rules.THRESHOLDS.items()},
+    **{f"score.{k}": v for k, v in screener.THRESHOLDS.items()},
+    "target.reality_factor": backtest.REALITY_FACTOR,
+}
+# 排名指標：(欄名, 越大越好?)
+RANK_BY = {
+    "ret": ("ret_mean", True), "median": ("ret_median", True), "win": ("win", True),
+    "edge": ("edge", True), "hit": ("hit_atr3", True), "days": ("days_mae", False),
+}
+# ===============================================
+
+
+# --- 歷史特徵快取 ---
+def _shard_features(panel):
+    """單一分片：訊號 / 計分特徵 + 結果陣列 (平面 dict，鍵名加前綴)"""
+    prep = backtest.prepare_shard(panel)
+    filled, ind = prep['filled'], prep['ind']
+    close, open_, volume = filled['Close'], filled['Open'], filled['Volume']
+    out = {f"signal.{k}": v for k, v in
+           signal_rules.panel_features(close, open_, volume, ind).items()}
+    out.update({f"score.{k}": v for k, v in screener.score_features(
+        close, open_, volume, ind['K'], ind['D'], ind['MACD_Hist'], ind['MA5'],
+        ind['SAR_Bull'].values, prep['tradable']).items()})
+    out["close"] = close.values
+    out["valid"] = prep['valid']
+    out["atr"] = prep['atr']
+    out.update({f"ret_{h}": r for h, r in prep['returns'].items()})
+    out.update({f"hit_{t}": d for t, d in prep['hits'].items()})
+    return close.index, close.columns, out
+
+
+def _compact(a):
+    if a.dtype == bool: return a
+    if np.issubdtype(a.dtype, np.integer): return a.astype(np.int16)
+    return a.astype(np.float32)
+
+
+def _align(index, shard_index, arr):
+    """把分片陣列放到共同日期軸上 (缺的日期：浮點 NaN / 布林 False / 整數 0)"""
+    if len(index) == len(shard_index) and index.equals(shard_index): return arr
+    fill = np.nan if arr.dtype.kind == 'f' else (False if arr.dtype == bool else 0)
+    out = np.full((len(index), arr.shape[1]), fill, dtype=arr.dtype)
+    out[index.get_indexer(shard_index)] = arr
+    return out
+
+
+def _dedupe(arrays):
+    """內容相同的陣列只存一份 (訊號與計分共用的 close / K / MACD…)，回傳 (陣列, 別名表)"""
+    seen, unique, aliases = {}, {}, {}
+    for name, a in arrays.items():
+        digest = (a.dtype.str, a.shape, hashlib.blake2b(a.tobytes(), digest_size=16).hexdigest())
+        if digest in seen:
+            aliases[name] = seen[digest]
+        else:
+            seen[digest] = name
+            unique[name] = a
+    return unique, aliases
+
+
+def prepare(tickers, period=backtest.PERIOD, shard_size=backtest.SHARD_SIZE):
+    """分片下載 → 特徵 → 對齊日期後橫向合併，寫入 FEATURES_PATH"""
+    shards = []
+    with metrics.stage("sweep_prepare", tickers=len(tickers)):
+        for i in range(0, len(tickers), shard_size):
+            shard = tickers[i:i + shard_size]
+            try:
+                panel = backtest.panel_for(shard, period)
+                if panel is not None:
+                    idx, cols, feats = _shard_features(panel)
+                    shards.append((idx, cols, {k: _compact(v) for k, v in feats.items()}))
+            except Exception as e:
+                metrics.failure("sweep_shard", e, symbol=f"shard{i // shard_size}")
+            print(f"🧮 特徵進度 {min(i + shard_size, len(tickers))}/{len(tickers)}")
+    if not shards: return None
+
+    index = shards[0][0]
+    for idx, _, _ in shards[1:]:
+        index = index.union(idx)
+    arrays = {key: np.hstack([_align(index, idx, feats[key]) for idx, _, feats in shards])
+              for key in shards[0][2]}
+    arrays, aliases = _dedupe(arrays)
+    meta = {
+        "built_at": scheduler.now_tw().isoformat(timespec="seconds"),
+        "period": period, "symbols": int(sum(len(cols) for _, cols, _ in shards)),
+        "start": str(index[0].date()), "end": str(index[-1].date()), "shape": list(next(iter(arrays.values())).shape),
+        "aliases": aliases, "rules": rules_digest(),
+    }
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    tmp = FEATURES_PATH + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, FEATURES_PATH)
+    with open(META_PATH, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    return arrays, meta
+
+
+def rules_digest():
+    """訊號 / 計分規則的指紋 (特徵的鍵就是規則裡的子式，規則一改快取就作廢)"""
+    text = json.dumps([signal_rules.RULES, screener.SCORE_RULES], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def load():
+    """讀特徵快取，回傳 (陣列, meta)；沒有快取或規則已改回傳 None"""
+    if not (os.path.exists(FEATURES_PATH) and os.path.exists(META_PATH)): return None
+    with open(META_PATH, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("rules") != rules_digest(): return None
+    with np.load(FEATURES_PATH) as data:
+        arrays = {k: data[k] for k in data.files}
+    return arrays, meta
+
+
+# --- 共享記憶體 ---
+class SharedArrays:
+    """主程序把陣列放進共享記憶體；子程序用 specs 掛載成 NumPy view (零複製)"""
+
+    def __init__(self, arrays):
+        self.blocks, self.specs = [], {}
+        for name, a in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+            self.blocks.append(shm)
+            self.specs[name] = (shm.name, a.shape, a.dtype.str)
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+def _attach(name):
+    # forkserver / spawn 的子程序與主程序共用同一個 resource tracker (重複登記無害)，
+    # 由主程序在 close() 統一 unlink，子程序不可自行取消登記
+    return shared_memory.SharedMemory(name=name)
+
+
+_worker = {}
+
+
+def _init_worker(specs, aliases, context):
+    blocks = {name: _attach(spec[0]) for name, spec in specs.items()}
+    arrays = {name: np.ndarray(spec[1], np.dtype(spec[2]), buffer=blocks[name].buf)
+              for name, spec in specs.items()}
+    arrays.update({alias: arrays[name] for alias, name in aliases.items()})
+    _worker.update(blocks=blocks, arrays=arrays, context=context)
+
+
+def _evaluate_batch(configs):
+    return [evaluate(_worker["arrays"], config, **_worker["context"]) for config in configs]
+
+
+# --- 評估 ---
+def _features(arrays, prefix):
+    n = len(prefix) + 1
+    return {k[n:]: v for k, v in arrays.items() if k.startswith(prefix + ".")}
+
+
+def _split(config):
+    """參數組 → (訊號門檻, 計分門檻, 現實係數)"""
+    sig = dict(signal_rules.THRESHOLDS)
+    sc = dict(screener.THRESHOLDS)
+    for key, value in config.items():
+        group, name = key.split(".", 1)
+        if group == "signal": sig[name] = value
+        elif group == "score": sc[name] = value
+    return sig, sc, config.get("target.reality_factor", backtest.REALITY_FACTOR)
+
+
+def target_mask(arrays, target, sig, sc):
+    """目標事件遮罩：6 大訊號之一、score (分數 > 0) 或 backtest.SCORE_BANDS 的分數區間"""
+    if target in signal_rules.SIGNAL_NAMES:
+        return signal_rules.signal_masks(_features(arrays, "signal"), sig)[target]
+    score = screener.score_from_features(_features(arrays, "score"), sc)['score']
+    if target == "score": return score > 0
+    lo, hi = backtest.SCORE_BANDS[target]
+    return (score >= lo) & (score <= hi if hi is not None else True)
+
+
+def evaluate(arrays, config, target="score", baseline_win=None):
+    """
+    單組參數的表現：觸發次數、WIN_HORIZON 日平均 / 中位報酬、勝率、相對一般交易日的勝率差、
+    ATR×3 命中率、經驗到價天數的平均絕對誤差
+    """
+    sig, sc, reality_factor = _split(config)
+    mask = target_mask(arrays, target, sig, sc) & arrays["valid"]
+    n = int(mask.sum())
+    row = {**config, "n": n}
+    if n == 0: return row
+
+    ret = arrays[f"ret_{backtest.WIN_HORIZON}"][mask]
+    ret = ret[~np.isnan(ret)]
+    if len(ret):
+        row.update(ret_mean=float(ret.mean()), ret_median=float(np.median(ret)), win=float((ret > 0).mean()))
+        if baseline_win is not None: row["edge"] = row["win"] - baseline_win
+
+    hit = arrays["hit_atr3"][mask]
+    hit = hit[~np.isnan(hit)]
+    if len(hit): row["hit_atr3"] = float((hit > 0).mean())
+
+    # 經驗到價天數 vs 實際到價天數 (只看有到價的事件)
+    close, atr = arrays["close"][mask], arrays["atr"][mask]
+    errors = []
+    for key, ratio in backtest.TARGET_ATR_RATIO.items():
+        actual = arrays[f"hit_{key}"][mask]
+        reached = actual > 0
+        if not reached.any(): continue
+        pct = backtest.TARGETS[key][1]
+        guess = backtest.estimate_days(close[reached] * pct, atr[reached] * ratio, reality_factor)
+        errors.append(np.abs(guess - actual[reached]))
+    if errors:
+        errors = np.concatenate(errors)
+        errors = errors[~np.isnan(errors)]
+        if len(errors): row["days_mae"] = float(errors.mean())
+    return row
+
+
+def baseline(arrays):
+    """一般交易日 (所有可列入的格子) 的 WIN_HORIZON 日勝率"""
+    ret = arrays[f"ret_{backtest.WIN_HORIZON}"][arrays["valid"]]
+    ret = ret[~np.isnan(ret)]
+    return float((ret > 0).mean()) if len(ret) else None
+
+
+# --- 參數組合 ---
+def relevant_keys(target):
+    """只掃會影響目標的參數 (單一訊號只看自己的門檻，計分看 score.*)；現實係數一律掃"""
+    if target in SIGNAL_PARAMS:
+        wanted = {f"signal.{p}" for p in SIGNAL_PARAMS[target]}
+        return [k for k in GRID if k in wanted or k.startswith("target.")]
+    return [k for k in GRID if k.startswith("score.") or k.startswith("target.")]
+
+
+def grid_configs(space):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_configs(space, samples, seed=SEED):
+    """隨機抽樣 (不重複；組合總數不足就全取)"""
+    total = int(np.prod([len(v) for v in space.values()]))
+    if samples >= total: return grid_configs(space)
+    rng = np.random.default_rng(seed)
+    seen, configs = set(), []
+    while len(configs) < samples:
+        pick = tuple(int(rng.integers(len(space[k]))) for k in space)
+        if pick in seen: continue
+        seen.add(pick)
+        configs.append({k: space[k][i] for k, i in zip(space, pick)})
+    return configs
+
+
+def run(arrays, aliases, configs, target="score", workers=WORKERS, on_progress=None):
+    """
+    用 process pool 評估所有參數組，回傳結果 DataFrame (未排序)
+    特徵陣列放共享記憶體，子程序只掛載；workers <= 1 時在本程序直接跑
+    """
+    context = {"target": target, "baseline_win": baseline(
+        {**arrays, **{a: arrays[n] for a, n in aliases.items()}})}
+    batches = [configs[i:i + BATCH] for i in range(0, len(configs), BATCH)]
+    rows = []
+    if workers <= 1 or len(batches) == 1:
+        full = {**arrays, **{a: arrays[n] for a, n in aliases.items()}}
+        for i, batch in enumerate(batches):
+            rows.extend(evaluate(full, c, **context) for c in batch)
+            if on_progress: on_progress(i + 1, len(batches))
+        return pd.DataFrame(rows)
+
+    shared = SharedArrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=screener.pool_context(),
+                                 initializer=_init_worker, initargs=(shared.specs, aliases, context)) as pool:
+            futures = [pool.submit(_evaluate_batch, b) for b in batches]
+            for done, future in enumerate(as_completed(futures), 1):
+                rows.extend(future.result())
+                if on_progress: on_progress(done, len(batches))
+    finally:
+        shared.close()
+    return pd.DataFrame(rows)
+
+
+def rank(results, rank_by="ret", min_events=MIN_EVENTS):
+    """依指標排名 (觸發次數不足的組合排除；同分再比到價天數誤差)"""
+    col, descending = RANK_BY[rank_by]
+    if col not in results: return results.iloc[:0]
+    ranked = results[(results["n"] >= min_events) & results[col].notna()]
+    keys, ascending = [col], [not descending]
+    if col != "days_mae" and "days_mae" in ranked:
+        keys.append("days_mae")
+        ascending.append(True)
+    return ranked.sort_values(keys, ascending=ascending, kind="stable").reset_index(drop=True)
+
+
+def _parse_param(text):
+    name, values = text.split("=", 1)
+    if name not in DEFAULTS: raise argparse.ArgumentTypeError(f"未知參數 {name}")
+    return name, [type(DEFAULTS[name])(float(v)) if isinstance(DEFAULTS[name], int) else float(v)
+                  for v in values.split(",")]
+
+
+def main(argv=None):
+    targets = list(signal_rules.SIGNAL_NAMES) + ["score"] + list(backtest.SCORE_BANDS)
+    parser = argparse.ArgumentParser(description="Miniko 策略門檻參數掃描")
+    parser.add_argument("--target", default="score", choices=targets)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--grid", action="store_true", help="完整網格")
+    mode.add_argument("--samples", type=int, default=200, help="隨機抽樣組數 (預設)")
+    parser.add_argument("--param", action="append", type=_parse_param, default=[],
+                        help="覆寫掃描值，如 score.min_volume=500000,1000000")
+    parser.add_argument("--rank-by", default="ret", choices=list(RANK_BY))
+    parser.add_argument("--min-events", type=int, default=MIN_EVENTS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="重建歷史特徵快取")
+    parser.add_argument("--period", default=backtest.PERIOD)
+    parser.add_argument("--limit", type=int, help="重建時只取前 N 檔")
+    args = parser.parse_args(argv)
+
+    cached = None if args.rebuild else load()
+    if cached is None:
+        import universe
+        tickers = [s['code'] for s in universe.fetch_full_universe()]
+        if args.limit: tickers = tickers[:args.limit]
+        cached = prepare(tickers, args.period)
+        if cached is None:
+            print("❌ 沒有可用的歷史資料")
+            return 1
+    arrays, meta = cached
+    print(f"📚 特徵快取：{meta['symbols']} 檔 × {meta['start']} ~ {meta['end']}")
+
+    space = {k: GRID[k] for k in relevant_keys(args.target)}
+    space.update(dict(args.param))
+    configs = grid_configs(space) if args.grid else random_configs(space, args.samples)
+    # 現行設定一定要在表內當對照
+    current = {k: DEFAULTS[k] for k in space}
+    if current not in configs: configs.append(current)
+    print(f"🔍 目標 {args.target}：{len(configs)} 組參數，{args.workers} 個程序")
+
+    with metrics.stage("sweep", configs=len(configs), target=args.target):
+        results = run(arrays, meta["aliases"], configs, args.target, args.workers,
+                      on_progress=lambda d, t: print(f"\r⏳ {d}/{t}", end="", flush=True))
+    print()
+    ranked = rank(results, args.rank_by, args.min_events)
+    ranked["current"] = [all(r[k] == v for k, v in current.items()) for _, r in ranked.iterrows()]
+
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    out = os.path.join(SWEEP_DIR, f"results_{args.target}_{args.rank_by}.csv")
+    ranked.to_csv(out, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", 30):
+        print(ranked.head(args.top).to_string(float_format=lambda x: f"{x:.4g}"))
+    here = ranked.index[ranked["current"]]
+    if len(here): print(f"\n📍 現行設定排名：第 {here[0] + 1} / {len(ranked)} 名")
+    print(f"💾 已寫入 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
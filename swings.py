@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+波段轉折點 (Swing Points) 與支撐壓力
+- 轉折高 / 低點：argrelextrema 沿時間軸一次找出整張寬表 (日期 × 股票) 的局部極值，
+  左右各 ORDER 根都不比它高 (低) 才算；等高的平台只記第一根，最後 ORDER 根尚未確認不算
+- 費波那契：錨定最近一段真實波段 (最近的轉折低點 → 之後的最高點)，不再一律取 120 根高低點；
+  完全沒有轉折點 (新股 / 單邊走勢) 才退回 FIB_WINDOW 根高低點
+- 支撐 / 壓力區：近 LOOKBACK 根的轉折點價格相距 ZONE_TOL 以內合併成一區，記錄區間與被測試次數
+analyze() 一次回傳每檔一列的表，盤後快照直接存成欄位，
+「股價落在最近波段 0.382」之類的全市場篩選就只是一次欄位查詢 (summary[summary.fib_near == "0.382"])。
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.signal import argrelextrema
+
+# ================= ⚙️ 參數設定區 =================
+ORDER = 5               # 轉折點左右各需幾根 K 棒確認
+LOOKBACK = 250          # 支撐壓力區取最近幾根 K 棒的轉折點
+FIB_WINDOW = 120        # 沒有轉折點時退回的高低點視窗
+FIB_LEVELS = ("0.200", "0.382", "0.500", "0.618")
+ZONE_TOL = 0.015        # 轉折點價格相距 1.5% 以內視為同一區
+NEAR_TOL = 0.01         # 收盤距離費波那契價位 1% 以內視為「落在」該價位
+# ===============================================
+
+
+def _extrema(values, comparator, order):
+    """argrelextrema 的布林遮罩版 (等值也算，平台留待 pivots 去重)"""
+    mask = np.zeros(values.shape, dtype=bool)
+    if len(values) > 2 * order:
+        mask[argrelextrema(values, comparator, axis=0, order=order, mode='clip')] = True
+        mask[:order] = mask[-order:] = False   # 邊界視窗不完整
+    return mask
+
+
+def _left_extreme(values, order, reducer, fill):
+    """每根 K 棒之前 order 根的最大 / 最小值 (第一根為 fill)"""
+    padded = np.concatenate([np.full((order,) + values.shape[1:], fill), values[:-1]])
+    return reducer(np.lib.stride_tricks.sliding_window_view(padded, order, axis=0), axis=-1)
+
+
+def pivots(high, low, order=ORDER):
+    """
+    轉折高 / 低點遮罩 (與輸入同形狀；一維單檔或二維寬表皆可)
+    等高的平台只保留第一根：必須嚴格高於 (低於) 左邊 order 根
+    """
+    high, low = np.asarray(high, dtype=float), np.asarray(low, dtype=float)
+    is_high = _extrema(high, np.greater_equal, order)
+    is_low = _extrema(low, np.less_equal, order)
+    if len(high) > order:
+        with np.errstate(invalid='ignore'):
+            is_high &= high > _left_extreme(high, order, np.max, -np.inf)
+            is_low &= low < _left_extreme(low, order, np.min, np.inf)
+    return is_high, is_low
+
+
+def _last_index(mask):
+    """每個位置 (含) 之前最後一個 True 的列號，沒有為 -1"""
+    rows = np.arange(len(mask)).reshape((-1,) + (1,) * (mask.ndim - 1))
+    return np.maximum.accumulate(np.where(mask, rows, -1), axis=0)
+
+
+def swing_leg(is_high, is_low):
+    """
+    最近一段波段的起點列號與方向 (每檔一個)
+    最後一個轉折是低點 → 從該低點起漲中 (+1)；最後一個轉折是高點 → 從前一個低點漲到此高點後回檔中 (-1)
+    """
+    n, m = is_high.shape
+    last_high, last_low = _last_index(is_high), _last_index(is_low)
+    lh, ll = last_high[-1], last_low[-1]
+    prior_low = np.where(lh >= 0, last_low[np.maximum(lh, 0), np.arange(m)], -1)
+    start = np.where(ll > lh, ll, prior_low)
+    direction = np.where(ll > lh, 1, np.where(lh >= 0, -1, 0))
+    fallback = start < 0
+    start = np.where(fallback, max(n - FIB_WINDOW, 0), start)
+    return start, np.where(fallback, 0, direction)
+
+
+def zones(prices, tol=ZONE_TOL):
+    """轉折點價格 → [(區間下緣, 區間上緣, 測試次數)] (由低到高)"""
+    p = np.sort(prices[~np.isnan(prices)])
+    if len(p) == 0: return []
+    group = np.concatenate([[0], np.cumsum(np.diff(p) > tol * p[:-1])])
+    edges = np.flatnonzero(np.diff(group)) + 1
+    return [(g[0], g[-1], len(g)) for g in np.split(p, edges)]
+
+
+def _nearest_zones(high, low, is_high, is_low, close, lookback):
+    """每檔收盤下方最近的支撐區與上方最近的壓力區 (以區間中心判斷)"""
+    m = high.shape[1]
+    out = np.full((6, m), np.nan)
+    h, l = high[-lookback:], low[-lookback:]
+    ph, pl = is_high[-lookback:], is_low[-lookback:]
+    for j in range(m):
+        if np.isnan(close[j]): continue
+        found = zones(np.concatenate([h[ph[:, j], j], l[pl[:, j], j]]))
+        below = [z for z in found if (z[0] + z[1]) / 2 <= close[j]]
+        above = [z for z in found if (z[0] + z[1]) / 2 > close[j]]
+        if below: out[0:3, j] = below[-1]
+        if above: out[3:6, j] = above[0]
+    return out
+
+
+def analyze(high, low, close, tickers=None, order=ORDER, lookback=LOOKBACK):
+    """
+    整張寬表 (日期 × 股票，DataFrame 或二維陣列) 的波段 / 費波那契 / 支撐壓力，每檔一列：
+    trend_high / trend_low：最近波段高低點；swing_dir：+1 起漲中、-1 回檔中、0 無轉折點；
+    swing_bars：波段起點距今幾根；fib_*：回檔價位；fib_pos：目前回檔比例 (0 = 波段高點，1 = 起點)；
+    fib_near：收盤落在哪個費波那契價位 (NEAR_TOL 以內，否則空字串)；
+    sup_* / res_*：最近支撐 / 壓力區的下緣、上緣、測試次數
+    """
+    if tickers is None and isinstance(close, pd.DataFrame): tickers = close.columns
+    high, low, close = (np.asarray(x, dtype=float) for x in (high, low, close))
+    if high.ndim == 1: high, low, close = high[:, None], low[:, None], close[:, None]
+    n = len(close)
+    is_high, is_low = pivots(high, low, order)
+    start, direction = swing_leg(is_high, is_low)
+
+    in_leg = np.arange(n)[:, None] >= start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)   # 整欄無資料的股票
+            trend_high = np.nanmax(np.where(in_leg, high, np.nan), axis=0)
+            trend_low = np.nanmin(np.where(in_leg, low, np.nan), axis=0)
+        last = pd.DataFrame(close).ffill().to_numpy()[-1] if n else np.full(close.shape[1], np.nan)
+        diff = trend_high - trend_low
+        fib_pos = (trend_high - last) / diff
+
+    out = pd.DataFrame({'trend_high': trend_high, 'trend_low': trend_low,
+                        'swing_dir': direction.astype('int8'), 'swing_bars': (n - 1 - start).astype('int32'),
+                        'fib_pos': fib_pos}, index=tickers)
+    levels = np.array([float(lv) for lv in FIB_LEVELS])
+    prices = trend_high[:, None] - diff[:, None] * levels
+    for i, lv in enumerate(FIB_LEVELS):
+        out[f'fib_{lv}'] = prices[:, i]
+    with np.errstate(invalid='ignore'):
+        gap = np.abs(prices - last[:, None]) / last[:, None]
+        nearest = np.argmin(np.where(np.isnan(gap), np.inf, gap), axis=1)
+        hit = np.take_along_axis(gap, nearest[:, None], axis=1)[:, 0] <= NEAR_TOL
+    out['fib_near'] = np.where(hit, np.array(FIB_LEVELS)[nearest], "")
+
+    sr = _nearest_zones(high, low, is_high, is_low, last, lookback)
+    for i, col in enumerate(('sup_low', 'sup_high', 'sup_hits', 'res_low', 'res_high', 'res_hits')):
+        out[col] = sr[i]
+    return out
+
+
+def levels(df, order=ORDER, lookback=LOOKBACK):
+    """
+    單檔 DataFrame 版：{'0.200': ..., '0.382': ..., 'trend_high': ..., 'trend_low': ..., ...}
+    (與舊的 get_fibonacci 相容，另外附上波段方向與支撐壓力區)
+    """
+    row = analyze(df['High'], df['Low'], df['Close'], tickers=[0], order=order, lookback=lookback).iloc[0]
+    return {(k[4:] if k.startswith('fib_') and k[4:] in FIB_LEVELS else k): v for k, v in row.items()}
+
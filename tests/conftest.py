@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+測試共用：讓測試直接 import 專案根目錄的模組與 benchmarks/ 的合成資料、舊版對照實作；
+release fixture 是本機假 GitHub Release (artifacts.py 的發佈 / 下載都指向它)
+"""
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path: sys.path.insert(0, path)
+
+import artifacts  # noqa: E402  (要先設好 sys.path)
+
+
+class _FakeRelease(BaseHTTPRequestHandler):
+    """GitHub Release API 的最小子集 (查 tag / 建立 / 刪除附件 / 上傳附件) + 公開下載網址"""
+    release = None
+    assets = {}
+    next_id = 1
+
+    def _reply(self, status, body=b"", ctype="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, obj):
+        self._reply(status, json.dumps(obj).encode())
+
+    def _listing(self):
+        return {**self.release, "assets": [{"name": n, "id": i} for n, (i, _) in self.assets.items()]}
+
+    def do_GET(self):
+        if self.path.startswith("/download/"):
+            name = self.path.rsplit("/", 1)[1]
+            if name not in self.assets: return self._reply(404)
+            return self._reply(200, self.assets[name][1], "application/octet-stream")
+        if "/releases/tags/" in self.path:
+            return self._json(200, self._listing()) if self.release else self._json(404, {})
+        self._reply(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        m = re.match(r".*/releases/(\d+)/assets\?name=(.+)$", self.path)
+        if m:
+            type(self).assets[m.group(2)] = (self.next_id, body)
+            type(self).next_id += 1
+            return self._json(201, {})
+        type(self).release = {"id": 7, "tag_name": json.loads(body)["tag_name"]}
+        self._json(201, self._listing())
+
+    def do_DELETE(self):
+        asset_id = int(self.path.rsplit("/", 1)[1])
+        type(self).assets = {n: v for n, v in self.assets.items() if v[0] != asset_id}
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def release(monkeypatch):
+    _FakeRelease.release, _FakeRelease.assets = None, {}
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _FakeRelease)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_address[1]}"
+    monkeypatch.setattr(artifacts, "API_URL", url)
+    monkeypatch.setattr(artifacts, "UPLOAD_URL", url)
+    monkeypatch.setattr(artifacts, "DOWNLOAD_URL", url + "/download")
+    yield _FakeRelease
+    srv.shutdown()
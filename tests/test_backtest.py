@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""回測結果的發佈 / 同步 (本機假 GitHub Release) 與沒有結果時的退回記錄"""
+import json
+import os
+
+import backtest
+import metrics
+
+
+def _use_dir(monkeypatch, path):
+    monkeypatch.setenv("GITHUB_TOKEN", "t")
+    monkeypatch.setattr(backtest, "BACKTEST_DIR", str(path))
+    monkeypatch.setattr(backtest, "STATS_PATH", os.path.join(str(path), "stats.json"))
+    monkeypatch.setattr(backtest, "_last_sync", None)
+    monkeypatch.setattr(backtest, "_cache", {"mtime": None, "stats": None})
+
+
+def _write(built_at, win=0.55):
+    entry = {"n": 500, "returns": {str(backtest.WIN_HORIZON): {"win": win, "mean": 0.01}},
+             "targets": {"atr3": {"hit": 0.4, "days_median": 12, "days_q75": 20}}}
+    os.makedirs(backtest.BACKTEST_DIR, exist_ok=True)
+    with open(backtest.STATS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"built_at": built_at}, "signals": {"all": entry}}, f)
+
+
+def test_sync_takes_newer_stats_only(tmp_path, monkeypatch, release):
+    _use_dir(monkeypatch, tmp_path / "ci")
+    _write("2026-10-11T04:00:00", win=0.55)
+    assert backtest.publish()
+
+    _use_dir(monkeypatch, tmp_path / "bot")
+    assert backtest.stats_for([]) is None
+    assert backtest.sync()
+    assert backtest.stats_for([])["win"] == 55
+    assert backtest.target_odds("atr3") == (40, 20)
+
+    _use_dir(monkeypatch, tmp_path / "bot")
+    _write("2026-10-12T04:00:00", win=0.60)             # 本機跑過更新的回測：不被舊檔蓋掉
+    assert not backtest.sync()
+    assert backtest.stats_for([])["win"] == 60
+
+
+def test_fallback_is_logged(tmp_path, monkeypatch):
+    _use_dir(monkeypatch, tmp_path / "none")
+    key = metrics._key("miniko_backtest_fallback_total", {"report": "test", "reason": "no_stats"})
+    before = metrics._counters.get(key, 0)
+    backtest.fallback("test")
+    assert metrics._counters.get(key, 0) == before + 1
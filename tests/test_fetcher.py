@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""限速：每一次 Yahoo HTTP 請求都要取號 (.TW / .TWO 都試、批次下載每檔一個請求)"""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import fetcher
+import market_data
+import universe
+
+
+class _Counter:
+    def __init__(self):
+        self.n = 0
+
+    def wait(self, n=1):
+        self.n += n
+
+
+class _Ticker:
+    """只有 .TWO 有資料的假 yf.Ticker"""
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.info = {"symbol": symbol}
+
+    def history(self, **kwargs):
+        if self.symbol.endswith(".TWO"): return pd.DataFrame({'Close': [1.0]})
+        return pd.DataFrame()
+
+
+@pytest.fixture
+def yahoo(tmp_path, monkeypatch):
+    counter = _Counter()
+    monkeypatch.setattr(fetcher, "limiter_for", lambda host: counter)
+    monkeypatch.setattr(market_data.yf, "Ticker", _Ticker)
+    monkeypatch.setattr(market_data.yf, "download", lambda tickers, **kw: pd.DataFrame())
+    monkeypatch.setattr(universe, "INDEX_PATH", os.path.join(str(tmp_path), "exchange_index.json"))
+    monkeypatch.setattr(universe, "_index", None)
+    return counter
+
+
+def test_every_request_is_counted(yahoo):
+    provider = market_data.YFinanceProvider()
+    df, suffix = universe.resolve_fetch("9999", lambda s: provider.history(s, period="1y"))
+    assert suffix == ".TWO" and yahoo.n == 2            # 未知代號：.TW 與 .TWO 各一個請求
+    provider.info("2330.TW")
+    provider.download(["2330.TW", "2317.TW", "8299.TWO"], period="5d")
+    assert yahoo.n == 2 + 1 + 3
+
+
+def test_retry_does_not_take_extra_slots(yahoo):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 2: raise IOError("boom")
+        return "ok"
+
+    assert fetcher.call_with_retry(flaky, base_delay=0) == "ok"
+    assert yahoo.n == 0                                 # 限速只在 Provider 實際發請求時
+
+
+def test_batch_reserves_n_slots():
+    limiter = fetcher.RateLimiter(100)
+    limiter.wait(5)
+    t0 = time.monotonic()
+    limiter.wait()
+    assert time.monotonic() - t0 >= 0.04
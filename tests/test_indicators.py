@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+KD 與 Parabolic SAR：JIT 逐檔版與多檔同步步進版 (_kd_lockstep / _sar_lockstep) 都要與舊版迴圈逐位元相同
+(舊版 cloud_bot.calc_indicators 的 KD、app.calculate_sar)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import legacy
+import synthetic
+import indicators
+
+STARTS = (0, 0, 1, 2, 3, 17, 60, 199, 200, 230)   # 各檔第一根有效 K 棒 (新股前段為 NaN)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return synthetic.make_frames(8, "1d", seed=7)
+
+
+def test_kd_matches_legacy(frames):
+    old = {code: legacy.calc_indicators(df.copy()) for code, df in frames.items()}
+    high, low, close = (pd.DataFrame({code: df[f] for code, df in frames.items()}) for f in ('High', 'Low', 'Close'))
+    rsv, k, d = indicators.calc_kd(high, low, close)
+    for code, df in frames.items():
+        _, k1, d1 = indicators.calc_kd(df['High'], df['Low'], df['Close'])
+        for got in (k1, k[code]):
+            np.testing.assert_array_equal(got.to_numpy(), old[code]['K'].to_numpy())
+        for got in (d1, d[code]):
+            np.testing.assert_array_equal(got.to_numpy(), old[code]['D'].to_numpy())
+    filled = rsv.fillna(50).to_numpy()
+    np.testing.assert_array_equal(indicators._kd_lockstep(filled, indicators.KD_SEED), k.to_numpy())
+
+
+@pytest.fixture(scope="module")
+def panel():
+    frames = synthetic.make_frames(len(STARTS) + 1, "1d", seed=5)
+    high = np.column_stack([df['High'].to_numpy() for df in frames.values()])
+    low = np.column_stack([df['Low'].to_numpy() for df in frames.values()])
+    for j, s in enumerate(STARTS):
+        high[:s, j] = low[:s, j] = np.nan
+    high[:, -1] = low[:, -1] = np.nan                # 整欄無資料
+    return high, low
+
+
+def _legacy(high, low):
+    out = np.full(high.shape, np.nan)
+    for j in range(high.shape[1]):
+        ok = ~np.isnan(high[:, j])
+        if ok.any():
+            s = ok.argmax()
+            out[s:, j] = legacy.calculate_sar(high[s:, j], low[s:, j])
+    return out
+
+
+def test_sar_jit_matches_legacy(panel):
+    high, low = panel
+    np.testing.assert_array_equal(indicators.calc_sar(high, low), _legacy(high, low))
+
+
+def test_sar_lockstep_matches_legacy(panel):
+    high, low = panel
+    np.testing.assert_array_equal(indicators._sar_lockstep(high, low, 0.02, 0.2), _legacy(high, low))
+
+
+def test_sar_single_column(panel):
+    high, low = panel
+    j = STARTS.index(17)
+    np.testing.assert_array_equal(indicators.calc_sar(high[:, j], low[:, j]), _legacy(high, low)[:, j])
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Telegram 發送佇列：切割與合併、對本機假 Telegram 伺服器 (benchmarks/fake_telegram.py) 實際發送"""
+import time
+
+import pytest
+
+import fake_telegram
+import notifier
+
+
+def _alert(code, body=400):
+    """cloud_bot.run_realtime 格式的警報 (內文有自己的 --------------------- 分隔線)"""
+    return (f"🚨 <b>Miniko 盤中訊號快報</b> 🚨\n\n<b>測試 ({code})</b> 觸發條件！\n"
+            f"💰 現價: 100.0 🔺 (+1.00%)\n📊 量能: 1234 張\n"
+            f"---------------------\n🔥 <b>主力權證大單</b>\n{'x' * body}\n"
+            f"---------------------\n<i>(觸發時間: 10:00)</i>")
+
+
+def test_split_keeps_each_alert_whole():
+    alerts = [_alert(1000 + i) for i in range(10)]
+    parts = notifier.split_message(notifier.coalesce(alerts))
+    assert len(parts) > 1
+    assert all(notifier._units(p) <= notifier.MAX_CHARS for p in parts)
+    for alert in alerts:
+        assert sum(alert in p for p in parts) == 1
+
+
+def test_split_only_on_whole_separator_lines():
+    text = "\n".join([f"line {i} " + "y" * 300 for i in range(20)])
+    text = text.replace("line 10", "x" + notifier.SEPARATOR + "---")
+    parts = notifier.split_message(text, limit=1000)
+    assert "\n".join(parts) == text
+
+
+# --- 對本機假 Telegram 伺服器實際發送 ---
+@pytest.fixture
+def server():
+    srv = fake_telegram.FakeTelegram(rate=0).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _notifier(server, **kw):
+    kw = {"rate": 100, "base_delay": 0.01, "retries": 3, **kw}
+    return notifier.Notifier("TOKEN", "chat", api_base=server.url, **kw)
+
+
+def _texts(server):
+    return [m["text"] for m in server.messages]
+
+
+def test_long_batch_arrives_split_by_alert(server):
+    n = _notifier(server)
+    alerts = [_alert(2000 + i) for i in range(10)]
+    n.send_batch(alerts)
+    assert n.flush(10)
+    texts = _texts(server)
+    assert len(texts) > 1 and n.sent == len(texts)
+    for alert in alerts:
+        assert sum(alert in t for t in texts) == 1
+
+
+def test_batch_coalesces_into_one_message(server):
+    n = _notifier(server)
+    n.send_batch(["a", "", "b", "c"])
+    assert n.flush(10)
+    assert _texts(server) == [notifier.coalesce(["a", "b", "c"])]
+
+
+def test_429_waits_retry_after(server):
+    server.script = [429]
+    n = _notifier(server)
+    start = time.monotonic()
+    n.send("hello")
+    assert n.flush(10)
+    assert time.monotonic() - start >= fake_telegram.RETRY_AFTER
+    assert _texts(server) == ["hello"] and server.requests == 2 and n.dropped == 0
+
+
+def test_5xx_is_retried(server):
+    server.script = [502, 503]
+    n = _notifier(server)
+    n.send("hello")
+    assert n.flush(10)
+    assert _texts(server) == ["hello"] and server.requests == 3 and n.dropped == 0
+
+
+def test_5xx_gives_up_after_retries(server):
+    server.script = [502] * 4
+    n = _notifier(server, retries=3)
+    n.send("lost")
+    n.send("next")
+    assert n.flush(10)
+    assert _texts(server) == ["next"] and n.dropped == 1
+
+
+def test_4xx_is_dropped_without_retry(server):
+    server.script = [400]
+    n = _notifier(server)
+    n.send("bad")
+    n.send("good")
+    assert n.flush(10)
+    assert _texts(server) == ["good"] and server.requests == 2 and n.dropped == 1
+
+
+def test_on_done_reports_delivery(server):
+    server.script = [502] * 4
+    n = _notifier(server, retries=3)
+    results = []
+    n.send("lost", on_done=results.append)
+    n.send_batch([_alert(1000 + i) for i in range(10)], on_done=results.append)
+    assert n.flush(10)
+    assert results == [False, True]
+
+
+def test_on_done_false_if_any_part_fails(server):
+    n = _notifier(server)
+    results = []
+    server.script = [200, 400]
+    n.send_batch([_alert(1000 + i) for i in range(10)], on_done=results.append)
+    assert n.flush(10)
+    assert results == [False]
+
+
+def test_report_marked_done_only_after_delivery(server, monkeypatch):
+    import cloud_bot
+    import state
+    from datetime import datetime
+    n = _notifier(server, retries=1)
+    monkeypatch.setattr(notifier, "get_notifier", lambda token, chat: n)
+    store, slot = state.StateStore(":memory:"), datetime(2026, 1, 5, 18, 40)
+
+    server.script = [502] * 2
+    cloud_bot._once(store, "startup", slot, cloud_bot.send_telegram, "hello")
+    assert n.flush(10) and not store.is_done("startup", slot)
+
+    cloud_bot._once(store, "startup", slot, cloud_bot.send_telegram, "hello")
+    assert n.flush(10) and store.is_done("startup", slot)
+    assert _texts(server) == ["hello"]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""6 大訊號：新版 (規則語言 / 串流 / 全歷史寬表) 與舊版 cloud_bot.check_conditions 逐一比對"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import legacy
+import synthetic
+import cloud_bot
+import indicators
+import signal_rules
+import streaming
+import waves
+
+CUTS = (0, 1, 3, 7, 17, 40)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return synthetic.make_frames(120, "1d", seed=11)
+
+
+def _streak_edge():
+    """九根強勢 K 棒，前面是一根收黑、但收盤仍高於前一根的 K 棒 (位於 10 根視窗的第一根)"""
+    df = synthetic.make_frames(1, "1d", seed=3)["1000.TWO"].copy()
+    close = df['Close'].to_numpy().copy()
+    open_ = df['Open'].to_numpy().copy()
+    base = close[-12]
+    close[-11], open_[-11] = base, base
+    close[-10], open_[-10] = base * 1.01, base * 1.03           # 收黑，但高於前一根收盤
+    for i in range(-9, 0):
+        close[i] = close[i - 1] * 1.01
+        open_[i] = close[i] * 0.995                              # 收紅
+    df['Close'], df['Open'] = close, open_
+    df['High'] = np.maximum(df[['Open', 'Close']].max(axis=1), df['High'])
+    df['Low'] = np.minimum(df[['Open', 'Close']].min(axis=1), df['Low'])
+    return df
+
+
+def _legacy(df):
+    return legacy.check_conditions(df, "", "")
+
+
+def test_streak_window_edge():
+    df = cloud_bot.calc_indicators(_streak_edge())
+    expected = _legacy(df)
+    assert "🛡️ <b>主力連買(9天)</b>" in expected
+    assert cloud_bot.check_conditions(df, "", "") == expected
+    assert signal_rules.SIGNALS.last(df, signal_rules.THRESHOLDS)['consecutive'] == 9
+
+
+def test_check_conditions_matches_legacy(frames):
+    for df in frames.values():
+        df = cloud_bot.calc_indicators(df.copy())
+        for cut in CUTS:
+            sub = df.iloc[:len(df) - cut]
+            assert cloud_bot.check_conditions(sub, "", "") == _legacy(sub)
+
+
+def test_streaming_matches_legacy(frames):
+    for df in list(frames.values())[:40] + [_streak_edge()]:
+        stream = streaming.StreamingIndicators.from_history(df)
+        assert stream.signals() == _legacy(cloud_bot.calc_indicators(df.copy()))
+
+
+def test_streaming_every_bar_matches_legacy(frames):
+    """逐根餵入 (同一天先來一筆盤中價再覆蓋成收盤價)，每一天的訊號都與舊版相同"""
+    for df in list(frames.values())[:4] + [_streak_edge()]:
+        full = cloud_bot.calc_indicators(df.copy())
+        stream = streaming.StreamingIndicators()
+        for i, (ts, row) in enumerate(zip(df.index, df[['Open', 'High', 'Low', 'Close', 'Volume']].values)):
+            o, h, l, c, v = row
+            stream.update(ts, o, h * 1.05, l, h * 1.05, v / 2)
+            stream.update(ts, o, h, l, c, v)
+            if i >= len(df) - 40:
+                assert stream.signals() == _legacy(full.iloc[:i + 1]), (ts, i)
+
+
+@pytest.mark.parametrize("rules", [signal_rules.SIGNALS, signal_rules.SOP, waves.WAVE_RULES])
+def test_rule_stream_matches_last(frames, rules):
+    df = cloud_bot.calc_indicators(list(frames.values())[0].copy())
+    df['SAR'] = indicators.calc_sar(df['High'], df['Low'])
+    stream = rules.stream(signal_rules.THRESHOLDS)
+    for i, row in enumerate(df.to_dict('records')):
+        expected = rules.last(df.iloc[:i + 1], signal_rules.THRESHOLDS)
+        got = stream.evaluate(row)
+        assert got.keys() == expected.keys()
+        for name in expected:
+            assert np.isclose(got[name], expected[name], equal_nan=True, rtol=0, atol=0), (i, name)
+        stream.commit(row)
+
+
+def test_panel_matches_legacy(frames):
+    """evaluate_panel 每個日期的訊號 = 截到該日的舊版判斷"""
+    edge = _streak_edge()
+    edge.columns = pd.MultiIndex.from_product([["9999.TW"], edge.columns])
+    bulk = pd.concat([synthetic.make_bulk(dict(list(frames.items())[:30])), edge], axis=1)
+    panel = indicators.to_panel(bulk)
+    close = panel['Close']
+    ind = {k: pd.DataFrame(v, index=close.index, columns=close.columns)
+           for k, v in _panel_indicators(panel).items()}
+    masks = signal_rules.evaluate_panel(close, panel['Open'], panel['Volume'], ind)
+    for j, code in enumerate(close.columns):
+        df = cloud_bot.calc_indicators(bulk[code].copy())
+        for cut in CUTS:
+            row = len(df) - 1 - cut
+            expected = {signal_rules.signal_key(s) for s in _legacy(df.iloc[:row + 1])}
+            got = {key for key, mask in masks.items() if mask[row, j]}
+            assert got == expected, (code, cut)
+
+
+def _panel_indicators(panel):
+    """與 cloud_bot.calc_indicators 相同定義的寬表指標"""
+    close = panel['Close']
+    out = {'SMA22': close.rolling(22).mean(), 'MA20': close.rolling(20).mean(),
+           'Vol_MA5': panel['Volume'].rolling(5).mean()}
+    out['RSV'], out['K'], out['D'] = indicators.calc_kd(panel['High'], panel['Low'], close)
+    dif = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    out['MACD_Hist'] = dif - dif.ewm(span=9, adjust=False).mean()
+    return out
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""盤後快照的發佈 / 同步：雲端機器人 publish → (本機假 GitHub Release) → 頁面主機 sync"""
+import os
+from datetime import datetime
+
+import pandas as pd
+
+import artifacts
+import snapshot
+
+EVENING = datetime(2026, 10, 16, 20, 0)   # 週五盤後：最近收盤日 2026-10-16
+
+
+def _use_dir(monkeypatch, path):
+    monkeypatch.setenv("GITHUB_TOKEN", "t")
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(path))
+    for name in ("SUMMARY_PATH", "BARS_PATH", "META_PATH"):
+        monkeypatch.setattr(snapshot, name, os.path.join(str(path), os.path.basename(getattr(snapshot, name))))
+    monkeypatch.setattr(snapshot, "_last_sync", None)
+
+
+def _build(trade_date, n):
+    summary = pd.DataFrame({'code': [f"{1000 + i}.TW" for i in range(n)], 'date': trade_date})
+    bars = pd.DataFrame({'code': summary['code'], 'Date': pd.Timestamp(trade_date), 'Close': 1.0})
+    snapshot._save(summary, bars, {"built_at": f"{trade_date}T18:55:00", "trade_date": trade_date, "symbols": n})
+
+
+def test_publish_then_sync(tmp_path, monkeypatch, release):
+    _use_dir(monkeypatch, tmp_path / "bot")
+    _build("2026-10-15", 2)
+    assert snapshot.publish()
+    _build("2026-10-16", 3)
+    assert snapshot.publish()                 # 同名附件覆蓋
+    assert sorted(release.assets) == ["bars.parquet", "meta.json", "summary.parquet"]
+
+    _use_dir(monkeypatch, tmp_path / "page")
+    assert not snapshot.is_fresh(now=EVENING)
+    assert snapshot.sync(now=EVENING)
+    assert snapshot.is_fresh(now=EVENING)
+    assert snapshot.meta()["symbols"] == 3 and len(snapshot.load_summary()) == 3
+    assert snapshot.load_bars("1002.TW") is not None
+    assert not snapshot.sync(now=EVENING)             # 已是最新，不再下載
+
+
+def test_sync_skips_mixed_upload(tmp_path, monkeypatch, release):
+    _use_dir(monkeypatch, tmp_path / "bot")
+    _build("2026-10-15", 2)
+    assert snapshot.publish()
+    _build("2026-10-16", 3)
+    artifacts.publish([snapshot.META_PATH], token="t")   # 大檔還沒上傳完，meta 已是新的
+
+    _use_dir(monkeypatch, tmp_path / "page")
+    assert not snapshot.sync(now=EVENING)
+    assert snapshot.meta() is None and not os.listdir(tmp_path / "page")
+
+
+def test_sync_not_in_session(tmp_path, monkeypatch, release):
+    _use_dir(monkeypatch, tmp_path / "page")
+    assert not snapshot.sync(now=datetime(2026, 10, 16, 10, 0))
+    assert release.release is None
+
+
+def test_publish_without_token(tmp_path, monkeypatch, release):
+    _use_dir(monkeypatch, tmp_path / "bot")
+    monkeypatch.delenv("GITHUB_TOKEN")
+    _build("2026-10-16", 1)
+    assert not snapshot.publish()
+    assert release.release is None
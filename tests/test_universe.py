@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""全市場清單重抓：部分 ISIN 來源失敗時沿用舊資料，不寫出假的下市 / 新上市異動"""
+import os
+
+import pytest
+
+import universe
+
+LISTED = {"2330": "台積電", "2317": "鴻海"}
+OTC = {"8299": "群聯", "6488": "環球晶"}
+
+
+@pytest.fixture
+def isin(tmp_path, monkeypatch):
+    monkeypatch.setattr(universe, "DATA_DIR", str(tmp_path))
+    for name in ("INDEX_PATH", "TABLE_PATH", "DIFF_PATH"):
+        monkeypatch.setattr(universe, name, os.path.join(str(tmp_path), os.path.basename(getattr(universe, name))))
+    sources = {"2": dict(LISTED), "4": dict(OTC)}
+    monkeypatch.setattr(universe, "scrape_isin", lambda mode: dict(sources[mode]))
+    return sources
+
+
+def test_partial_failure_keeps_old_rows(isin):
+    assert len(universe.refresh_table()) == 4
+    _, refreshed_at = universe.load_table()
+
+    isin["4"].clear()                                 # 上櫃逾時
+    isin["2"]["1101"] = "台泥"
+    table = universe.refresh_table()
+    assert table["8299"] == ("群聯", ".TWO") and table["1101"] == ("台泥", ".TW")
+    assert universe.load_table() == (table, refreshed_at)   # 不算完整重抓，過期後會再試
+    assert universe.load_diffs() == [{**universe.load_diffs()[0], "added": {"1101": "台泥"},
+                                      "removed": {}, "renamed": {}, "moved": {}}]
+
+    isin["4"].update(OTC)
+    universe.refresh_table()
+    assert len(universe.load_diffs()) == 1              # 恢復後沒有「新上市」的假異動
+    assert universe.load_table()[1] > refreshed_at
+
+
+def test_all_sources_failed(isin):
+    isin["2"].clear()
+    isin["4"].clear()
+    assert universe.refresh_table() is None
+    assert universe.load_table() == ({}, 0)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""波浪分類：waves.classify 的每一根 K 棒 = 截到該根的舊版 get_micro_wave"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import legacy
+import synthetic
+import waves
+
+
+def _per_bar(df):
+    return [legacy.get_micro_wave(df.iloc[:i + 1]) for i in range(len(df))]
+
+
+def _flat_after_fall():
+    """60 根下跌後橫盤 20 根 (平盤 / 停牌)：Close == MA20 < MA60"""
+    close = np.concatenate([np.linspace(100, 70, 60), np.full(20, 70.0)])
+    df = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1000.0},
+                      index=pd.bdate_range("2026-01-01", periods=len(close)))
+    return legacy.calc_indicators(df)
+
+
+def test_flat_bars_are_b_wave():
+    df = _flat_after_fall()
+    assert df['Close'].iloc[-1] == df['MA20'].iloc[-1] < df['MA60'].iloc[-1]
+    assert legacy.get_micro_wave(df) == "B-a (跌深反彈)"
+    assert waves.micro_wave(df) == "B-a (跌深反彈)"
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_classify_matches_legacy(seed):
+    frames = list(synthetic.make_frames(3, "1d", seed=seed).values())
+    for df in [legacy.calc_indicators(f.copy()) for f in frames] + [_flat_after_fall()]:
+        assert list(waves.labels(waves.classify(df))) == _per_bar(df)
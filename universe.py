@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+股票池與交易所對照 (上市 .TW / 上櫃 .TWO)
+- 全市場清單：證交所 ISIN 上市 / 上櫃同時抓，合併成「代號 / 名稱 / 交易所」表存在本地，
+  每次重抓與上一版比對，新上市 / 下市 / 更名 / 轉上市櫃寫進異動紀錄 (diffs.jsonl)；
+  表還新鮮就直接讀檔，頁面 / 盤後快照 / 回測 / 機器人共用同一份，連名稱查詢也不必再爬
+- 熱門股：HiStock / Yahoo 上市 / Yahoo 上櫃三個來源同時抓 (最慢一個的時間，而不是三個相加)
+- 網頁表格優先用 lxml 只解析目標那張表，沒裝 lxml 才退回 pd.read_html
+並把「代號 → 交易所」存成本地索引，之後每個抓取路徑都直接用正確後綴，上櫃股不再先白抓一次 .TW。
+"""
+import io
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+import pandas as pd
+
+try:
+    import lxml.html
+except ImportError:  # 沒裝 lxml 就走 pd.read_html
+    lxml = None
+
+import metrics
+
+# ================= ⚙️ 參數設定區 =================
+DATA_DIR = os.environ.get(
+    "MINIKO_UNIVERSE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".universe")
+)
+INDEX_PATH = os.path.join(DATA_DIR, "exchange_index.json")
+TABLE_PATH = os.path.join(DATA_DIR, "stocks.json")    # 全市場 代號 / 名稱 / 交易所
+DIFF_PATH = os.path.join(DATA_DIR, "diffs.jsonl")     # 每次重抓的異動
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+HISTOCK_URL = "https://histock.tw/stock/rank.aspx?p=all"
+YAHOO_RANK_URL = "https://tw.stock.yahoo.com/rank/volume?exchange={exchange}"
+# 證交所 ISIN 公開資料：strMode=2 上市、4 上櫃 (全部掛牌證券，含交易所資訊)
+ISIN_URL = "https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}"
+ISIN_MODES = {"2": ".TW", "4": ".TWO"}
+COMMON_STOCK_CFI = "ESVUFR"   # 普通股
+TABLE_TTL = 24 * 3600          # 全市場清單多久重抓一次 (秒)
+NAMES_TTL = 24 * 3600          # 代號 → 名稱對照表重抓間隔 (秒)
+NAMES_RETRY = 300              # 對照表抓不到時多久後再試
+SCRAPE_WORKERS = 5             # 同時抓的來源數
+
+# Yahoo 排行榜的 exchange 參數 → yfinance 後綴
+YAHOO_EXCHANGES = {"TAI": ".TW", "TWO": ".TWO"}
+SUFFIXES = (".TW", ".TWO")
+
+# 備援名單
+BACKUP_CODES = [
+    "2330", "2317", "2324", "2603", "2609", "3231", "2357", "3037", "2382", "2303",
+    "2454", "2379", "2356", "2615", "3481", "2409", "2376", "2301", "3035", "3017",
+    "1513", "1519", "1605", "1503", "2515", "2501", "2881", "2882", "2891", "5880"
+]
+# ===============================================
+
+_index = None
+_lock = threading.Lock()
+_names = {}
+_names_expire = 0.0
+_names_lock = threading.Lock()
+_table_lock = threading.Lock()
+_NON_DIGIT = re.compile(r"\D+")
+
+
+# --- 交易所索引 ---
+def _load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(INDEX_PATH, encoding="utf-8") as f:
+                _index = json.load(f)
+        except Exception:
+            _index = {}
+    return _index
+
+
+def _save_index():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp = INDEX_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_index, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp, INDEX_PATH)
+
+
+def clean_code(symbol):
+    """去掉 .TW / .TWO 後綴"""
+    return symbol.replace('.TWO', '').replace('.TW', '')
+
+
+def known_suffix(code):
+    """索引中記錄的後綴，未知回傳 None"""
+    with _lock:
+        return _load_index().get(clean_code(code))
+
+
+def with_suffix(code):
+    """加上正確後綴 (未知的預設上市 .TW)"""
+    return clean_code(code) + (known_suffix(code) or ".TW")
+
+
+def suffix_candidates(code):
+    """要嘗試的後綴順序：已知交易所優先，其次另一個"""
+    first = known_suffix(code)
+    if first is None: return list(SUFFIXES)
+    return [first] + [s for s in SUFFIXES if s != first]
+
+
+def record_hit(code, suffix):
+    """抓到資料 → 記住交易所"""
+    code = clean_code(code)
+    with _lock:
+        index = _load_index()
+        if index.get(code) != suffix:
+            index[code] = suffix
+            _save_index()
+
+
+def record_miss(code, suffix):
+    """用索引中的後綴抓不到 → 作廢該筆 (可能轉上市/下櫃)"""
+    code = clean_code(code)
+    with _lock:
+        index = _load_index()
+        if index.get(code) == suffix:
+            del index[code]
+            _save_index()
+
+
+def update_index(mapping):
+    """批次寫入 {代號: 後綴} (來自排行榜爬蟲)"""
+    with _lock:
+        index = _load_index()
+        changed = {c: s for c, s in mapping.items() if index.get(c) != s}
+        if changed:
+            index.update(changed)
+            _save_index()
+
+
+def resolve_fetch(code, fetch):
+    """
+    依索引的交易所順序呼叫 fetch(帶後綴代號)，回傳 (df, 後綴)；都抓不到回傳 (None, None)
+    已知交易所的股票只會發一次請求
+    """
+    code = clean_code(code)
+    for attempt, suffix in enumerate(suffix_candidates(code)):
+        df = fetch(code + suffix)
+        if df is not None and not df.empty:
+            if attempt:
+                # 第一順位的後綴抓不到，改用另一個交易所才成功 (多半是 .TWO 備援)
+                metrics.inc("miniko_suffix_fallback_total", suffix=suffix)
+                metrics.event("suffix_fallback", symbol=code, suffix=suffix)
+            record_hit(code, suffix)
+            return df, suffix
+        record_miss(code, suffix)
+    metrics.inc("miniko_unresolved_symbols_total")
+    return None, None
+
+
+# --- 代號 → 名稱 (常駐記憶體) ---
+def remember_names(mapping):
+    """把爬蟲順便拿到的 {代號: 名稱} 併入對照表"""
+    with _names_lock:
+        _names.update(mapping)
+
+
+def name_of(code):
+    """
+    代號 → 中文名稱；查不到回傳代號本身
+    先查記憶體與本地全市場清單，都沒有才下載 HiStock 排行表 (每 NAMES_TTL 最多一次)
+    """
+    global _names_expire
+    code = clean_code(code)
+    if not _names:
+        remember_names({c: name for c, (name, _) in load_table()[0].items()})
+    if code not in _names and time.monotonic() >= _names_expire:
+        with _names_lock:
+            if time.monotonic() >= _names_expire:
+                fresh = scrape_histock()
+                _names.update(fresh)
+                _names_expire = time.monotonic() + (NAMES_TTL if fresh else NAMES_RETRY)
+    return _names.get(code, code)
+
+
+# --- 網頁表格解析 ---
+def _get(url, timeout=5, encoding=None):
+    r = requests.get(url, headers=HEADERS, timeout=timeout)
+    if encoding: r.encoding = encoding
+    return r.text
+
+
+def _cells(row):
+    return [" ".join(c.text_content().split()) for c in row.xpath("./th|./td")]
+
+
+def read_table(html, keys):
+    """
+    第一張表頭含 keys 任一關鍵字的 <table>，回傳 (表頭, 資料列)；找不到回傳 (None, [])
+    有 lxml 時只走訪 <tr>/<td> 文字 (不建 DataFrame)，否則退回 pd.read_html
+    """
+    if lxml is not None:
+        for table in lxml.html.fromstring(html).iter("table"):
+            rows = table.xpath("./tr|./thead/tr|./tbody/tr")
+            if not rows: continue
+            header = _cells(rows[0])
+            if any(k in h for h in header for k in keys):
+                return header, [_cells(r) for r in rows[1:]]
+        return None, []
+    for df in pd.read_html(io.StringIO(html), header=0):
+        header = [str(c) for c in df.columns]
+        if any(k in h for h in header for k in keys):
+            return header, df.fillna("").astype(str).values.tolist()
+    return None, []
+
+
+def _column(header, keys):
+    return next(i for i, h in enumerate(header) if any(k in h for k in keys))
+
+
+def _digits(text):
+    return _NON_DIGIT.sub("", text)
+
+
+# --- 排行榜爬蟲 ---
+def scrape_histock():
+    """HiStock (嗨投資) 全部排行：回傳 {代號: 名稱} (不含交易所資訊)"""
+    stocks = {}
+    try:
+        header, rows = read_table(_get(HISTOCK_URL), ('代號',))
+        col_code = _column(header, ('代號',))
+        col_name = _column(header, ('股票', '名稱'))
+        for row in rows:
+            if len(row) <= max(col_code, col_name): continue
+            code = _digits(row[col_code])
+            if len(code) == 4: stocks[code] = row[col_name]
+    except Exception as e:
+        metrics.failure("scrape_histock", e)
+    return stocks
+
+
+def scrape_yahoo_rank(exchange):
+    """Yahoo 成交量排行 (exchange = TAI 上市 / TWO 上櫃)：回傳 {代號: 名稱}"""
+    stocks = {}
+    try:
+        header, rows = read_table(_get(YAHOO_RANK_URL.format(exchange=exchange)), ('股號', '名稱'))
+        if header is None: return stocks
+        col = _column(header, ('股號', '名稱'))
+        for row in rows:
+            if len(row) <= col: continue
+            code = _digits(row[col])
+            if len(code) == 4:
+                stocks[code] = row[col].replace(code, '').strip() or code
+    except Exception as e:
+        metrics.failure("scrape_yahoo_rank", e, symbol=exchange)
+    return stocks
+
+
+def scrape_isin(mode):
+    """證交所 ISIN 清單 (mode = 2 上市 / 4 上櫃)：只取普通股，回傳 {代號: 名稱}"""
+    stocks = {}
+    try:
+        header, rows = read_table(_get(ISIN_URL.format(mode=mode), timeout=20, encoding="cp950"), ('代號',))
+        col_id = _column(header, ('代號',))
+        col_cfi = _column(header, ('CFI',))
+        for row in rows:
+            # 「股票」「上市認購(售)權證」等分類列只有一格
+            if len(row) <= max(col_id, col_cfi) or row[col_cfi] != COMMON_STOCK_CFI: continue
+            parts = row[col_id].replace('\u3000', ' ').split(None, 1)
+            if len(parts) == 2 and len(parts[0]) == 4 and parts[0].isdigit():
+                stocks[parts[0]] = parts[1].strip()
+    except Exception as e:
+        metrics.failure("scrape_isin", e, symbol=mode)
+    return stocks
+
+
+def _scrape_all(jobs):
+    """同時執行多個爬蟲 {名稱: (函數, 參數...)}，回傳 {名稱: 結果}"""
+    with metrics.stage("scrape", sources=len(jobs)):
+        with ThreadPoolExecutor(max_workers=min(SCRAPE_WORKERS, len(jobs))) as pool:
+            futures = {name: pool.submit(fn, *args) for name, (fn, *args) in jobs.items()}
+            return {name: f.result() for name, f in futures.items()}
+
+
+# --- 全市場清單 (持久化 + 異動紀錄) ---
+def load_table():
+    """本地全市場清單：({代號: (名稱, 後綴)}, 完整重抓的時間戳)；沒有檔案回傳 ({}, 0)"""
+    try:
+        with open(TABLE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        return {c: tuple(v) for c, v in data["stocks"].items()}, data.get("refreshed_at", 0)
+    except Exception:
+        return {}, 0
+
+
+def diff_tables(old, new):
+    """兩版清單的差異：新上市 / 下市 / 更名 / 轉換交易所"""
+    both = old.keys() & new.keys()
+    return {
+        "added": {c: new[c][0] for c in sorted(new.keys() - old.keys())},
+        "removed": {c: old[c][0] for c in sorted(old.keys() - new.keys())},
+        "renamed": {c: [old[c][0], new[c][0]] for c in sorted(both) if old[c][0] != new[c][0]},
+        "moved": {c: [old[c][1], new[c][1]] for c in sorted(both) if old[c][1] != new[c][1]},
+    }
+
+
+def save_table(table, source="isin", complete=True):
+    """
+    寫入新版清單並把與舊版的差異附加到 diffs.jsonl，回傳差異
+    complete=False (部分來源沿用舊資料) 時保留舊的完整重抓時間，過期後會再重抓
+    """
+    with _table_lock:
+        old, refreshed_at = load_table()
+        diff = diff_tables(old, table)
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = TABLE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"refreshed_at": time.time() if complete else refreshed_at, "source": source,
+                       "stocks": {c: list(v) for c, v in sorted(table.items())}}, f, ensure_ascii=False)
+        os.replace(tmp, TABLE_PATH)
+        if old and any(diff.values()):
+            with open(DIFF_PATH, "a", encoding="utf-8") as f:
+                record = {"at": datetime.now().isoformat(timespec="seconds"), "source": source, **diff}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return diff
+
+
+def load_diffs(limit=None):
+    """最近的異動紀錄 (新的在後)"""
+    try:
+        with open(DIFF_PATH, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    return [json.loads(line) for line in (lines[-limit:] if limit else lines)]
+
+
+def refresh_table():
+    """
+    重抓證交所 ISIN 上市 + 上櫃 (同時抓)，合併後存檔；全部抓不到回傳 None
+    只有部分來源失敗 (如上櫃逾時) 時，該交易所沿用舊清單的資料列：不會被當成整批下市寫進異動紀錄
+    """
+    results = _scrape_all({suffix: (scrape_isin, mode) for mode, suffix in ISIN_MODES.items()})
+    failed = {suffix for suffix, stocks in results.items() if not stocks}
+    if len(failed) == len(results): return None
+    table = {code: (name, suffix) for suffix, stocks in results.items() for code, name in stocks.items()}
+    if failed:
+        old, _ = load_table()
+        table.update({c: v for c, v in old.items() if v[1] in failed and c not in table})
+        metrics.event("universe_partial_refresh", failed=sorted(failed), kept=len(table))
+    diff = save_table(table, complete=not failed)
+    _publish(table)
+    metrics.event("universe_refresh", symbols=len(table), **{k: len(v) for k, v in diff.items()})
+    return table
+
+
+def _publish(table):
+    """清單的交易所 / 名稱同步到索引與名稱對照"""
+    update_index({c: suffix for c, (_, suffix) in table.items()})
+    remember_names({c: name for c, (name, _) in table.items()})
+
+
+def get_table(max_age=TABLE_TTL):
+    """全市場清單：本地檔還新鮮就直接用，否則重抓 (重抓失敗退回舊檔)"""
+    table, refreshed_at = load_table()
+    if table and time.time() - refreshed_at <= max_age:
+        _publish(table)
+        return table
+    fresh = refresh_table()
+    if fresh: return fresh
+    if table: _publish(table)
+    return table
+
+
+def fetch_full_universe(max_age=TABLE_TTL):
+    """
+    全市場普通股 (上市 + 上櫃，約 1,800 檔)，回傳 [{'code': '2330.TW', 'name': ...}]
+    交易所資訊寫入本地索引；清單完全抓不到時退回熱門股聚合清單
+    """
+    table = get_table(max_age)
+    if not table: return fetch_market_stocks()
+    return [{'code': code + suffix, 'name': name} for code, (name, suffix) in sorted(table.items())]
+
+
+def fetch_market_stocks():
+    """
+    全網聚合 (HiStock + Yahoo 上市/上櫃 + 備援名單，三個來源同時抓)，回傳 [{'code': '2330.TW', 'name': ...}]
+    Yahoo 排行榜的交易所資訊同時寫入本地索引
+    """
+    jobs = {"histock": (scrape_histock,)}
+    jobs.update({suffix: (scrape_yahoo_rank, exchange) for exchange, suffix in YAHOO_EXCHANGES.items()})
+    results = _scrape_all(jobs)
+
+    names = results.pop("histock")
+    exchange_map = {}
+    for suffix, stocks in results.items():
+        for code, name in stocks.items():
+            names[code] = name
+            exchange_map[code] = suffix
+    update_index(exchange_map)
+    remember_names(names)
+
+    for code in BACKUP_CODES:
+        if code not in names: names[code] = code
+
+    return [{'code': with_suffix(code), 'name': name} for code, name in names.items()]
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "refresh":
+        before = time.perf_counter()
+        table = refresh_table()
+        if table is None:
+            print("❌ 證交所清單抓取失敗")
+            sys.exit(1)
+        last = load_diffs(1)
+        print(f"✅ 全市場 {len(table)} 檔 ({time.perf_counter() - before:.1f} 秒)")
+        if last: print("📝 最近異動：" + "、".join(f"{k} {len(v)}" for k, v in last[-1].items() if isinstance(v, dict)))
+    else:
+        print("用法: python universe.py refresh")
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+艾略特微波浪識別 (日線 / 60分 / 30分共用)
+判斷規則寫在 WAVES (由上往下第一個成立的標籤，規則語言見 signal_dsl.py)。
+classify 對每一根 K 棒、每一檔股票一次 np.select 出整數波浪代碼 (WAVE_LABELS 的索引)：
+- 單檔 DataFrame 或 (日期 × 股票) 寬表都是同一個呼叫，回傳整段歷史 (history / panel_history)
+- 盤後快照存代碼 (summary 的 wave_d / wave_60 / wave_30、bars 的 Wave 欄)，頁面不必重算
+- 多週期共振 (日線 3 浪 + 60分 3 浪…) 只是代碼欄位的 np.isin (resonance)
+"""
+import numpy as np
+import pandas as pd
+
+import signal_dsl
+
+MIN_BARS = 15
+NOT_ENOUGH = "資料不足(新股)"
+NO_DATA = "N/A"
+
+# 均線缺值 (新股) 時以股價代替
+WAVE_TERMS = {
+    "ma20": "fill(MA20, Close)",
+    "ma60": "fill(MA60, Close)",
+    "bull": "Close >= ma60",
+    "above20": "Close > ma20",
+    "below20": "Close < ma20",   # 空頭才看：收盤剛好等於 MA20 (平盤 / 停牌) 算 B 浪，不是 C 浪
+    "macd_up": "MACD_Hist > 0 & MACD_Hist.rising()",
+}
+WAVES = [
+    ("3-5 (噴出末段)", "bull & above20 & macd_up & K > 80"),
+    ("3-3 (主升急漲)", "bull & above20 & macd_up"),
+    ("3-a (高檔震盪)", "bull & above20 & MACD_Hist > 0 & MACD_Hist.falling()"),
+    ("3-1 (初升/轉折)", "bull & above20"),
+    ("4-c (修正末端)", "bull & Close > ma60 & K < 20"),
+    ("4-a (初跌修正)", "bull & Close > ma60 & K.falling()"),
+    ("4-b (反彈逃命)", "bull & Close > ma60"),
+    ("", "bull"),
+    ("C-5 (趕底急殺)", "below20 & K < 20"),
+    ("C-3 (主跌段)", "below20"),
+    ("B-c (反彈高點)", "K > 80"),
+]
+DEFAULT_WAVE = "B-a (跌深反彈)"
+WAVE_RULES = signal_dsl.RuleSet({**WAVE_TERMS, **{f"wave{i}": rule for i, (_, rule) in enumerate(WAVES)}})
+
+# 波浪代碼 = WAVE_LABELS 的索引 (int8)
+WAVE_LABELS = tuple(label for label, _ in WAVES) + (DEFAULT_WAVE, NOT_ENOUGH, NO_DATA)
+DEFAULT_CODE = WAVE_LABELS.index(DEFAULT_WAVE)
+NOT_ENOUGH_CODE = WAVE_LABELS.index(NOT_ENOUGH)
+NO_DATA_CODE = WAVE_LABELS.index(NO_DATA)
+_LABELS = np.array(WAVE_LABELS, dtype=object)
+
+# 浪型 (標籤開頭)：3 = 主升、4 = 修正、C = 主跌、B = 反彈
+FAMILIES = {fam: np.array([i for i, label in enumerate(WAVE_LABELS) if label.startswith(f"{fam}-")], dtype=np.int8)
+            for fam in ("3", "4", "C", "B")}
+
+# 多週期共振 (summary 欄位 → 浪型)，盤後快照的全市場篩選用
+RESONANCE = {
+    "日線 3 浪 + 60分 3 浪 (共振噴出)": {"wave_d": "3", "wave_60": "3"},
+    "日線 3 浪 + 30分 3 浪": {"wave_d": "3", "wave_30": "3"},
+    "三週期皆 3 浪": {"wave_d": "3", "wave_60": "3", "wave_30": "3"},
+    "日線 4 浪 + 30分 3 浪 (修正轉強)": {"wave_d": "4", "wave_30": "3"},
+    "日線 C 浪 + 30分 3 浪 (跌深搶反彈)": {"wave_d": "C", "wave_30": "3"},
+}
+
+
+def classify(frames):
+    """
+    {欄位: 陣列 / DataFrame} (一維單檔或二維寬表，需 Close、MA20、MA60、K、MACD_Hist；缺的欄位視為缺值)
+    → 每根 K 棒的波浪代碼 (int8，與 Close 同形狀)；累計不到 MIN_BARS 根有效收盤的 K 棒為 NOT_ENOUGH_CODE
+    """
+    close = np.asarray(frames['Close'], dtype=float)
+    env = {c: np.asarray(frames[c], dtype=float) if c in frames else np.full(close.shape, np.nan)
+           for c in WAVE_RULES.columns}
+    hit = WAVE_RULES.evaluate(env)
+    codes = np.select([np.broadcast_to(hit[f"wave{i}"], close.shape) for i in range(len(WAVES))],
+                      np.arange(len(WAVES)), default=DEFAULT_CODE)
+    bars = np.cumsum(~np.isnan(close), axis=0)
+    return np.where(bars < MIN_BARS, NOT_ENOUGH_CODE, codes).astype(np.int8)
+
+
+def history(df):
+    """單檔 DataFrame 每根 K 棒的波浪代碼 (Series，索引同 df)"""
+    return pd.Series(classify(df), index=df.index, name='Wave')
+
+
+def panel_history(close, ind):
+    """寬表版：close / ind[...] 為 (日期 × 股票) DataFrame，回傳同形狀的代碼 DataFrame"""
+    return pd.DataFrame(classify({**ind, 'Close': close}), index=close.index, columns=close.columns)
+
+
+def label(code):
+    """代碼 → 標籤文字"""
+    return WAVE_LABELS[int(code)]
+
+
+def labels(codes):
+    """代碼陣列 / Series → 標籤文字 (保留 Series 索引)"""
+    out = _LABELS[np.asarray(codes, dtype=int)]
+    return pd.Series(out, index=codes.index) if isinstance(codes, pd.Series) else out
+
+
+def micro_wave(df, timeframe="日"):
+    if df is None or len(df) < MIN_BARS: return NOT_ENOUGH
+    return label(classify(df)[-1])
+
+
+def segments(codes):
+    """代碼序列 (Series) → 連續同一浪的區段 [(起始索引, 標籤, 根數)] (由舊到新)"""
+    values = np.asarray(codes)
+    if len(values) == 0: return []
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    lengths = np.diff(np.append(starts, len(values)))
+    return [(codes.index[s], label(values[s]), int(n)) for s, n in zip(starts, lengths)]
+
+
+def resonance(table, spec):
+    """table 的波浪代碼欄位同時落在指定浪型 (spec 如 {"wave_d": "3", "wave_60": "3"}) → 布林陣列"""
+    mask = np.ones(len(table), dtype=bool)
+    for col, fam in spec.items():
+        mask &= np.isin(table[col].to_numpy(), FAMILIES[fam])
+    return mask